@@ -0,0 +1,201 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""The muddler benchmark suite.
+
+Run from the root of the repository with `python -m benchmarks`.
+
+Usage: benchmarks [--scale <MIB>] [--repeat <N>] [--corpus <CORPUS_DIR>]
+                  [--save <BASELINE>] [--compare <BASELINE>]
+                  [--threshold <PERCENT>] [<BENCHMARK>...]
+       benchmarks --list
+       benchmarks (-h | --help)
+
+Options:
+    -h, --help
+        Print help message.
+    --list
+        List available benchmarks.
+    --scale <MIB>
+        Approximate size of each corpus case in MiB [default: 16].
+    --repeat <N>
+        Number of timed runs of each benchmark, after an untimed warm-up
+        run. The best run is reported [default: 3].
+    --corpus <CORPUS_DIR>
+        Directory in which the synthetic corpus is generated and kept between
+        runs. A temporary directory is used by default.
+    --save <BASELINE>
+        Save results to BASELINE (a JSON file).
+    --compare <BASELINE>
+        Compare results against a baseline saved with --save and exit with a
+        non-zero status if any benchmark regressed.
+    --threshold <PERCENT>
+        Allowed slowdown or peak memory growth before a benchmark is flagged
+        as a regression [default: 10].
+"""
+
+
+import json
+import platform
+from pathlib import Path
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+
+import docopt
+
+from benchmarks.child import BENCHMARKS
+from benchmarks.corpus import generate_case
+
+
+REPO_PATH = Path(__file__).resolve().parent.parent
+
+
+def ensure_case(corpus_path, case, scale):
+    # Generated cases are reused as long as they were generated with the same
+    # scale.
+    case_path = Path(corpus_path, '{}-{}'.format(case, scale))
+    done_path = Path(case_path, '.done')
+
+    if not done_path.exists():
+        print('Generating corpus case {}...'.format(case), file=sys.stderr)
+        generate_case(case, case_path, scale)
+        done_path.touch()
+
+    return case_path
+
+
+def run_in_child(name, case_path, work_path, repeat):
+    proc = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.child', name, str(case_path),
+         str(work_path), str(repeat)],
+        cwd=REPO_PATH, stdout=subprocess.PIPE, check=True)
+    return json.loads(proc.stdout)
+
+
+def compare_result(result, baseline_result, threshold):
+    # Returns a list of regressions of result relative to baseline_result.
+    regressions = []
+
+    speed = result.get('mb_per_s')
+    baseline_speed = baseline_result.get('mb_per_s')
+    if speed and baseline_speed and speed < baseline_speed * (1 - threshold):
+        regressions.append('throughput {:+.1f}%'.format(
+            (speed / baseline_speed - 1) * 100))
+
+    rss = result.get('peak_rss')
+    baseline_rss = baseline_result.get('peak_rss')
+    if rss and baseline_rss and rss > baseline_rss * (1 + threshold):
+        regressions.append('peak RSS {:+.1f}%'.format(
+            (rss / baseline_rss - 1) * 100))
+
+    return regressions
+
+
+def format_row(name, result, baseline_result=None):
+    row = '{:<28} {:>10.1f} MB/s {:>8.1f} MiB'.format(
+        name, result['mb_per_s'] or 0, (result['peak_rss'] or 0) / 2**20)
+
+    if baseline_result is not None and baseline_result.get('mb_per_s'):
+        row += '   ({:+.1f}% vs baseline)'.format(
+            (result['mb_per_s'] / baseline_result['mb_per_s'] - 1) * 100)
+
+    return row
+
+
+def run_benchmarks(names, corpus_path, scale, repeat):
+    results = {}
+
+    for name in names:
+        case, _ = BENCHMARKS[name]
+        case_path = ensure_case(corpus_path, case, scale)
+
+        with TemporaryDirectory() as work_path:
+            results[name] = run_in_child(name, case_path, work_path, repeat)
+
+    return results
+
+
+def main():
+    arguments = docopt.docopt(__doc__)
+
+    if arguments['--list']:
+        for name in BENCHMARKS:
+            print(name)
+        return
+
+    names = arguments['<BENCHMARK>'] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print('[Argument Error] Unknown benchmark {}.'.format(repr(name)),
+                  file=sys.stderr)
+            sys.exit(1)
+
+    scale = int(arguments['--scale'])
+    repeat = int(arguments['--repeat'])
+    threshold = float(arguments['--threshold']) / 100
+
+    baseline = None
+    if arguments['--compare'] is not None:
+        with open(arguments['--compare'], 'r') as baseline_fp:
+            baseline = json.load(baseline_fp)
+
+        if baseline.get('scale') != scale:
+            print('[Warning] Baseline was generated with --scale {}.'.format(
+                baseline.get('scale')), file=sys.stderr)
+
+    if arguments['--corpus'] is not None:
+        results = run_benchmarks(names, arguments['--corpus'], scale, repeat)
+    else:
+        with TemporaryDirectory() as corpus_path:
+            results = run_benchmarks(names, corpus_path, scale, repeat)
+
+    regressed = False
+
+    for name, result in results.items():
+        baseline_result = None
+        if baseline is not None:
+            baseline_result = baseline['results'].get(name)
+
+        print(format_row(name, result, baseline_result))
+
+        if baseline_result is not None:
+            for regression in compare_result(result, baseline_result,
+                                             threshold):
+                print('    REGRESSION: {}'.format(regression))
+                regressed = True
+
+    if arguments['--save'] is not None:
+        with open(arguments['--save'], 'w') as baseline_fp:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'scale': scale,
+                'results': results
+            }, baseline_fp, indent=2)
+
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Runs a single benchmark and prints its results as JSON. Benchmarks are run
+# in their own process (see benchmarks/__main__.py) so that the peak RSS
+# reported covers that benchmark only.
+
+import json
+import os
+from pathlib import Path
+import shutil
+import sys
+import time
+
+from benchmarks.corpus import CORPUS_CASES, load_case
+from muddler.muddle import muddle
+from muddler.unmuddle import unmuddle
+from muddler.utils import hash_file_sha256, xor_bytes
+from muddler.v1 import Muddle_V1
+from muddler.v1.source_chain import SourceChain
+from muddler.v2 import Muddle_V2
+from muddler.v2.key_stream import CounterKeyStream
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+XOR_SIZE = 16 * 1024 * 1024
+READ_BLOCK_SIZE = 1024
+
+
+# Each benchmark setup function takes the path of a generated corpus case and
+# a scratch directory, and returns a function running the benchmark once
+# along with the number of bytes it processes per run.
+
+def setup_xor_bytes(case_path, work_path):
+    with open(Path(case_path, 'source'), 'rb') as source_fp:
+        bstr1 = source_fp.read(XOR_SIZE)
+    with open(Path(case_path, 'target'), 'rb') as target_fp:
+        bstr2 = target_fp.read(XOR_SIZE)
+
+    return lambda: xor_bytes(bstr1, bstr2), min(len(bstr1), len(bstr2))
+
+
+def setup_source_chain_read_block(case_path, work_path):
+    source_path = Path(case_path, 'source')
+    size = source_path.stat().st_size
+
+    def run():
+        with open(source_path, 'rb') as source_fp:
+            schain = SourceChain([source_fp])
+            for _ in range(0, size, READ_BLOCK_SIZE):
+                schain.read_block(READ_BLOCK_SIZE)
+
+    return run, size
+
+
+def setup_hash_file_sha256(case_path, work_path):
+    target_path = Path(case_path, 'target')
+
+    def run():
+        with open(target_path, 'rb') as target_fp:
+            hash_file_sha256(target_fp)
+
+    return run, target_path.stat().st_size
+
+
+def setup_muddle_v1_file(case_path, work_path):
+    source_path = Path(case_path, 'source')
+    target_path = Path(case_path, 'target')
+    output_path = Path(work_path, 'muddled')
+
+    def run():
+        with open(source_path, 'rb') as source_fp, \
+                open(target_path, 'rb') as target_fp, \
+                open(output_path, 'wb') as output_fp:
+            muddler = Muddle_V1(SourceChain([source_fp]))
+            muddler.muddle_file(target_fp, output_fp)
+
+    return run, target_path.stat().st_size
+
+
+def setup_muddle_v2_file(jobs):
+    def setup(case_path, work_path):
+        source_path = Path(case_path, 'source')
+        target_path = Path(case_path, 'target')
+        output_path = Path(work_path, 'muddled')
+
+        def run():
+            with open(source_path, 'rb') as source_fp, \
+                    open(target_path, 'rb') as target_fp, \
+                    open(output_path, 'wb') as output_fp:
+                muddler = Muddle_V2(CounterKeyStream([source_fp]),
+                                    jobs=jobs)
+                muddler.muddle_file(target_fp, output_fp)
+
+        return run, target_path.stat().st_size
+
+    return setup
+
+
+def setup_muddle(case_path, work_path):
+    config, target_size = load_case(case_path)
+    output_path = Path(work_path, 'package.muddle')
+
+    def run():
+        muddle(config, Path(case_path, 'source'), Path(case_path, 'target'),
+               output_path)
+
+    return run, target_size
+
+
+def setup_unmuddle(case_path, work_path):
+    _, target_size = load_case(case_path)
+    output_path = Path(work_path, 'target')
+
+    def run():
+        if output_path.exists():
+            if output_path.is_dir():
+                shutil.rmtree(output_path)
+            else:
+                output_path.unlink()
+
+        unmuddle(Path(case_path, 'source'),
+                 Path(case_path, 'package.muddle'), output_path)
+
+    return run, target_size
+
+
+# Benchmark name -> (corpus case, setup function)
+BENCHMARKS = {
+    'xor_bytes': ('single_file', setup_xor_bytes),
+    'source_chain_read_block': ('single_file',
+                                setup_source_chain_read_block),
+    'hash_file_sha256': ('single_file', setup_hash_file_sha256),
+    'muddle_v1_file': ('single_file', setup_muddle_v1_file),
+}
+
+# Version 2 splits a single target across worker processes, so it is run
+# with several job counts to see how it scales.
+for _jobs in [1, 2, 4, 8]:
+    BENCHMARKS['muddle_v2_file.jobs{}'.format(_jobs)] = (
+        'single_file', setup_muddle_v2_file(_jobs))
+
+for _case in CORPUS_CASES:
+    BENCHMARKS['muddle.' + _case] = (_case, setup_muddle)
+    BENCHMARKS['unmuddle.' + _case] = (_case, setup_unmuddle)
+
+
+def get_peak_rss():
+    # Peak resident set size of this process in bytes, if known. On Linux,
+    # ru_maxrss is carried over from the parent process across exec, so
+    # VmHWM is used instead when available.
+    try:
+        with open('/proc/self/status', 'r') as status_fp:
+            for line in status_fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    if sys.platform == 'darwin':
+        return peak_rss
+    return peak_rss * 1024
+
+
+def run_benchmark(name, case_path, work_path, repeat=3):
+    _, setup = BENCHMARKS[name]
+    run, size = setup(case_path, work_path)
+    times = []
+
+    # An untimed run first, so that lazy imports (eg numpy for xor_bytes)
+    # and cold caches don't count as part of the first timed run.
+    run()
+
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    best = min(times)
+
+    return {
+        'bytes': size,
+        'seconds': best,
+        'mb_per_s': size / best / 1e6 if best > 0 else None,
+        'peak_rss': get_peak_rss()
+    }
+
+
+def main():
+    name, case_path, work_path, repeat = sys.argv[1:5]
+    os.makedirs(work_path, exist_ok=True)
+    result = run_benchmark(name, case_path, work_path, int(repeat))
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
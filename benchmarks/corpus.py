@@ -0,0 +1,116 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import random
+from pathlib import Path
+
+from muddler.config import parse_config
+from muddler.muddle import muddle
+
+
+MIB = 1024 * 1024
+
+# Name -> description of each synthetic corpus case.
+CORPUS_CASES = {
+    'single_file': 'a single target muddled with a source of the same size',
+    'many_small': 'a directory of many small targets, one small source each',
+    'small_target': 'a target much smaller than its source',
+    'large_target': 'a target much larger than its source',
+}
+
+
+def _write_random(path, size, rng):
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, 'wb') as fp:
+        while size > 0:
+            block_size = min(size, MIB)
+            fp.write(rng.randbytes(block_size))
+            size -= block_size
+
+
+def _write_file_case(case_path, source_size, target_size, rng):
+    _write_random(Path(case_path, 'source'), source_size, rng)
+    _write_random(Path(case_path, 'target'), target_size, rng)
+
+
+def _write_many_small_case(case_path, scale, rng):
+    target_count = 512
+    target_size = max(scale * MIB // target_count, 1)
+    lines = ['##TARGET_TYPE dir', '##SOURCE_TYPE dir', '##ALGORITHM_VERSION 1']
+
+    for ndx in range(target_count):
+        sourcef = 'source_{:04d}'.format(ndx)
+        targetf = 'sub_{:02d}/target_{:04d}'.format(ndx % 16, ndx)
+        _write_random(Path(case_path, 'source', sourcef), target_size, rng)
+        _write_random(Path(case_path, 'target', targetf), target_size, rng)
+        lines.extend(['#TARGET /' + targetf, '    /' + sourcef])
+
+    Path(case_path, 'config').write_text('\n'.join(lines) + '\n')
+
+
+def load_case(case_path):
+    # Returns the muddler config of a generated corpus case and the total
+    # size of its targets.
+    config_path = Path(case_path, 'config')
+    target_path = Path(case_path, 'target')
+
+    if config_path.exists():
+        with open(config_path, 'r') as config_fp:
+            config = parse_config(config_fp)
+        target_size = sum(f.stat().st_size for f in target_path.rglob('*')
+                          if f.is_file())
+    else:
+        config = {
+            'algorithm_version': '1',
+            'source_type': 'file',
+            'target_type': 'file',
+            'targets': {'/': None}
+        }
+        target_size = target_path.stat().st_size
+
+    return config, target_size
+
+
+def generate_case(case, case_path, scale=16, seed=0):
+    # Writes the source, target and muddled package of a corpus case to
+    # case_path. scale is the approximate amount of data in MiB.
+    rng = random.Random('{}-{}-{}'.format(case, scale, seed))
+    case_path = Path(case_path)
+    case_path.mkdir(parents=True, exist_ok=True)
+    size = scale * MIB
+
+    if case == 'single_file':
+        _write_file_case(case_path, size, size, rng)
+    elif case == 'many_small':
+        _write_many_small_case(case_path, scale, rng)
+    elif case == 'small_target':
+        _write_file_case(case_path, size, size // 64, rng)
+    elif case == 'large_target':
+        _write_file_case(case_path, size // 64, size, rng)
+    else:
+        raise ValueError('Unknown corpus case {}.'.format(repr(case)))
+
+    config, _ = load_case(case_path)
+    muddle(config, Path(case_path, 'source'), Path(case_path, 'target'),
+           Path(case_path, 'package.muddle'))
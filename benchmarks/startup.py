@@ -0,0 +1,164 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Checks the start-up time of muddler against an import-time budget.
+
+Run from the root of the repository with `python -m benchmarks.startup`.
+
+Usage: startup [--repeat <N>] [--budget-scale <FACTOR>]
+       startup (-h | --help)
+
+Options:
+    -h, --help
+        Print help message.
+    --repeat <N>
+        Number of times each case is run. The best run is reported
+        [default: 5].
+    --budget-scale <FACTOR>
+        Multiply all budgets by FACTOR, eg on slow machines [default: 1].
+"""
+
+
+from pathlib import Path
+import subprocess
+import sys
+
+import docopt
+
+
+REPO_PATH = Path(__file__).resolve().parent.parent
+
+
+# Each case is run with `python -X importtime -c <code>` in a fresh process.
+# Its time is the time spent importing modules on top of what the
+# interpreter imports at start-up, and must stay under the budget (in ms).
+# Modules listed in the last field must not be imported at all, whatever the
+# timing.
+STARTUP_CASES = {
+    'import muddler': (
+        'import muddler',
+        15, ['docopt', 'zipfile', 'muddler.config', 'muddler.muddle',
+             'muddler.unmuddle']),
+    'muddler --version': (
+        'import sys; sys.argv = ["muddler", "--version"]; '
+        'import muddler; muddler.main()',
+        40, ['zipfile', 'muddler.config', 'muddler.muddle',
+             'muddler.unmuddle']),
+    'import parse_config': (
+        'from muddler.config import parse_config',
+        60, ['docopt', 'zipfile', 'muddler.muddle', 'muddler.unmuddle']),
+    'import muddle': (
+        'import muddler.muddle',
+        200, ['numpy', 'multiprocessing', 'muddler.unmuddle']),
+    'import unmuddle': (
+        'import muddler.unmuddle',
+        200, ['numpy', 'multiprocessing', 'muddler.muddle']),
+    # Calls muddler.muddle() through the package, on missing files so that
+    # it fails before XORing anything (which may import numpy).
+    'muddler.muddle()': (
+        'import muddler\n'
+        'try:\n'
+        '    muddler.muddle({"algorithm_version": "1", '
+        '"source_type": "file", "target_type": "file", '
+        '"targets": {"/": None}}, "missing", "missing", "missing")\n'
+        'except muddler.MuddleException:\n'
+        '    pass',
+        200, ['numpy', 'multiprocessing', 'muddler.unmuddle']),
+}
+
+
+def run_importtime(code):
+    # Returns the cumulative import time in us of each top-level import, by
+    # module name.
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=REPO_PATH, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, check=True,
+                          universal_newlines=True)
+    imports = {}
+
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        _, cumulative, name = line.split('|')
+
+        if not cumulative.strip().isdigit():
+            continue
+
+        # Nested imports are indented under the module importing them.
+        top_level = not name[1:].startswith(' ')
+        imports[name.strip()] = (int(cumulative), top_level)
+
+    return imports
+
+
+def measure_case(code, startup_imports, repeat):
+    # Returns the best import time in ms of code over repeat runs, and the
+    # names of the modules it imported.
+    best = None
+    modules = set()
+
+    for _ in range(repeat):
+        imports = run_importtime(code)
+        total = sum(cumulative
+                    for name, (cumulative, top_level) in imports.items()
+                    if top_level and name not in startup_imports)
+        modules.update(imports)
+
+        if best is None or total < best:
+            best = total
+
+    return best / 1000, modules - startup_imports
+
+
+def main():
+    arguments = docopt.docopt(__doc__)
+    repeat = int(arguments['--repeat'])
+    budget_scale = float(arguments['--budget-scale'])
+
+    startup_imports = set(run_importtime('pass'))
+    regressed = False
+
+    for name, (code, budget, forbidden) in STARTUP_CASES.items():
+        elapsed, modules = measure_case(code, startup_imports, repeat)
+        budget *= budget_scale
+
+        print('{:<24} {:>8.1f} ms   (budget {:.0f} ms, {} modules)'.format(
+            name, elapsed, budget, len(modules)))
+
+        if elapsed > budget:
+            print('    REGRESSION: over budget by {:.1f} ms'.format(
+                elapsed - budget))
+            regressed = True
+
+        for module in forbidden:
+            if module in modules:
+                print('    REGRESSION: imports {}'.format(module))
+                regressed = True
+
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
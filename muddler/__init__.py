@@ -23,9 +23,19 @@
 
 """The Muddler derived-file sharing utility.
 
-Usage: muddler muddle -s <SRC_PATH> -t <TRG_PATH> <MUDDLED_PATH>
-       muddler muddle -c <CONFIG> -s <SRC_PATH> -t <TRG_PATH> <MUDDLED_PATH>
-       muddler unmuddle -s <SRC_FILE> -m <MUDDLED_PATH> <TARGET_OUT>
+Usage: muddler muddle -s <SRC_PATH> -t <TRG_PATH> [-j <JOBS>] [--pipeline]
+                      [--hash-cache] [--rehash] [--base <BASE_PATH>]
+                      [-z <CODEC>] [--stats <STATS_PATH>]
+                      [--progress <MODE>] <MUDDLED_PATH>
+       muddler muddle -c <CONFIG> -s <SRC_PATH> -t <TRG_PATH> [-j <JOBS>]
+                      [--pipeline] [--hash-cache] [--rehash]
+                      [--base <BASE_PATH>] [-z <CODEC>]
+                      [--stats <STATS_PATH>] [--progress <MODE>]
+                      <MUDDLED_PATH>
+       muddler unmuddle -s <SRC_FILE> -m <MUDDLED_PATH> [-j <JOBS>]
+                        [--hash-cache] [--rehash] [--stats <STATS_PATH>]
+                        [--progress <MODE>] [--only <GLOB>]... <TARGET_OUT>
+       muddler batch [-j <JOBS>] [--hash-cache] [--rehash] <JOBS_FILE>
        muddler (-h | --help)
        muddler (-v | --version)
 
@@ -44,34 +54,164 @@ Options:
         muddle mode, TRG_PATH must point to a file and not a directory.
     -m <MUDDLED_PATH>
         Path to muddled package to be unmuddled.
+    -j <JOBS>, --jobs <JOBS>
+        Number of worker processes to use [default: 1]. In batch mode, number
+        of jobs to run at the same time.
+    --pipeline
+        Muddle targets straight into the package in a single pass instead of
+        going through a temporary directory. Targets are then muddled one at
+        a time.
+    --hash-cache
+        Cache source hashes on disk (under ~/.cache/muddler) so that
+        unchanged sources are not hashed again on later runs.
+    --rehash
+        Ignore hashes stored in the hash cache and hash all sources again.
+    --base <BASE_PATH>
+        Path to a previously muddled package. Targets whose content and
+        sources have not changed since are copied over from it instead of
+        being muddled again.
+    -z <CODEC>, --compression <CODEC>
+        Compress targets with CODEC (one of zlib, lzma or bz2) before
+        muddling them. Packages are unmuddled with the same codec.
+    --stats <STATS_PATH>
+        Write timings, byte counts and file counts of each processing phase,
+        overall and per target, to STATS_PATH as JSON.
+    --only <GLOB>
+        Only unmuddle the targets of a directory package whose path matches
+        GLOB, where * doesn't match / and ** matches any number of
+        directories. Can be given multiple times.
+    --progress <MODE>
+        Report progress on stderr as a status line (tty), as JSON lines
+        (json) or not at all (none). With auto, a status line is shown when
+        stderr is a terminal and JSON lines otherwise [default: auto].
 """
 
 
-import docopt
 import os
-from pathlib import Path
 import sys
-import traceback
 
-from muddler.config import parse_config, MuddlerConfigException
-from muddler.muddle import muddle, MuddleException
-from muddler.unmuddle import unmuddle, UnmuddleException
+# Importing muddler (eg for `from muddler.config import parse_config`) and
+# starting the CLI should be fast, so modules are only imported by the
+# commands that need them (see benchmarks/startup.py).
 
 
-try:
-    _VERSION_FILE = os.path.join(os.path.dirname(__file__), 'VERSION')
-    with open(_VERSION_FILE) as version_fp:
-        __version__ = version_fp.read().strip()
-except Exception:
-    __version__ = '???'
+_VERSION_FILE = os.path.join(os.path.dirname(__file__), 'VERSION')
+
+
+def get_version():
+    try:
+        with open(_VERSION_FILE) as version_fp:
+            return version_fp.read().strip()
+    except Exception:
+        return '???'
+
+
+# Imported on first access, along with muddler.muddle and muddler.unmuddle
+# (see make_module_callable() in muddler.utils).
+_LAZY_EXPORTS = {
+    'parse_config': 'muddler.config',
+    'MuddlerConfigException': 'muddler.config',
+    'MuddleException': 'muddler.muddle',
+    'UnmuddleException': 'muddler.unmuddle'
+}
+
+
+def __getattr__(name):
+    from importlib import import_module
+
+    # __version__ is only read once asked for.
+    if name == '__version__':
+        return get_version()
+
+    if name in ['muddle', 'unmuddle']:
+        return import_module('muddler.' + name)
+
+    if name in _LAZY_EXPORTS:
+        return getattr(import_module(_LAZY_EXPORTS[name]), name)
+
+    raise AttributeError('module {} has no attribute {}'.format(
+        repr(__name__), repr(name)))
+
+
+def parse_jobs(arguments):
+    try:
+        jobs = int(arguments['--jobs'])
+    except ValueError:
+        jobs = 0
+
+    if jobs < 1:
+        print('[Argument Error] Number of jobs must be a positive integer.',
+              file=sys.stderr)
+        sys.exit(1)
+
+    return jobs
+
+
+def open_hash_cache(arguments):
+    from muddler.hash_cache import HashCache
+
+    if not arguments['--hash-cache'] and not arguments['--rehash']:
+        return None
+
+    try:
+        return HashCache(rehash=arguments['--rehash'])
+    except Exception as e:
+        print('[Hash Cache Warning] Could not open hash cache:', str(e),
+              file=sys.stderr)
+        return None
+
+
+def open_progress(arguments):
+    from muddler.progress import PROGRESS_MODES, new_progress_reporter
+
+    if arguments['--progress'] not in PROGRESS_MODES:
+        print('[Argument Error] Progress mode must be one of {}.'.format(
+              ', '.join(PROGRESS_MODES)), file=sys.stderr)
+        sys.exit(1)
+
+    return new_progress_reporter(arguments['--progress'])
+
+
+def open_stats(arguments, progress=None):
+    from muddler.stats import Stats
+
+    # Progress is reported from stats events, so stats are also collected
+    # when only progress is reported.
+    if arguments['--stats'] is None and progress is None:
+        return None
+
+    return Stats(progress)
+
+
+def close_progress(progress):
+    if progress is not None:
+        progress.close()
+
+
+def write_stats(arguments, stats):
+    if stats is None or arguments['--stats'] is None:
+        return
+
+    try:
+        stats.write_json(arguments['--stats'])
+    except Exception as e:
+        print('[Stats Warning] Could not write stats:', str(e),
+              file=sys.stderr)
 
 
 def muddle_command(arguments):
+    from pathlib import Path
+    import traceback
+
+    from muddler.config import parse_config, MuddlerConfigException
+    from muddler.muddle import muddle, MuddleException
+
     print('Muddling...')
 
     src_path = Path(arguments['-s'])
     trg_path = Path(arguments['-t'])
     muddle_path = Path(arguments['<MUDDLED_PATH>'])
+    jobs = parse_jobs(arguments)
 
     if arguments['-c'] is None:
         if not src_path.is_file():
@@ -96,8 +236,23 @@ def muddle_command(arguments):
             print('[Config Error]', str(m), file=sys.stderr)
             sys.exit(1)
 
+    progress = open_progress(arguments)
+    hash_cache = open_hash_cache(arguments)
+    stats = open_stats(arguments, progress)
+
     try:
-        muddle(config, src_path, trg_path, muddle_path)
+        # The progress line is ended before any error is printed.
+        try:
+            muddle(config, src_path, trg_path, muddle_path, jobs=jobs,
+                   pipeline=arguments['--pipeline'], hash_cache=hash_cache,
+                   base=arguments['--base'],
+                   compression=arguments['--compression'], stats=stats)
+        finally:
+            close_progress(progress)
+    except MuddlerConfigException as m:
+        # TARGETS rules are only expanded once the target directory is read.
+        print('[Config Error]', str(m), file=sys.stderr)
+        sys.exit(1)
     except MuddleException as m:
         if os.environ.get('MUDDLER_DEBUG', False):
             traceback.print_exc(file=sys.stderr)
@@ -106,46 +261,101 @@ def muddle_command(arguments):
             print(str(m), file=sys.stderr)
             sys.exit(1)
     except Exception:
-        if os.environ['MUDDLER_DEBUG']:
+        if os.environ.get('MUDDLER_DEBUG', False):
             traceback.print_exc(file=sys.stderr)
             sys.exit(1)
         else:
             print('An error occured while unmuddling file.')
             sys.exit(1)
+    finally:
+        if hash_cache is not None:
+            hash_cache.close()
+        write_stats(arguments, stats)
 
 
 def unmuddle_command(arguments):
+    from pathlib import Path
+    import traceback
+
+    from muddler.unmuddle import unmuddle, UnmuddleException
+
     print('Unmuddling....')
 
     src_path = Path(arguments['-s'])
     muddled_path = Path(arguments['-m'])
     target_path = Path(arguments['<TARGET_OUT>'])
+    jobs = parse_jobs(arguments)
+
+    progress = open_progress(arguments)
+    hash_cache = open_hash_cache(arguments)
+    stats = open_stats(arguments, progress)
 
     try:
-        unmuddle(src_path, muddled_path, target_path)
+        # The progress line is ended before any error is printed.
+        try:
+            unmuddle(src_path, muddled_path, target_path, jobs=jobs,
+                     hash_cache=hash_cache, stats=stats,
+                     only=arguments['--only'] or None)
+        finally:
+            close_progress(progress)
     except UnmuddleException as m:
-        if os.environ['MUDDLER_DEBUG']:
+        if os.environ.get('MUDDLER_DEBUG', False):
             traceback.print_exc(file=sys.stderr)
             sys.exit(1)
         else:
             print(str(m), file=sys.stderr)
             sys.exit(1)
     except Exception:
-        if os.environ['MUDDLER_DEBUG']:
+        if os.environ.get('MUDDLER_DEBUG', False):
             traceback.print_exc(file=sys.stderr)
             sys.exit(1)
         else:
             print('An error occured while unmuddling file.', file=sys.stderr)
             sys.exit(1)
+    finally:
+        if hash_cache is not None:
+            hash_cache.close()
+        write_stats(arguments, stats)
+
+
+def batch_command(arguments):
+    from muddler.batch import run_batch
+    from muddler.hash_cache import MemoryHashCache
+
+    jobs = parse_jobs(arguments)
+
+    # Hashes are always shared between the jobs of a batch, and also stored
+    # on disk with --hash-cache.
+    hash_cache = MemoryHashCache(open_hash_cache(arguments))
+
+    try:
+        if arguments['<JOBS_FILE>'] == '-':
+            succeeded = run_batch(sys.stdin, sys.stdout, hash_cache, jobs)
+        else:
+            with open(arguments['<JOBS_FILE>'], 'r') as jobs_fp:
+                succeeded = run_batch(jobs_fp, sys.stdout, hash_cache, jobs)
+    except OSError as e:
+        print('[Batch Error] Could not read jobs file:', str(e),
+              file=sys.stderr)
+        sys.exit(1)
+    finally:
+        hash_cache.close()
+
+    if not succeeded:
+        sys.exit(1)
 
 
 def main():
-    arguments = docopt.docopt(__doc__, version=__version__)
+    import docopt
+
+    arguments = docopt.docopt(__doc__, version=get_version())
 
     if arguments['muddle']:
         muddle_command(arguments)
     elif arguments['unmuddle']:
         unmuddle_command(arguments)
+    elif arguments['batch']:
+        batch_command(arguments)
 
 
 if __name__ == '__main__':
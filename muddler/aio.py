@@ -0,0 +1,146 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import weakref
+
+from muddler.unmuddle import iter_unmuddled_targets, unmuddle
+from muddler.unmuddle import UnmuddleException
+
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_STREAMS = 16
+# Per stream memory budget. Smaller than the default for the blocking API
+# since many streams may be open at once.
+DEFAULT_STREAM_MEMORY_BUDGET = 4 * 1024 * 1024
+
+_END = object()
+
+
+def _next_chunk(chunks):
+    # Runs on the executor. Chunks may share a buffer that is reused on the
+    # next iteration, so they are copied before being handed over.
+    chunk = next(chunks, _END)
+    return chunk if chunk is _END else bytes(chunk)
+
+
+class AsyncUnmuddler(object):
+    # Runs unmuddling work on a bounded thread pool for asyncio code. At most
+    # max_workers threads do work at any time and at most max_streams
+    # unmuddle calls or chunk iterators are active at once, each using up to
+    # memory_budget bytes of buffers, so resource usage doesn't grow with the
+    # number of concurrent requests. Others wait for their turn.
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS,
+                 max_streams=DEFAULT_MAX_STREAMS,
+                 memory_budget=DEFAULT_STREAM_MEMORY_BUDGET):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='muddler')
+        self._max_streams = max_streams
+        self._memory_budget = memory_budget
+        # Semaphores are bound to an event loop, so one is kept per loop.
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._max_streams)
+            self._semaphores[loop] = semaphore
+
+        return semaphore
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def unmuddle(self, src, muddled, trg, hash_cache=None):
+        # Same as muddler.unmuddle.unmuddle().
+        async with self._get_semaphore():
+            await self._run(unmuddle, src, muddled, trg, self._memory_budget,
+                            1, hash_cache)
+
+    async def iter_target_chunks(self, sources, package, target=None,
+                                 hash_cache=None):
+        # Asynchronous version of muddler.unmuddle.unmuddle_to_stream()
+        # yielding the unmuddled content of target as bytes chunks. Chunks
+        # are only produced as they are consumed, which bounds memory usage
+        # for slow consumers. Passing sources as paths along with a hash
+        # cache (eg a MemoryHashCache shared by all requests) saves hashing
+        # them again on every request.
+        targets = None if target is None else [target]
+
+        async with self._get_semaphore():
+            package_targets = iter_unmuddled_targets(
+                sources, package, targets, self._memory_budget,
+                hash_cache=hash_cache)
+
+            try:
+                # next() can't raise StopIteration through a future.
+                entry = await self._run(next, package_targets, _END)
+                if entry is _END:
+                    return
+
+                target_name, chunks = entry
+
+                if target is None and target_name != '/':
+                    raise UnmuddleException(
+                        'A target must be given for directory packages.')
+
+                while True:
+                    chunk = await self._run(_next_chunk, chunks)
+                    if chunk is _END:
+                        break
+                    yield chunk
+            finally:
+                await self._run(package_targets.close)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+_default_unmuddler = None
+
+
+def get_default_unmuddler():
+    global _default_unmuddler
+
+    if _default_unmuddler is None:
+        _default_unmuddler = AsyncUnmuddler()
+
+    return _default_unmuddler
+
+
+async def aunmuddle(src, muddled, trg, hash_cache=None):
+    # Asynchronous version of muddler.unmuddle.unmuddle() running on the
+    # default AsyncUnmuddler.
+    await get_default_unmuddler().unmuddle(src, muddled, trg, hash_cache)
+
+
+def aiter_target_chunks(sources, package, target=None, hash_cache=None):
+    # Asynchronous iterator over the unmuddled content of a target, running
+    # on the default AsyncUnmuddler. See AsyncUnmuddler.iter_target_chunks().
+    return get_default_unmuddler().iter_target_chunks(sources, package,
+                                                      target, hash_cache)
@@ -0,0 +1,71 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from muddler.utils import DEFAULT_MEMORY_BUDGET
+from muddler.v1 import Muddle_V1
+from muddler.v1.source_chain import SourceChain
+from muddler.v2 import Muddle_V2
+from muddler.v2.key_stream import CounterKeyStream
+
+
+def new_muddler(algorithm_version, source_fps,
+                memory_budget=DEFAULT_MEMORY_BUDGET, jobs=1, stats=None):
+    if algorithm_version == '1':
+        schain = SourceChain(source_fps, stats)
+        return Muddle_V1(schain, memory_budget=memory_budget, stats=stats)
+    elif algorithm_version == '2':
+        key_stream = CounterKeyStream(source_fps)
+        return Muddle_V2(key_stream, memory_budget=memory_budget, jobs=jobs,
+                         stats=stats)
+
+    raise ValueError('Unsupported algorithm version {}.'.format(
+        repr(algorithm_version)))
+
+
+def is_keyless(algorithm_version, target_size, source_sizes):
+    # Algorithm version 1 draws its key from the content of a target's
+    # sources, so a target can't be (un)muddled with sources that are all
+    # empty. target_size is None when it isn't known.
+    return (algorithm_version == '1' and target_size != 0 and
+            sum(source_sizes) == 0)
+
+
+def find_keyless_target(manifest):
+    # Returns the first target of manifest that is_keyless(), or None.
+    sources = manifest['sources']
+
+    if all(source_info['size'] > 0 for source_info in sources.values()):
+        return None
+
+    for target, target_info in manifest['targets'].items():
+        if manifest['source_type'] == 'file':
+            source_sizes = [sources['/']['size']]
+        else:
+            source_sizes = [sources[s]['size']
+                            for s in target_info['sources']]
+
+        if is_keyless(manifest['algorithm_version'], target_info['size'],
+                      source_sizes):
+            return target
+
+    return None
@@ -0,0 +1,256 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from concurrent.futures import ThreadPoolExecutor, wait
+import json
+import os
+import threading
+import time
+
+from muddler.config import parse_config, MuddlerConfigException
+from muddler.muddle import muddle, MuddleException
+from muddler.stats import Stats
+from muddler.unmuddle import unmuddle, UnmuddleException
+from muddler.utils import DEFAULT_MEMORY_BUDGET
+
+
+# Keys of the paths each kind of job reads. Every job writes to 'output'.
+JOB_INPUT_KEYS = {
+    'muddle': ['source', 'target', 'config', 'base'],
+    'unmuddle': ['source', 'muddled']
+}
+
+_REQUIRED_KEYS = {
+    'muddle': ['source', 'target', 'output'],
+    'unmuddle': ['source', 'muddled', 'output']
+}
+
+# Used for jobs without a config, as with the muddle command.
+_FILE_CONFIG = {
+    'algorithm_version': '1',
+    'source_type': 'file',
+    'target_type': 'file',
+    'targets': {'/': None}
+}
+
+
+class BatchJobException(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'Batch Job Error: {}'.format(self.msg)
+
+
+def parse_job(line):
+    try:
+        job = json.loads(line)
+    except ValueError:
+        raise BatchJobException('Invalid JSON.')
+
+    if not isinstance(job, dict):
+        raise BatchJobException('Jobs must be JSON objects.')
+
+    if job.get('command') not in _REQUIRED_KEYS:
+        raise BatchJobException(
+            'Invalid command {}.'.format(repr(job.get('command'))))
+
+    for key in _REQUIRED_KEYS[job['command']]:
+        if not isinstance(job.get(key), str):
+            raise BatchJobException('Missing {} path.'.format(repr(key)))
+
+    only = job.get('only')
+    if only is not None and (not isinstance(only, list) or
+                             not all(isinstance(p, str) for p in only)):
+        raise BatchJobException('\'only\' must be a list of patterns.')
+
+    jobs = job.get('jobs', 1)
+    if not isinstance(jobs, int) or isinstance(jobs, bool) or jobs < 1:
+        raise BatchJobException(
+            'Number of jobs must be a positive integer.')
+
+    return job
+
+
+def _paths_overlap(path1, path2):
+    return (path1 == path2 or path1.startswith(path2 + os.sep) or
+            path2.startswith(path1 + os.sep))
+
+
+def find_job_dependencies(jobs):
+    # A job has to wait for earlier jobs writing to a path it reads or
+    # writes (eg a package used as the base of a later muddle job). Other
+    # jobs are independent and can run at the same time. Returns the
+    # indices of the jobs each job depends on.
+    outputs = []
+    dependencies = []
+
+    for job in jobs:
+        if job is None:
+            outputs.append(None)
+            dependencies.append([])
+            continue
+
+        paths = [os.path.abspath(job[k])
+                 for k in JOB_INPUT_KEYS[job['command']] + ['output']
+                 if job.get(k) is not None]
+        dependencies.append([
+            ndx for ndx, output in enumerate(outputs)
+            if output is not None and
+            any(_paths_overlap(output, p) for p in paths)])
+        outputs.append(os.path.abspath(job['output']))
+
+    return dependencies
+
+
+class BatchRunner(object):
+    # Runs muddle and unmuddle jobs in a single process. Source and target
+    # hashes are shared between jobs through hash_cache, and configs are
+    # only parsed once per file.
+
+    def __init__(self, hash_cache, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self._hash_cache = hash_cache
+        self._memory_budget = memory_budget
+        self._configs = {}
+        self._lock = threading.Lock()
+
+    def _load_config(self, path):
+        if path is None:
+            return _FILE_CONFIG
+
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            if key not in self._configs:
+                with open(path, 'r') as config_fp:
+                    self._configs[key] = parse_config(config_fp)
+
+            return self._configs[key]
+
+    def run_job(self, job, stats=None):
+        if job['command'] == 'muddle':
+            muddle(self._load_config(job.get('config')), job['source'],
+                   job['target'], job['output'], self._memory_budget,
+                   job.get('jobs', 1), bool(job.get('pipeline', False)),
+                   self._hash_cache, job.get('base'),
+                   job.get('compression'), stats)
+        else:
+            unmuddle(job['source'], job['muddled'], job['output'],
+                     self._memory_budget, job.get('jobs', 1),
+                     self._hash_cache, stats, job.get('only'))
+
+
+def _run_batch_job(runner, job, dependencies):
+    start_time = time.perf_counter()
+    result = {'command': job['command']}
+
+    if 'id' in job:
+        result['id'] = job['id']
+
+    wait(f for _, f in dependencies)
+    failed = [line_num for line_num, f in dependencies
+              if f.result()['status'] != 'ok']
+
+    if len(failed) > 0:
+        result['status'] = 'skipped'
+        result['error'] = 'Job on line {} did not succeed.'.format(failed[0])
+        return result
+
+    stats = Stats() if job.get('stats', False) else None
+
+    try:
+        runner.run_job(job, stats)
+        result['status'] = 'ok'
+    except (MuddleException, UnmuddleException,
+            MuddlerConfigException) as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    result['seconds'] = time.perf_counter() - start_time
+
+    if stats is not None:
+        result['stats'] = stats.to_dict()
+
+    return result
+
+
+def run_batch(lines, output_fp, hash_cache, concurrency=1,
+              memory_budget=DEFAULT_MEMORY_BUDGET):
+    # Runs the jobs given as JSON lines, up to concurrency of them at once,
+    # and writes one JSON result line per job to output_fp as jobs finish.
+    # Returns whether all jobs succeeded.
+    runner = BatchRunner(hash_cache, max(memory_budget // concurrency, 1))
+    output_lock = threading.Lock()
+    jobs = []
+    errors = {}
+
+    for line_num, line in enumerate(lines, 1):
+        if len(line.strip()) == 0:
+            continue
+
+        try:
+            jobs.append((line_num, parse_job(line)))
+        except BatchJobException as e:
+            jobs.append((line_num, None))
+            errors[line_num] = str(e)
+
+    def write_result(line_num, result):
+        result = dict({'line': line_num}, **result)
+
+        with output_lock:
+            output_fp.write(json.dumps(result) + '\n')
+            output_fp.flush()
+
+        return result
+
+    def run(line_num, job, dependencies):
+        return write_result(line_num,
+                            _run_batch_job(runner, job, dependencies))
+
+    dependencies = find_job_dependencies([job for _, job in jobs])
+    futures = []
+
+    # Jobs are started in order, so the jobs a job waits for are always
+    # already running or done and waiting can't deadlock. Jobs run on
+    # threads so that they can share the hash cache, configs and the
+    # futures of the jobs they wait for. Version 1 key streams are made of
+    # small SHA-512 calls that hold the GIL, so concurrent version 1 jobs
+    # barely run faster than one at a time; such jobs should rather set
+    # their own number of worker processes.
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for (line_num, job), job_dependencies in zip(jobs, dependencies):
+            if job is None:
+                futures.append(executor.submit(
+                    write_result, line_num,
+                    {'status': 'error', 'error': errors[line_num]}))
+                continue
+
+            futures.append(executor.submit(
+                run, line_num, job,
+                [(jobs[ndx][0], futures[ndx]) for ndx in job_dependencies]))
+
+    return all(f.result()['status'] == 'ok' for f in futures)
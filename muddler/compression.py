@@ -0,0 +1,155 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import bz2
+import lzma
+import zlib
+
+from muddler.utils import DEFAULT_BLOCK_SIZE
+
+
+COMPRESSION_CODECS = ['zlib', 'lzma', 'bz2']
+
+_DECOMPRESSION_ERRORS = (zlib.error, lzma.LZMAError, OSError, EOFError)
+
+
+class DecompressionError(ValueError):
+    pass
+
+
+def new_compressor(codec):
+    if codec == 'zlib':
+        return zlib.compressobj()
+    elif codec == 'lzma':
+        return lzma.LZMACompressor()
+    elif codec == 'bz2':
+        return bz2.BZ2Compressor()
+
+    raise ValueError('Unsupported compression codec {}.'.format(repr(codec)))
+
+
+def new_decompressor(codec):
+    if codec == 'zlib':
+        return zlib.decompressobj()
+    elif codec == 'lzma':
+        return lzma.LZMADecompressor()
+    elif codec == 'bz2':
+        return bz2.BZ2Decompressor()
+
+    raise ValueError('Unsupported compression codec {}.'.format(repr(codec)))
+
+
+class CompressingReader(object):
+    # Wraps a binary file opened for reading so that reads return its
+    # compressed content.
+    def __init__(self, fp, codec, block_size=DEFAULT_BLOCK_SIZE):
+        self._fp = fp
+        self._compressor = new_compressor(codec)
+        self._block_size = block_size
+        self._pending = bytearray()
+        self._eof = False
+
+    def _fill(self, size):
+        while not self._eof and (size < 0 or len(self._pending) < size):
+            buf = self._fp.read(self._block_size)
+
+            if len(buf) > 0:
+                self._pending += self._compressor.compress(buf)
+            else:
+                self._pending += self._compressor.flush()
+                self._eof = True
+
+    def read(self, size=-1):
+        self._fill(size)
+
+        if size < 0:
+            size = len(self._pending)
+
+        buf = bytes(self._pending[:size])
+        del self._pending[:size]
+        return buf
+
+    def readinto(self, buf):
+        view = memoryview(buf).cast('B')
+        self._fill(len(view))
+        read_len = min(len(view), len(self._pending))
+        view[:read_len] = self._pending[:read_len]
+        del self._pending[:read_len]
+        return read_len
+
+
+class DecompressingWriter(object):
+    # Wraps a binary file opened for writing so that compressed data written
+    # through it is stored decompressed. finish() must be called once all
+    # the data has been written.
+    def __init__(self, fp, codec, block_size=DEFAULT_BLOCK_SIZE):
+        self._fp = fp
+        self._codec = codec
+        self._decompressor = new_decompressor(codec)
+        self._block_size = block_size
+
+    def _decompress(self, buf):
+        # Only errors from the decompressor itself are about the data, not
+        # errors writing the output (eg when the disk is full).
+        try:
+            return self._decompressor.decompress(buf, self._block_size)
+        except _DECOMPRESSION_ERRORS as e:
+            raise DecompressionError(str(e))
+
+    def write(self, buf):
+        # Output is produced at most block_size bytes at a time, so that
+        # highly compressed data doesn't blow up memory usage.
+        decompressor = self._decompressor
+        size = len(buf)
+
+        if decompressor.eof:
+            raise DecompressionError('Trailing data after compressed data.')
+
+        if self._codec == 'zlib':
+            # Once the end of the stream is reached, any data left over is
+            # kept in both unconsumed_tail and unused_data.
+            while len(buf) > 0 and not decompressor.eof:
+                self._fp.write(self._decompress(buf))
+                buf = decompressor.unconsumed_tail
+        else:
+            self._fp.write(self._decompress(buf))
+
+            while not decompressor.eof and not decompressor.needs_input:
+                self._fp.write(self._decompress(b''))
+
+        if len(decompressor.unused_data) > 0:
+            raise DecompressionError('Trailing data after compressed data.')
+
+        return size
+
+    def finish(self):
+        if self._codec == 'zlib':
+            try:
+                buf = self._decompressor.flush()
+            except zlib.error as e:
+                raise DecompressionError(str(e))
+
+            self._fp.write(buf)
+
+        if not self._decompressor.eof:
+            raise DecompressionError('Compressed data is truncated.')
@@ -21,8 +21,14 @@
 # SOFTWARE.
 
 
+from fnmatch import fnmatchcase
+import os
+import posixpath
+from pathlib import Path, PurePosixPath
+
+
 TARGET_SOURCE_TYPES = ['dir', 'file']
-ALGORITHM_VERSIONS = ['1']
+ALGORITHM_VERSIONS = ['1', '2']
 
 
 class MuddlerConfigException(Exception):
@@ -35,6 +41,20 @@ class MuddlerConfigException(Exception):
                                                            self.msg)
 
 
+SOURCE_TEMPLATE_FIELDS = ['path', 'dir', 'name', 'stem', 'suffix']
+
+
+def _check_source_template(line_no, template):
+    try:
+        template.format(**{f: '' for f in SOURCE_TEMPLATE_FIELDS})
+    except (KeyError, IndexError, ValueError):
+        raise MuddlerConfigException(
+            line_no,
+            'Invalid source template {}. Available fields are {}.'.format(
+                repr(template),
+                ', '.join('{' + f + '}' for f in SOURCE_TEMPLATE_FIELDS)))
+
+
 def parse_config(fp):
     line_no = 0
 
@@ -42,14 +62,37 @@ def parse_config(fp):
     source_type = None
     algorithm_version = None
     targets = {}
+    rules = []
 
-    # Parser state
+    # Parser state. Sources are collected in a list to keep their order and
+    # in a set to find duplicates in constant time.
     curr_target = None
+    curr_rule = None
     curr_sources = None
+    curr_source_set = None
     header_is_done = False
 
+    def finish_entry():
+        if curr_target is None and curr_rule is None:
+            return
+
+        if source_type == 'dir' and len(curr_sources) == 0:
+            raise MuddlerConfigException(
+                line_no,
+                'No sources provided for target {}.'.format(
+                    repr(curr_target if curr_rule is None
+                         else '/' + curr_rule['pattern'])))
+
+        if curr_rule is not None:
+            curr_rule['sources'] = curr_sources
+            rules.append(curr_rule)
+        elif target_type == 'dir':
+            targets[curr_target[1:]] = curr_sources
+        else:
+            targets[curr_target] = curr_sources
+
     for line in fp:
-        line = line[:-1].lstrip()
+        line = line.rstrip('\n').lstrip()
         line_no += 1
 
         if len(line) == 0:
@@ -120,18 +163,9 @@ def parse_config(fp):
                         line_no,
                         'Invalid TARGET line.')
 
-                if curr_target is not None:
-                    if source_type == 'dir' and len(curr_sources) == 0:
-                        raise MuddlerConfigException(
-                            line_no,
-                            'No sources provided for target {}.'.format(
-                                repr(curr_target)))
-                    if target_type == 'dir':
-                        targets[curr_target[1:]] = curr_sources
-                    else:
-                        targets[curr_target] = curr_sources
-
+                finish_entry()
                 curr_target = tokens[1]
+                curr_rule = None
 
                 if target_type == 'file' and curr_target != '/':
                     raise MuddlerConfigException(
@@ -141,43 +175,59 @@ def parse_config(fp):
                     raise MuddlerConfigException(
                         line_no,
                         'Invalid target name \'/\' for taget type "dir".')
-                if curr_target in targets:
+
+                target_key = (curr_target[1:] if target_type == 'dir'
+                              else curr_target)
+                if target_key in targets:
                     raise MuddlerConfigException(
                         line_no,
                         'Duplicate entry for target {}.'.format(
                             repr(curr_target)))
 
-                if source_type == 'file':
-                    curr_sources = None
-                else:
-                    curr_sources = []
+            elif tokens[0] == '#TARGETS':
+                if len(tokens) != 2 or not tokens[1].startswith('/'):
+                    raise MuddlerConfigException(
+                        line_no,
+                        'Invalid TARGETS line.')
+                if target_type != 'dir':
+                    raise MuddlerConfigException(
+                        line_no,
+                        'TARGETS rules require target type "dir".')
+
+                finish_entry()
+                curr_target = None
+                curr_rule = {'pattern': tokens[1][1:], 'line_num': line_no}
 
             else:
                 raise MuddlerConfigException(line_no, 'Invalid config syntax.')
 
+            if source_type == 'file':
+                curr_sources = None
+            else:
+                curr_sources = []
+                curr_source_set = set()
+
         elif line.startswith('/'):
             if source_type == 'file':
                 # TODO: Provide a better error message.
                 raise MuddlerConfigException(
                     line_no,
                     'Source line provided when source type is "file".')
-            if line in curr_sources:
+            if curr_sources is None:
+                raise MuddlerConfigException(
+                    line_no,
+                    'Source line provided before any target.')
+            if curr_rule is not None:
+                _check_source_template(line_no, line)
+            if line[1:] in curr_source_set:
                 raise MuddlerConfigException(line_no, 'Duplicate source line.')
             curr_sources.append(line[1:])
+            curr_source_set.add(line[1:])
 
         else:
             raise MuddlerConfigException(line_no, 'Invalid config syntax.')
 
-    if curr_target is not None:
-        if source_type == 'dir' and len(curr_sources) == 0:
-            raise MuddlerConfigException(
-                line_no,
-                'No sources provided for target {}.'.format(
-                    repr(curr_target)))
-        if target_type == 'dir':
-            targets[curr_target[1:]] = curr_sources
-        else:
-            targets[curr_target] = curr_sources
+    finish_entry()
 
     config = {
         "algorithm_version": algorithm_version,
@@ -186,4 +236,128 @@ def parse_config(fp):
         "targets": targets
     }
 
+    # Rules are only expanded into targets once the target directory is
+    # known (see expand_config).
+    if len(rules) > 0:
+        config['rules'] = rules
+
     return config
+
+
+def _match_components(pattern_parts, path_parts):
+    # Matches path components against glob components, where '**' matches
+    # any number of components (including none).
+    if len(pattern_parts) == 0:
+        return len(path_parts) == 0
+
+    if pattern_parts[0] == '**':
+        return any(_match_components(pattern_parts[1:], path_parts[ndx:])
+                   for ndx in range(len(path_parts) + 1))
+
+    return (len(path_parts) > 0 and
+            fnmatchcase(path_parts[0], pattern_parts[0]) and
+            _match_components(pattern_parts[1:], path_parts[1:]))
+
+
+def match_target_pattern(pattern, target):
+    # Glob matching as with pathlib: '*' doesn't match '/' while '**' matches
+    # any number of directories.
+    return _match_components(pattern.split('/'), target.split('/'))
+
+
+def expand_source_template(template, target):
+    # Fields are taken from target's path, eg for 'train/doc.conll':
+    # {path} = 'train/doc.conll', {dir} = 'train', {name} = 'doc.conll',
+    # {stem} = 'doc' and {suffix} = '.conll'.
+    target_path = PurePosixPath(target)
+    target_dir = str(target_path.parent)
+
+    source = template.format(
+        path=target,
+        dir='' if target_dir == '.' else target_dir,
+        name=target_path.name,
+        stem=target_path.stem,
+        suffix=target_path.suffix)
+
+    return posixpath.normpath('/' + source.lstrip('/'))[1:]
+
+
+def _find_rule(rules, target):
+    matched_rule = None
+
+    for rule in rules:
+        if match_target_pattern(rule['pattern'], target):
+            if matched_rule is not None:
+                raise MuddlerConfigException(
+                    rule['line_num'],
+                    'Target {} is matched by more than one TARGETS rule '
+                    '(see line {}).'.format(repr('/' + target),
+                                            matched_rule['line_num']))
+            matched_rule = rule
+
+    return matched_rule
+
+
+def iter_rule_targets(config, target_names):
+    # Lazily yields (target, sources, rule) for every target in target_names
+    # matched by one of the config's TARGETS rules. Targets listed explicitly
+    # with #TARGET take precedence over rules.
+    rules = config.get('rules', [])
+
+    if len(rules) == 0:
+        return
+
+    for target in target_names:
+        if target in config['targets']:
+            continue
+
+        rule = _find_rule(rules, target)
+
+        if rule is None:
+            continue
+
+        if rule['sources'] is None:
+            yield target, None, rule
+        else:
+            yield target, [expand_source_template(s, target)
+                           for s in rule['sources']], rule
+
+
+def expand_config(config, target_names):
+    # Returns a copy of config where TARGETS rules are replaced by the
+    # targets in target_names they match.
+    if len(config.get('rules', [])) == 0:
+        return config
+
+    targets = dict(config['targets'])
+    matched_rules = set()
+
+    for target, sources, rule in iter_rule_targets(config, target_names):
+        targets[target] = sources
+        matched_rules.add(rule['line_num'])
+
+    for rule in config['rules']:
+        if rule['line_num'] not in matched_rules:
+            raise MuddlerConfigException(
+                rule['line_num'],
+                'No targets match {}.'.format(repr('/' + rule['pattern'])))
+
+    expanded = dict(config)
+    expanded['targets'] = targets
+    del expanded['rules']
+
+    return expanded
+
+
+def iter_dir_files(path):
+    # Yields the paths of all files under path, relative to it and using '/'
+    # as separator, in sorted order.
+    for dir_path, dir_names, file_names in os.walk(path):
+        dir_names.sort()
+        rel_dir = os.path.relpath(dir_path, path)
+
+        for file_name in sorted(file_names):
+            if rel_dir == '.':
+                yield file_name
+            else:
+                yield Path(rel_dir, file_name).as_posix()
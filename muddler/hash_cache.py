@@ -0,0 +1,208 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from muddler.utils import hash_path_sha256
+
+
+DEFAULT_MAX_ENTRIES = 100000
+
+
+def get_default_cache_path():
+    cache_home = os.environ.get('XDG_CACHE_HOME',
+                                str(Path(Path.home(), '.cache')))
+    return Path(cache_home, 'muddler', 'hashes.sqlite3')
+
+
+class HashCache(object):
+    # Persistent cache of file hashes keyed by path and file identity (size,
+    # modification time, inode and device). Entries are evicted in least
+    # recently used order once there are more than max_entries of them.
+    # With rehash=True, stored hashes are ignored and refreshed.
+    #
+    # Several muddler processes may share the cache, so every statement is
+    # committed on its own and the database is in WAL mode, which lets
+    # readers and a writer run concurrently. A cache that can't be read or
+    # written (eg while another process holds its lock for too long) is
+    # treated as a miss rather than failing the job.
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 rehash=False):
+        if path is None:
+            path = get_default_cache_path()
+
+        self._path = Path(path)
+        self._max_entries = max_entries
+        self._rehash = rehash
+        self._lock = threading.Lock()
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self._path),
+                                     check_same_thread=False,
+                                     isolation_level=None)
+
+        try:
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            self._conn.execute('PRAGMA synchronous = NORMAL')
+        except sqlite3.Error:
+            # Eg on file systems without shared memory support, where the
+            # default rollback journal is kept.
+            pass
+
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            'path TEXT NOT NULL, '
+            'algorithm TEXT NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL, '
+            'inode INTEGER NOT NULL, '
+            'device INTEGER NOT NULL, '
+            'digest TEXT NOT NULL, '
+            'last_used REAL NOT NULL, '
+            'PRIMARY KEY (path, algorithm))')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _identity(stat):
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev)
+
+    def _lookup(self, path, algorithm, identity):
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    'SELECT digest FROM hashes WHERE path = ? AND '
+                    'algorithm = ? AND size = ? AND mtime_ns = ? AND '
+                    'inode = ? AND device = ?',
+                    (path, algorithm) + identity).fetchone()
+            except sqlite3.Error:
+                return None
+
+            if row is not None:
+                try:
+                    self._conn.execute(
+                        'UPDATE hashes SET last_used = ? '
+                        'WHERE path = ? AND algorithm = ?',
+                        (time.time(), path, algorithm))
+                except sqlite3.Error:
+                    pass
+
+        return None if row is None else row[0]
+
+    def _store(self, path, algorithm, identity, digest):
+        with self._lock:
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO hashes '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (path, algorithm) + identity + (digest, time.time()))
+            except sqlite3.Error:
+                pass
+
+    def hash_path_sha256(self, path, progress=None):
+        path = os.path.abspath(path)
+        identity = self._identity(os.stat(path))
+
+        if not self._rehash:
+            digest = self._lookup(path, 'sha256', identity)
+            if digest is not None:
+                return digest
+
+        digest = hash_path_sha256(path, progress=progress)
+
+        # Don't cache hashes of files that changed while being hashed.
+        if self._identity(os.stat(path)) == identity:
+            self._store(path, 'sha256', identity, digest)
+
+        return digest
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.execute(
+                    'DELETE FROM hashes WHERE rowid IN ('
+                    'SELECT rowid FROM hashes ORDER BY last_used DESC '
+                    'LIMIT -1 OFFSET ?)', (self._max_entries,))
+            except sqlite3.Error:
+                # Eviction is retried on the next close.
+                pass
+
+            self._conn.close()
+
+
+class MemoryHashCache(object):
+    # In-process cache of file hashes keyed by path and file identity, with
+    # an optional backing cache (eg a HashCache) for hashes it doesn't hold.
+    # Threads asking for the hash of the same file wait for the first one to
+    # hash it rather than hashing it again.
+
+    def __init__(self, backing_cache=None):
+        self._backing_cache = backing_cache
+        self._digests = {}
+        self._path_locks = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_path_lock(self, path):
+        with self._lock:
+            return self._path_locks.setdefault(path, threading.Lock())
+
+    def hash_path_sha256(self, path, progress=None):
+        path = os.path.abspath(path)
+
+        with self._get_path_lock(path):
+            identity = HashCache._identity(os.stat(path))
+            digest = self._digests.get((path, identity))
+
+            if digest is not None:
+                return digest
+
+            if self._backing_cache is not None:
+                digest = self._backing_cache.hash_path_sha256(
+                    path, progress=progress)
+            else:
+                digest = hash_path_sha256(path, progress=progress)
+
+            # Don't cache hashes of files that changed while being hashed.
+            if HashCache._identity(os.stat(path)) == identity:
+                self._digests[(path, identity)] = digest
+
+        return digest
+
+    def close(self):
+        if self._backing_cache is not None:
+            self._backing_cache.close()
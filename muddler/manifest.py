@@ -0,0 +1,315 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from bisect import bisect_right
+from collections.abc import Mapping
+import json
+from zipfile import BadZipFile, ZipInfo
+
+
+# Packages used to store their whole manifest as a single JSON document in
+# MANIFEST_V1_NAME, with the full list of sources repeated for each target.
+#
+# Manifest v2 is split in JSON Lines members that can be read as streams:
+#
+#   MANIFEST_NAME holds a header line (the manifest's own fields plus counts
+#   and the target index), one [name, hash, size] line per source, sorted by
+#   name, and one line per distinct list of sources, as source indices.
+#
+#   Targets are sorted by name and stored in blocks of TARGET_BLOCK_SIZE
+#   [name, hash, size, muddled_hash, source_list_index] lines, followed by
+#   the name of the target they are an alias of, if any. The header keeps
+#   the first target name of each block, so looking a target up only reads
+#   the block it is in.
+#
+# Packages with a v2 manifest also hold a stub MANIFEST_V1_NAME, whose
+# algorithm version tells older versions of Muddler, which only read
+# MANIFEST_V1_NAME, which version they need instead of having them fail on a
+# missing manifest.
+MANIFEST_V1_NAME = 'manifest.json'
+MANIFEST_NAME = 'manifest.jsonl'
+MANIFEST_VERSION = 2
+MANIFEST_MIN_MUDDLER_VERSION = '0.2.0'
+TARGET_BLOCK_SIZE = 4096
+
+_HEADER_KEYS = ['manifest_version', 'source_count', 'source_list_count',
+                'target_count', 'target_index']
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def get_target_block_name(block_ndx):
+    return 'manifest/targets/{:06d}.jsonl'.format(block_ndx)
+
+
+def _new_member_info(name):
+    # Use a fixed timestamp for the manifest so that packages are
+    # reproducible.
+    member_info = ZipInfo(name)
+    member_info.external_attr = 0o600 << 16
+    return member_info
+
+
+def _dump_line(value):
+    return (json.dumps(value, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def write_manifest(package, manifest):
+    sources = sorted(manifest['sources'])
+    source_ndxs = {s: i for i, s in enumerate(sources)}
+    targets = sorted(manifest['targets'])
+
+    # Targets often share the same sources, so each distinct list of
+    # sources is only stored once.
+    source_lists = []
+    source_list_ndxs = {}
+    target_source_lists = []
+
+    for target in targets:
+        source_list = tuple(source_ndxs[s]
+                            for s in manifest['targets'][target]['sources'])
+
+        if source_list not in source_list_ndxs:
+            source_list_ndxs[source_list] = len(source_lists)
+            source_lists.append(source_list)
+
+        target_source_lists.append(source_list_ndxs[source_list])
+
+    header = {k: v for k, v in manifest.items()
+              if k not in ('sources', 'targets')}
+    header.update({
+        'manifest_version': MANIFEST_VERSION,
+        'source_count': len(sources),
+        'source_list_count': len(source_lists),
+        'target_count': len(targets),
+        'target_index': targets[::TARGET_BLOCK_SIZE]
+    })
+
+    with package.open(_new_member_info(MANIFEST_NAME), 'w') as manifest_fp:
+        manifest_fp.write(_dump_line(header))
+
+        for source in sources:
+            source_info = manifest['sources'][source]
+            manifest_fp.write(_dump_line(
+                [source, source_info['hash'], source_info['size']]))
+
+        for source_list in source_lists:
+            manifest_fp.write(_dump_line(source_list))
+
+    for block_ndx, start in enumerate(range(0, len(targets),
+                                            TARGET_BLOCK_SIZE)):
+        block_name = get_target_block_name(block_ndx)
+
+        with package.open(_new_member_info(block_name), 'w') as block_fp:
+            for target, source_list_ndx in zip(
+                    targets[start:start+TARGET_BLOCK_SIZE],
+                    target_source_lists[start:start+TARGET_BLOCK_SIZE]):
+                target_info = manifest['targets'][target]
+                row = [target, target_info['hash'], target_info['size'],
+                       target_info['muddled_hash'], source_list_ndx]
+
+                if 'alias' in target_info:
+                    row.append(target_info['alias'])
+
+                block_fp.write(_dump_line(row))
+
+    with package.open(_new_member_info(MANIFEST_V1_NAME), 'w') as stub_fp:
+        stub_fp.write(_dump_line({
+            'manifest_version': MANIFEST_VERSION,
+            'algorithm_version': 'manifest v{} (requires Muddler {} or '
+                                 'later)'.format(MANIFEST_VERSION,
+                                                 MANIFEST_MIN_MUDDLER_VERSION)
+        }))
+
+
+class SourceTable(Mapping):
+    # Maps source names to {'hash': ..., 'size': ...} dicts, which are built
+    # on demand.
+    def __init__(self, names, hashes, sizes):
+        self._names = names
+        self._ndxs = {s: i for i, s in enumerate(names)}
+        self._hashes = hashes
+        self._sizes = sizes
+
+    def __getitem__(self, source):
+        ndx = self._ndxs[source]
+        return {'hash': self._hashes[ndx], 'size': self._sizes[ndx]}
+
+    def __contains__(self, source):
+        return source in self._ndxs
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def get_name(self, ndx):
+        return self._names[ndx]
+
+
+class TargetTable(Mapping):
+    # Maps target names to target info dicts, reading the manifest's target
+    # blocks from the package as needed. Iterating goes through the blocks
+    # in order, and the last block looked up is kept around since lookups
+    # usually follow the (sorted) order of targets.
+    def __init__(self, package, count, index, sources, source_lists):
+        self._package = package
+        self._count = count
+        self._index = index
+        self._sources = sources
+        self._source_lists = source_lists
+        self._cached_block = (None, None)
+
+    def _iter_block_lines(self, block_ndx):
+        try:
+            with self._package.open(get_target_block_name(block_ndx),
+                                    'r') as block_fp:
+                for line in block_fp:
+                    yield json.loads(line)
+        except (KeyError, ValueError) as e:
+            raise BadZipFile('Invalid manifest target block: {}'.format(e))
+
+    def _get_block(self, block_ndx):
+        cached_ndx, block = self._cached_block
+
+        if cached_ndx != block_ndx:
+            block = {row[0]: row for row in self._iter_block_lines(block_ndx)}
+            self._cached_block = (block_ndx, block)
+
+        return block
+
+    def _find_row(self, target):
+        if not isinstance(target, str):
+            return None
+
+        block_ndx = bisect_right(self._index, target) - 1
+
+        if block_ndx < 0:
+            return None
+
+        return self._get_block(block_ndx).get(target)
+
+    def _to_target_info(self, row):
+        try:
+            _, target_hash, size, muddled_hash, source_list_ndx = row[:5]
+            sources = [self._sources.get_name(ndx)
+                       for ndx in self._source_lists[source_list_ndx]]
+        except (ValueError, TypeError, IndexError) as e:
+            raise BadZipFile('Invalid manifest target entry: {}'.format(e))
+
+        target_info = {
+            'hash': target_hash,
+            'sources': sources,
+            'size': size,
+            'muddled_hash': muddled_hash
+        }
+
+        if len(row) > 5:
+            target_info['alias'] = row[5]
+
+        return target_info
+
+    def __getitem__(self, target):
+        row = self._find_row(target)
+
+        if row is None:
+            raise KeyError(target)
+
+        return self._to_target_info(row)
+
+    def __contains__(self, target):
+        return self._find_row(target) is not None
+
+    def __iter__(self):
+        for block_ndx in range(len(self._index)):
+            for row in self._iter_block_lines(block_ndx):
+                yield row[0]
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        # Streams through the target blocks instead of looking each target
+        # up.
+        for block_ndx in range(len(self._index)):
+            for row in self._iter_block_lines(block_ndx):
+                yield row[0], self._to_target_info(row)
+
+
+class PackageManifest(Mapping):
+    # Read-only view of a v2 manifest with the same keys as a v1 manifest.
+    # The package must stay open while the manifest is in use.
+    def __init__(self, package):
+        with package.open(MANIFEST_NAME, 'r') as manifest_fp:
+            header = json.loads(manifest_fp.readline())
+
+            if header.get('manifest_version') != MANIFEST_VERSION:
+                raise ManifestError(
+                    'Unsupported manifest version {}.'.format(
+                        repr(header.get('manifest_version'))))
+
+            names, hashes, sizes = [], [], []
+
+            for _ in range(header['source_count']):
+                name, source_hash, size = json.loads(manifest_fp.readline())
+                names.append(name)
+                hashes.append(source_hash)
+                sizes.append(size)
+
+            source_lists = [
+                tuple(json.loads(manifest_fp.readline()))
+                for _ in range(header['source_list_count'])]
+
+        member_names = set(package.namelist())
+        index = header['target_index']
+
+        for block_ndx in range(len(index)):
+            if get_target_block_name(block_ndx) not in member_names:
+                raise ManifestError('Missing manifest target block.')
+
+        self._fields = {k: v for k, v in header.items()
+                        if k not in _HEADER_KEYS}
+        self._fields['sources'] = SourceTable(names, hashes, sizes)
+        self._fields['targets'] = TargetTable(
+            package, header['target_count'], index, self._fields['sources'],
+            source_lists)
+
+    def __getitem__(self, key):
+        return self._fields[key]
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+
+def load_manifest(package):
+    # Reads the manifest of an open package, in either format.
+    if MANIFEST_NAME in package.namelist():
+        return PackageManifest(package)
+
+    with package.open(MANIFEST_V1_NAME, 'r') as manifest_fp:
+        return json.load(manifest_fp)
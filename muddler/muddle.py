@@ -22,14 +22,24 @@
 
 
 from contextlib import ExitStack
-import json
+import os
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from zipfile import ZipFile
-
-from muddler.utils import hash_file_sha256, open_files_in_stack
-from muddler.v1 import Muddle_V1
-from muddler.v1.source_chain import SourceChain
+from zipfile import BadZipFile, ZipFile, ZipInfo
+
+from muddler.algorithms import find_keyless_target, is_keyless, new_muddler
+from muddler.compression import COMPRESSION_CODECS, CompressingReader
+from muddler.compression import DecompressionError
+from muddler.config import expand_config, iter_dir_files
+from muddler.manifest import load_manifest, write_manifest
+from muddler.stats import NULL_STATS, Stats, get_advance_callback
+from muddler.utils import DEFAULT_MEMORY_BUDGET, hash_file_sha256
+from muddler.utils import HashingReader, HashingWriter, as_stream
+from muddler.utils import copy_zip_member, get_member_name
+from muddler.utils import get_remaining_size, get_stream_size
+from muddler.utils import iter_hash_paths_sha256, make_module_callable
+from muddler.utils import new_process_pool, open_files_in_stack
+from muddler.utils import open_mapped_reader
 
 
 class MuddleException(Exception):
@@ -40,7 +50,26 @@ class MuddleException(Exception):
         return 'Muddling Error: {}'.format(self.msg)
 
 
-def compute_sources_entries(manifest, config, src_path):
+# Errors that reading targets, sources and base packages and writing the
+# package can run into. Anything else is a bug and is let through.
+_PACKAGE_WRITE_ERRORS = (OSError, BadZipFile, DecompressionError)
+
+
+def get_keyless_error(target):
+    return MuddleException(
+        'Target {} can\'t be muddled with empty sources.'.format(
+            repr(target)))
+
+
+def check_target_keys(manifest):
+    target = find_keyless_target(manifest)
+
+    if target is not None:
+        raise get_keyless_error(target)
+
+
+def compute_sources_entries(manifest, config, src_path, jobs=1,
+                            hash_cache=None, stats=NULL_STATS):
     source_entries = {}
 
     if config['source_type'] == 'file':
@@ -50,13 +79,8 @@ def compute_sources_entries(manifest, config, src_path):
                 'Source path {} is not a valid file.'.format(
                     str(repr(sourcef_path))))
 
-        with open(sourcef_path, 'rb') as source_fp:
-            source_hash = hash_file_sha256(source_fp)
-
-        source_entries['/'] = {
-            'hash': source_hash,
-            'size': sourcef_path.stat().st_size
-        }
+        sources = ['/']
+        sourcef_paths = [sourcef_path]
 
     else:
         # Get unique list of sources from config
@@ -64,7 +88,10 @@ def compute_sources_entries(manifest, config, src_path):
         for target, sources in config['targets'].items():
             source_set.update(sources)
 
-        for sourcef in source_set:
+        sources = sorted(source_set)
+        sourcef_paths = []
+
+        for sourcef in sources:
             sourcef_path = Path(src_path, sourcef)
 
             if not sourcef_path.is_file():
@@ -72,52 +99,56 @@ def compute_sources_entries(manifest, config, src_path):
                     'Source path {} is not a valid file.'.format(
                         repr(str(sourcef_path))))
 
-            with open(sourcef_path, 'rb') as source_fp:
-                source_hash = hash_file_sha256(source_fp)
+            sourcef_paths.append(sourcef_path)
 
+    source_sizes = [p.stat().st_size for p in sourcef_paths]
+    stats.expect('hash_sources', sum(source_sizes), len(sources))
+    source_hashes = iter_hash_paths_sha256(
+        sourcef_paths, jobs, hash_cache,
+        get_advance_callback(stats, 'hash_sources'))
+
+    with stats.phase('hash_sources') as phase:
+        for sourcef, source_size, source_hash in zip(sources, source_sizes,
+                                                     source_hashes):
             source_entries[sourcef] = {
                 'hash': source_hash,
-                'size': sourcef_path.stat().st_size
+                'size': source_size
             }
+            phase.add(source_size, 1)
 
     manifest['sources'] = source_entries
 
 
-def compute_targets_entries(manifest, config, trg_path):
+def compute_targets_entries(manifest, config, trg_path, compute_hashes=True,
+                            jobs=1, hash_cache=None, stats=NULL_STATS):
     target_entries = {}
 
     if config['target_type'] == 'file':
-        targetf_path = Path(trg_path)
+        targets = ['/']
+        targetf_paths = [Path(trg_path)]
+    else:
+        targets = list(config['targets'])
+        targetf_paths = [Path(trg_path, t) for t in targets]
+
+    for targetf_path in targetf_paths:
         if not targetf_path.is_file():
             raise MuddleException(
                 'Target path {} is not a valid file.'.format(
                     str(repr(targetf_path))))
 
-        with open(targetf_path, 'rb') as target_fp:
-            target_hash = hash_file_sha256(target_fp)
-
-        if config['source_type'] == 'file':
-            sources = ['/']
-        else:
-            sources = config['targets']['/']
-
-        target_entries['/'] = {
-            'hash': target_hash,
-            'sources': sources,
-            'size': targetf_path.stat().st_size
-        }
+    target_sizes = [p.stat().st_size for p in targetf_paths]
 
+    if compute_hashes:
+        stats.expect('hash_targets', sum(target_sizes), len(targets))
+        target_hashes = iter_hash_paths_sha256(
+            targetf_paths, jobs, hash_cache,
+            get_advance_callback(stats, 'hash_targets'))
     else:
-        for targetf in config['targets']:
-            targetf_path = Path(trg_path, targetf)
-            if not targetf_path.is_file():
-                raise MuddleException(
-                    'Target path {} is not a valid file.'.format(
-                        str(repr(targetf_path))))
-
-            with open(targetf_path, 'rb') as target_fp:
-                target_hash = hash_file_sha256(target_fp)
+        target_hashes = [None] * len(targets)
 
+    with stats.phase('hash_targets') as phase:
+        for targetf, target_size, target_hash in zip(targets, target_sizes,
+                                                     target_hashes):
             if config['source_type'] == 'file':
                 sources = ['/']
             else:
@@ -126,13 +157,18 @@ def compute_targets_entries(manifest, config, trg_path):
             target_entries[targetf] = {
                 'hash': target_hash,
                 'sources': sources,
-                'size': targetf_path.stat().st_size
+                'size': target_size
             }
 
+            if compute_hashes:
+                phase.add(target_size, 1)
+
     manifest['targets'] = target_entries
 
 
-def generate_manifest(config, src_path, trg_path, out_path):
+def generate_manifest(config, src_path, trg_path, out_path,
+                      compute_hashes=True, jobs=1, hash_cache=None,
+                      compression=None, stats=NULL_STATS):
     manifest = {
         'algorithm_version': config['algorithm_version'],
         'source_type': config['source_type'],
@@ -141,78 +177,365 @@ def generate_manifest(config, src_path, trg_path, out_path):
         'targets': {}
     }
 
-    compute_sources_entries(manifest, config, src_path)
-    compute_targets_entries(manifest, config, trg_path)
+    # Only recorded when used, so that uncompressed packages stay the same as
+    # the ones generated by earlier versions.
+    if compression is not None:
+        manifest['compression'] = compression
+
+    compute_sources_entries(manifest, config, src_path, jobs, hash_cache,
+                            stats)
+    compute_targets_entries(manifest, config, trg_path, compute_hashes, jobs,
+                            hash_cache, stats)
 
     return manifest
 
 
-def generate_muddled_files(manifest, src_path, trg_path, out_path):
+def hash_duplicate_candidates(manifest, trg_path, jobs=1, hash_cache=None,
+                              stats=NULL_STATS):
+    # When targets aren't hashed up front (see muddle()), only those with
+    # the same size and sources as another target can be duplicates, so
+    # only those are hashed.
+    groups = {}
+
+    for target, target_info in manifest['targets'].items():
+        if target_info['hash'] is None:
+            key = (target_info['size'], tuple(target_info['sources']))
+            groups.setdefault(key, []).append(target)
+
+    targets = [t for group in groups.values() if len(group) > 1
+               for t in group]
+    stats.expect('hash_targets',
+                 sum(manifest['targets'][t]['size'] for t in targets),
+                 len(targets))
+    target_hashes = iter_hash_paths_sha256(
+        [Path(trg_path, t) for t in targets], jobs, hash_cache,
+        get_advance_callback(stats, 'hash_targets'))
+
+    with stats.phase('hash_targets') as phase:
+        for target, target_hash in zip(targets, target_hashes):
+            target_info = manifest['targets'][target]
+            target_info['hash'] = target_hash
+            phase.add(target_info['size'], 1)
+
+
+def dedupe_targets(manifest):
+    # Targets with the same content and sources are muddled into the same
+    # content, so only the first of them (in sorted order) is muddled and
+    # stored while the others are recorded as its aliases.
     if manifest['target_type'] == 'file':
-        targetf_path = Path(trg_path)
-        outputf_path = Path(out_path, 'muddled')
-        target_info = manifest['targets']['/']
+        return
+
+    first_targets = {}
+
+    for target in sorted(manifest['targets']):
+        target_info = manifest['targets'][target]
+
+        if target_info['hash'] is None:
+            continue
 
-        if manifest['source_type'] == 'file':
-            sources = [Path(src_path)]
+        key = (target_info['hash'], tuple(target_info['sources']))
+
+        if key in first_targets:
+            target_info['alias'] = first_targets[key]
         else:
-            sources = [Path(src_path, s) for s in target_info['sources']]
+            first_targets[key] = target
+
 
-        with ExitStack() as estack:
-            target_fp = estack.enter_context(open(targetf_path, 'rb'))
-            output_fp = estack.enter_context(open(outputf_path, 'wb'))
-            source_fps = open_files_in_stack(estack, sources, 'rb')
-            schain = SourceChain(source_fps)
-            muddler = Muddle_V1(schain)
-            muddler.muddle_file(target_fp, output_fp)
+def resolve_alias_hashes(manifest):
+    for target_info in manifest['targets'].values():
+        if 'alias' in target_info:
+            target_info['muddled_hash'] = \
+                manifest['targets'][target_info['alias']]['muddled_hash']
 
+
+def get_source_paths(manifest, src_path, target_info):
+    if manifest['source_type'] == 'file':
+        return [Path(src_path)]
+    else:
+        return [Path(src_path, s) for s in target_info['sources']]
+
+
+def muddle_target(algorithm_version, targetf_path, outputf_path, sources,
+                  memory_budget=DEFAULT_MEMORY_BUDGET, jobs=1,
+                  compression=None, stats=NULL_STATS):
+    outputf_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with ExitStack() as estack:
+        target_fp = open_mapped_reader(
+            estack.enter_context(open(targetf_path, 'rb')))
+        if compression is not None:
+            target_fp = CompressingReader(target_fp, compression)
+        output_fp = estack.enter_context(open(outputf_path, 'wb'))
+        source_fps = open_files_in_stack(estack, sources, 'rb')
+        muddler = new_muddler(algorithm_version, source_fps, memory_budget,
+                              jobs, stats)
+        muddler.muddle_file(target_fp, output_fp)
+
+    # Carry over the target's timestamps so that the packaged file does not
+    # depend on when (or in which order) it was muddled.
+    target_stat = targetf_path.stat()
+    os.utime(outputf_path, ns=(target_stat.st_atime_ns,
+                               target_stat.st_mtime_ns))
+
+    with stats.phase('hash_muddled') as phase:
         with open(outputf_path, 'rb') as output_fp:
-            target_info['muddled_hash'] = hash_file_sha256(output_fp)
+            muddled_hash = hash_file_sha256(output_fp)
+        phase.add(outputf_path.stat().st_size, 1)
+
+    return muddled_hash
+
+
+def _muddle_task(stats, target, target_size, *args):
+    with stats.phase('muddle', target) as phase:
+        muddled_hash = muddle_target(*args, stats=stats)
+        phase.add(target_size, 1)
+
+    return muddled_hash
+
+
+def _muddle_task_in_worker(collect_stats, *args):
+    stats = Stats() if collect_stats else NULL_STATS
+    muddled_hash = _muddle_task(stats, *args)
+    return muddled_hash, stats.to_dict() if collect_stats else None
+
+
+def read_base_manifest(base_package):
+    try:
+        return load_manifest(base_package)
+    except (OSError, BadZipFile, KeyError, ValueError):
+        raise MuddleException('Invalid or corrupt base package.')
+
+
+def find_reusable_targets(manifest, base_manifest):
+    # A target can be copied over from the base package when it and all of
+    # its sources are unchanged. Returns the muddled hashes of those targets
+    # in the base package.
+    for key in ['algorithm_version', 'source_type', 'target_type',
+                'compression']:
+        if base_manifest.get(key) != manifest.get(key):
+            return {}
+
+    base_sources = base_manifest.get('sources', {})
+    reusable = {}
+
+    # Base targets are streamed rather than looked up one by one, since the
+    # base manifest may not be fully loaded.
+    for target, base_info in base_manifest.get('targets', {}).items():
+        target_info = manifest['targets'].get(target)
+
+        if (target_info is None or
+                base_info.get('hash') != target_info['hash'] or
+                base_info.get('sources') != target_info['sources'] or
+                'muddled_hash' not in base_info):
+            continue
+
+        if all(base_sources.get(s) == manifest['sources'][s]
+               for s in target_info['sources']):
+            reusable[target] = base_info['muddled_hash']
+
+    return reusable
+
+
+def reuse_base_targets(manifest, base_package):
+    base_manifest = read_base_manifest(base_package)
+    base_members = set(base_package.namelist())
+    reused = set()
+
+    try:
+        reusable = find_reusable_targets(manifest, base_manifest)
+    except BadZipFile:
+        raise MuddleException('Invalid or corrupt base package.')
+
+    for target, muddled_hash in reusable.items():
+        # Aliases don't have a member of their own.
+        if 'alias' in manifest['targets'][target]:
+            continue
+
+        if get_member_name(manifest, target) in base_members:
+            manifest['targets'][target]['muddled_hash'] = muddled_hash
+            reused.add(target)
+
+    return reused
+
+
+def generate_muddled_files(manifest, src_path, trg_path, out_path,
+                           memory_budget=DEFAULT_MEMORY_BUDGET, jobs=1,
+                           reused=frozenset(), stats=NULL_STATS):
+    algorithm_version = manifest['algorithm_version']
+    compression = manifest.get('compression')
+
+    if manifest['target_type'] == 'file':
+        if '/' in reused:
+            return
+
+        targetf_path = Path(trg_path)
+        outputf_path = Path(out_path, 'muddled')
+        target_info = manifest['targets']['/']
+        sources = get_source_paths(manifest, src_path, target_info)
+
+        target_info['muddled_hash'] = _muddle_task(
+            stats, '/', target_info['size'], algorithm_version,
+            targetf_path, outputf_path, sources, memory_budget, jobs,
+            compression)
 
     else:
+        tasks = []
+
         for targetf, target_info in manifest['targets'].items():
+            if targetf in reused or 'alias' in target_info:
+                continue
+
             targetf_path = Path(trg_path, targetf)
             outputf_path = Path(out_path, 'muddled', targetf)
-            target_info = manifest['targets'][targetf]
+            sources = get_source_paths(manifest, src_path, target_info)
+            tasks.append((targetf, targetf_path, outputf_path, sources))
+
+        if jobs <= 1:
+            for targetf, targetf_path, outputf_path, sources in tasks:
+                target_info = manifest['targets'][targetf]
+                target_info['muddled_hash'] = _muddle_task(
+                    stats, targetf, target_info['size'], algorithm_version,
+                    targetf_path, outputf_path, sources, memory_budget, 1,
+                    compression)
+            return
+
+        # Start with the largest targets so that a big one doesn't end up
+        # running on its own once everything else is done.
+        tasks.sort(key=lambda t: manifest['targets'][t[0]]['size'],
+                   reverse=True)
+        worker_budget = max(memory_budget // jobs, 1)
+
+        with new_process_pool(jobs) as executor:
+            futures = []
+
+            for targetf, targetf_path, outputf_path, sources in tasks:
+                future = executor.submit(
+                    _muddle_task_in_worker, stats.enabled, targetf,
+                    manifest['targets'][targetf]['size'], algorithm_version,
+                    targetf_path, outputf_path, sources, worker_budget, 1,
+                    compression)
+                futures.append((targetf, future))
+
+            try:
+                for targetf, future in futures:
+                    muddled_hash, worker_stats = future.result()
+                    manifest['targets'][targetf]['muddled_hash'] = \
+                        muddled_hash
+
+                    if worker_stats is not None:
+                        stats.merge(worker_stats)
+            except Exception:
+                for _, future in futures:
+                    future.cancel()
+                raise
+
+
+def package_muddled_files(manifest, tmp_output, out_path, base_package=None,
+                          reused=frozenset(), stats=NULL_STATS):
+    try:
+        with ZipFile(out_path, 'w') as package, \
+                stats.phase('package') as phase:
+            resolve_alias_hashes(manifest)
+            write_manifest(package, manifest)
+
+            for target, target_info in manifest['targets'].items():
+                if 'alias' in target_info:
+                    continue
+
+                member_name = get_member_name(manifest, target)
+
+                if target in reused:
+                    copy_zip_member(base_package, member_name, package)
+                else:
+                    package.write(Path(tmp_output, member_name), member_name)
+
+                phase.add(target_info['size'], 1)
+    except _PACKAGE_WRITE_ERRORS as e:
+        raise MuddleException('Could not write muddled output ({}).'.format(
+            e))
+
+
+def write_muddled_member(package, member_info, target, algorithm_version,
+                         target_fp, source_fps,
+                         memory_budget=DEFAULT_MEMORY_BUDGET, jobs=1,
+                         compression=None, stats=NULL_STATS):
+    # Muddles target_fp straight into a new package entry and returns the
+    # hash and size of the target and the hash of the muddled entry.
+    with ExitStack() as estack:
+        phase = estack.enter_context(stats.phase('muddle', target))
+        target_size = get_remaining_size(target_fp)
+        target_fp = HashingReader(target_fp)
+        member_fp = HashingWriter(
+            estack.enter_context(package.open(member_info, 'w')))
+        muddler = new_muddler(algorithm_version, source_fps, memory_budget,
+                              jobs, stats)
+
+        if compression is not None:
+            muddler.muddle_file(CompressingReader(target_fp, compression),
+                                member_fp)
+        else:
+            muddler.muddle_file(target_fp, member_fp, target_size)
 
-            if manifest['source_type'] == 'file':
-                sources = [Path(src_path)]
-            else:
-                sources = [Path(src_path, s) for s in target_info['sources']]
+        phase.add(target_fp.size, 1)
 
-            with ExitStack() as estack:
-                target_fp = estack.enter_context(open(targetf_path, 'rb'))
-                outputf_path.parent.mkdir(parents=True, exist_ok=True)
-                output_fp = estack.enter_context(open(outputf_path, 'wb'))
-                source_fps = open_files_in_stack(estack, sources, 'rb')
-                schain = SourceChain(source_fps)
-                muddler = Muddle_V1(schain)
-                muddler.muddle_file(target_fp, output_fp)
+    return target_fp.hexdigest(), target_fp.size, member_fp.hexdigest()
 
-            with open(outputf_path, 'rb') as output_fp:
-                target_info['muddled_hash'] = hash_file_sha256(output_fp)
 
+def write_muddled_package(manifest, src_path, trg_path, out_path,
+                          memory_budget=DEFAULT_MEMORY_BUDGET, jobs=1,
+                          base_package=None, reused=frozenset(),
+                          stats=NULL_STATS):
+    # Muddles every target straight into its package entry, hashing the
+    # target and the muddled output along the way. A ZipFile only has one
+    # entry open for writing at a time, so targets are muddled one after the
+    # other and jobs only splits each target across worker processes (with
+    # algorithm version 2).
+    algorithm_version = manifest['algorithm_version']
+    compression = manifest.get('compression')
 
-def package_muddled_files(manifest, tmp_output, out_path):
-    manifest_json = json.dumps(manifest)
+    if manifest['target_type'] == 'file':
+        targetf_paths = {'/': Path(trg_path)}
+    else:
+        targetf_paths = {t: Path(trg_path, t) for t in manifest['targets']}
 
     try:
         with ZipFile(out_path, 'w') as package:
-            package.writestr('manifest.json', manifest_json)
-
-            if manifest['target_type'] == 'file':
-                muddle_path = Path(tmp_output, 'muddled')
-                package.write(muddle_path, 'muddled')
-            else:
-                for target in manifest['targets']:
-                    muddle_path = Path(tmp_output, 'muddled', target)
-                    package.write(muddle_path, Path('muddled', target))
-    # TODO: More fine-grained exception handeling.
-    except Exception:
-        raise MuddleException('Could not write muddled output.')
-
-
-def muddle(config, src, trg, output):
+            for target, targetf_path in targetf_paths.items():
+                if 'alias' in manifest['targets'][target]:
+                    continue
+
+                member_name = get_member_name(manifest, target)
+
+                if target in reused:
+                    with stats.phase('package') as phase:
+                        copy_zip_member(base_package, member_name, package)
+                        phase.add(manifest['targets'][target]['size'], 1)
+                    continue
+
+                target_info = manifest['targets'][target]
+                sources = get_source_paths(manifest, src_path, target_info)
+                member_info = ZipInfo.from_file(targetf_path, member_name)
+
+                with ExitStack() as estack:
+                    target_fp = open_mapped_reader(
+                        estack.enter_context(open(targetf_path, 'rb')))
+                    source_fps = open_files_in_stack(estack, sources, 'rb')
+                    target_info['hash'], _, target_info['muddled_hash'] = \
+                        write_muddled_member(
+                            package, member_info, target, algorithm_version,
+                            target_fp, source_fps, memory_budget, jobs,
+                            compression, stats)
+
+            resolve_alias_hashes(manifest)
+            write_manifest(package, manifest)
+    except _PACKAGE_WRITE_ERRORS as e:
+        raise MuddleException('Could not write muddled output ({}).'.format(
+            e))
+
+
+def muddle(config, src, trg, output, memory_budget=DEFAULT_MEMORY_BUDGET,
+           jobs=1, pipeline=False, hash_cache=None, base=None,
+           compression=None, stats=None):
     src_path = Path(src)
     trg_path = Path(trg)
     out_path = Path(output)
@@ -241,8 +564,177 @@ def muddle(config, src, trg, output):
         raise MuddleException(
             'Provided output path is an existing directory.')
 
-    manifest = generate_manifest(config, src_path, trg_path, out_path)
+    if stats is None:
+        stats = NULL_STATS
+
+    if 'rules' in config:
+        config = expand_config(config, iter_dir_files(trg_path))
+
+    if compression is not None and compression not in COMPRESSION_CODECS:
+        raise MuddleException(
+            'Unsupported compression codec {}.'.format(repr(compression)))
+
+    with ExitStack() as estack:
+        base_package = None
+
+        if base is not None:
+            base_path = Path(base)
+
+            if out_path.exists() and out_path.samefile(base_path):
+                raise MuddleException(
+                    'Base package and output path must be different files.')
+
+            try:
+                base_package = estack.enter_context(ZipFile(base_path, 'r'))
+            except (OSError, BadZipFile):
+                raise MuddleException('Invalid or corrupt base package.')
+
+        # Target hashes are needed up front to find what can be reused from
+        # the base package.
+        compute_hashes = not pipeline or base_package is not None
+        manifest = generate_manifest(config, src_path, trg_path, out_path,
+                                     compute_hashes, jobs, hash_cache,
+                                     compression, stats)
+
+        check_target_keys(manifest)
+
+        if not compute_hashes:
+            hash_duplicate_candidates(manifest, trg_path, jobs, hash_cache,
+                                      stats)
+
+        dedupe_targets(manifest)
+
+        if base_package is not None:
+            reused = reuse_base_targets(manifest, base_package)
+        else:
+            reused = frozenset()
+
+        muddled_sizes = [target_info['size'] for target, target_info
+                         in manifest['targets'].items()
+                         if target not in reused and
+                         'alias' not in target_info]
+        stats.expect('muddle', sum(muddled_sizes), len(muddled_sizes))
+
+        if pipeline:
+            write_muddled_package(manifest, src_path, trg_path, out_path,
+                                  memory_budget, jobs, base_package, reused,
+                                  stats)
+            return
+
+        with TemporaryDirectory() as tmp_output:
+            generate_muddled_files(manifest, src_path, trg_path, tmp_output,
+                                   memory_budget, jobs, reused, stats)
+            package_muddled_files(manifest, tmp_output, out_path,
+                                  base_package, reused, stats)
+
+
+def _get_stream_entries(kind, data, names, is_file):
+    # Maps names to binary streams for the sources or targets given to
+    # muddle_streams().
+    if is_file:
+        return {'/': as_stream(data)}
+
+    streams = {}
+
+    for name in names:
+        if name not in data:
+            raise MuddleException('Missing {} {}.'.format(kind, repr(name)))
+        streams[name] = as_stream(data[name])
+
+    return streams
+
+
+def muddle_streams(config, sources, targets, output,
+                   memory_budget=DEFAULT_MEMORY_BUDGET, compression=None,
+                   stats=None):
+    # Muddles in-memory data into a package written to the binary file-like
+    # object output, without touching the file system. When the source
+    # (target) type is 'file', sources (targets) is a single binary stream or
+    # bytes-like object. Otherwise, it maps the source (target) names in
+    # config to binary streams or bytes-like objects. Source streams must be
+    # seekable. Returns the package manifest.
+    if stats is None:
+        stats = NULL_STATS
+
+    if compression is not None and compression not in COMPRESSION_CODECS:
+        raise MuddleException(
+            'Unsupported compression codec {}.'.format(repr(compression)))
+
+    if 'rules' in config:
+        config = expand_config(config, targets)
+
+    algorithm_version = config['algorithm_version']
+    source_set = set()
+
+    if config['source_type'] == 'dir':
+        for target_sources in config['targets'].values():
+            source_set.update(target_sources)
+
+    source_fps = _get_stream_entries('source', sources, sorted(source_set),
+                                     config['source_type'] == 'file')
+    target_fps = _get_stream_entries('target', targets, config['targets'],
+                                     config['target_type'] == 'file')
+
+    manifest = {
+        'algorithm_version': algorithm_version,
+        'source_type': config['source_type'],
+        'target_type': config['target_type'],
+        'sources': {},
+        'targets': {}
+    }
+
+    if compression is not None:
+        manifest['compression'] = compression
+
+    with stats.phase('hash_sources') as phase:
+        for source, source_fp in source_fps.items():
+            source_fp.seek(0, 0)
+            manifest['sources'][source] = {
+                'hash': hash_file_sha256(source_fp),
+                'size': get_stream_size(source_fp)
+            }
+            phase.add(manifest['sources'][source]['size'], 1)
+
+    for target, target_fp in target_fps.items():
+        if config['source_type'] == 'file':
+            source_sizes = [manifest['sources']['/']['size']]
+        else:
+            source_sizes = [manifest['sources'][s]['size']
+                            for s in config['targets'][target]]
+
+        if is_keyless(algorithm_version, get_remaining_size(target_fp),
+                      source_sizes):
+            raise get_keyless_error(target)
+
+    try:
+        with ZipFile(output, 'w') as package:
+            for target, target_fp in target_fps.items():
+                if config['source_type'] == 'file':
+                    target_sources = ['/']
+                else:
+                    target_sources = config['targets'][target]
+
+                member_info = ZipInfo(get_member_name(manifest, target))
+                member_info.external_attr = 0o600 << 16
+                target_hash, target_size, muddled_hash = \
+                    write_muddled_member(
+                        package, member_info, target, algorithm_version,
+                        target_fp, [source_fps[s] for s in target_sources],
+                        memory_budget, 1, compression, stats)
+
+                manifest['targets'][target] = {
+                    'hash': target_hash,
+                    'sources': target_sources,
+                    'size': target_size,
+                    'muddled_hash': muddled_hash
+                }
+
+            write_manifest(package, manifest)
+    except _PACKAGE_WRITE_ERRORS as e:
+        raise MuddleException('Could not write muddled output ({}).'.format(
+            e))
+
+    return manifest
+
 
-    with TemporaryDirectory() as tmp_output:
-        generate_muddled_files(manifest, src_path, trg_path, tmp_output)
-        package_muddled_files(manifest, tmp_output, out_path)
+make_module_callable(__name__)
@@ -0,0 +1,277 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+from pathlib import Path
+from zipfile import ZipFile
+
+from muddler.algorithms import is_keyless
+from muddler.stats import NULL_STATS
+from muddler.unmuddle import UnmuddleException, iter_unmuddled_chunks
+from muddler.unmuddle import get_keyless_error, read_manifest
+from muddler.unmuddle import validate_manifest
+from muddler.unmuddle import validate_package
+from muddler.utils import DEFAULT_MEMORY_BUDGET, hash_path_sha256
+
+
+class _TargetReader(io.RawIOBase):
+    # Unmuddles a target on demand as it is read. Backward seeks restart
+    # unmuddling from the start of the target and forward seeks skip over
+    # unmuddled data. The target's hashes are checked once it has been read
+    # to the end.
+
+    def __init__(self, muddled_package, target):
+        super().__init__()
+        self._muddled_package = muddled_package
+        self._target = target
+        self._size = muddled_package.manifest['targets'][target]['size']
+        self._source_fps = {}
+        self._chunks = None
+        self._chunk = memoryview(b'')
+        self._pos = 0
+        self._stream_pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _restart(self):
+        self._close_stream()
+        self._source_fps = self._muddled_package._open_sources(self._target)
+        self._chunks = self._muddled_package._iter_chunks(self._target,
+                                                          self._source_fps)
+        self._stream_pos = 0
+
+    def _close_stream(self):
+        if self._chunks is not None:
+            self._chunks.close()
+            self._chunks = None
+
+        for source_fp in self._source_fps.values():
+            source_fp.close()
+
+        self._source_fps = {}
+        self._chunk = memoryview(b'')
+
+    def _next_chunk(self):
+        # Returns False once the end of the target is reached.
+        if self._chunks is None:
+            return False
+
+        chunk = next(self._chunks, None)
+
+        if chunk is None:
+            self._close_stream()
+            return False
+
+        self._chunk = memoryview(chunk).cast('B')
+        return True
+
+    def readinto(self, buf):
+        self._checkClosed()
+        view = memoryview(buf).cast('B')
+
+        if len(view) == 0 or self._pos >= self._size:
+            return 0
+
+        if self._pos < self._stream_pos or (self._chunks is None and
+                                            self._stream_pos == 0):
+            self._restart()
+
+        # Skip forward to the current position.
+        while self._stream_pos < self._pos:
+            if len(self._chunk) == 0 and not self._next_chunk():
+                return 0
+
+            skip_len = min(len(self._chunk), self._pos - self._stream_pos)
+            self._chunk = self._chunk[skip_len:]
+            self._stream_pos += skip_len
+
+        while len(self._chunk) == 0:
+            if not self._next_chunk():
+                return 0
+
+        read_len = min(len(view), len(self._chunk))
+        view[:read_len] = self._chunk[:read_len]
+        self._chunk = self._chunk[read_len:]
+        self._pos += read_len
+        self._stream_pos += read_len
+
+        # Finish the stream as soon as the last byte has been read so that
+        # the target's hashes are checked.
+        if self._pos >= self._size and len(self._chunk) == 0:
+            while self._next_chunk():
+                pass
+
+        return read_len
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        elif whence != io.SEEK_SET:
+            raise ValueError('Invalid whence ({}).'.format(whence))
+
+        if offset < 0:
+            raise ValueError('Negative seek position {}.'.format(offset))
+
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        self._checkClosed()
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._close_stream()
+        super().close()
+
+
+class MuddledPackage(object):
+    # Read-only access to the targets of a muddled package, unmuddled on
+    # demand without writing them to disk. The sources used by a target are
+    # validated the first time it is opened.
+
+    def __init__(self, path, source_path,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, hash_cache=None,
+                 stats=None):
+        self._source_path = Path(source_path)
+        self._memory_budget = memory_budget
+        self._hash_cache = hash_cache
+        self._stats = NULL_STATS if stats is None else stats
+        self._valid_sources = set()
+
+        try:
+            self._package = ZipFile(path, 'r')
+        except Exception:
+            raise UnmuddleException('Invalid or corrupt muddled package.')
+
+        try:
+            self._manifest = read_manifest(self._package)
+            validate_manifest(self._manifest)
+            validate_package(self._manifest, self._package)
+        except Exception:
+            self._package.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def manifest(self):
+        return self._manifest
+
+    @property
+    def targets(self):
+        return list(self._manifest['targets'])
+
+    def _get_source_path(self, source):
+        if self._manifest['source_type'] == 'file':
+            return self._source_path
+        return Path(self._source_path, source)
+
+    def _validate_source(self, source):
+        if source in self._valid_sources:
+            return
+
+        source_path = self._get_source_path(source)
+
+        try:
+            if self._hash_cache is not None:
+                source_hash = self._hash_cache.hash_path_sha256(source_path)
+            else:
+                source_hash = hash_path_sha256(source_path)
+        except OSError:
+            raise UnmuddleException(
+                'Could not read source file {}'.format(
+                    repr(str(source_path))))
+
+        if source_hash != self._manifest['sources'][source]['hash']:
+            raise UnmuddleException('Invalid source file for muddled package.')
+
+        self._valid_sources.add(source)
+
+    def _get_target_sources(self, target):
+        if self._manifest['source_type'] == 'file':
+            return ['/']
+        return self._manifest['targets'][target]['sources']
+
+    def _open_sources(self, target):
+        source_fps = {}
+
+        try:
+            for source in self._get_target_sources(target):
+                self._validate_source(source)
+                source_fps[source] = open(self._get_source_path(source),
+                                          'rb')
+        except Exception:
+            for source_fp in source_fps.values():
+                source_fp.close()
+            raise
+
+        return source_fps
+
+    def _iter_chunks(self, target, source_fps):
+        return iter_unmuddled_chunks(self._manifest, self._package, target,
+                                     source_fps, self._memory_budget,
+                                     self._stats)
+
+    def open(self, target=None, buffer_size=io.DEFAULT_BUFFER_SIZE):
+        # Returns a read-only, seekable, buffered binary file object for
+        # target. target may be omitted for packages with a 'file' target
+        # type.
+        if target is None:
+            if self._manifest['target_type'] != 'file':
+                raise UnmuddleException(
+                    'A target must be given for directory packages.')
+            target = '/'
+
+        if target not in self._manifest['targets']:
+            raise UnmuddleException('Unknown target {}.'.format(repr(target)))
+
+        target_info = self._manifest['targets'][target]
+        source_sizes = [self._manifest['sources'][s]['size']
+                        for s in self._get_target_sources(target)]
+
+        if is_keyless(self._manifest['algorithm_version'],
+                      target_info['size'], source_sizes):
+            raise get_keyless_error(target)
+
+        # Fail early on invalid sources.
+        for source in self._get_target_sources(target):
+            self._validate_source(source)
+
+        return io.BufferedReader(_TargetReader(self, target), buffer_size)
+
+    def close(self):
+        self._package.close()
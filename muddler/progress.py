@@ -0,0 +1,236 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import shutil
+import sys
+import threading
+from time import perf_counter
+
+
+PROGRESS_MODES = ['auto', 'tty', 'json', 'none']
+
+# Minimum time between two reports, in seconds.
+TTY_INTERVAL = 0.2
+JSON_INTERVAL = 1.0
+
+# Counted while a target is being processed, to move progress along within
+# large targets.
+_INPUT_PHASE = 'read_input'
+
+
+def _format_bytes(nbytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if nbytes < 1000:
+            return '{:.1f} {}'.format(nbytes, unit)
+        nbytes /= 1000
+
+    return '{:.1f} TB'.format(nbytes)
+
+
+def _format_seconds(seconds):
+    seconds = int(seconds)
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60,
+                                     seconds % 60)
+
+
+def _rate(nbytes, seconds):
+    return nbytes / seconds / 1e6 if seconds > 0 else 0.0
+
+
+class _PhaseProgress(object):
+    def __init__(self):
+        self.bytes = 0
+        self.files = 0
+        self.seconds = 0.0
+
+
+class ProgressReporter(object):
+    # Stats callback (see muddler.stats) reporting throughput, the number of
+    # targets done and an ETA for the phase announced with stats.expect().
+    # Events only update counters, and reports are written at most once per
+    # interval, so that hot loops don't pay for rendering. mode is 'tty' for
+    # a single line redrawn in place or 'json' for one JSON object per line.
+    # Files hashed on a thread pool report advances from their threads, so
+    # reports are written under a lock.
+
+    def __init__(self, mode, fp=None, interval=None):
+        self._mode = mode
+        self._fp = sys.stderr if fp is None else fp
+
+        if interval is None:
+            interval = TTY_INTERVAL if mode == 'tty' else JSON_INTERVAL
+
+        self._interval = interval
+        self._start = perf_counter()
+        self._next_report = self._start + interval
+        self._phases = {}
+        self._main_phase = None
+        self._main_start = None
+        self._total_bytes = 0
+        self._total_files = 0
+        self._input_bytes = 0
+        self._advanced = {}
+        self._line_len = 0
+        self._lock = threading.Lock()
+
+    def _get_phase(self, name):
+        phase = self._phases.get(name)
+
+        if phase is None:
+            phase = self._phases[name] = _PhaseProgress()
+
+        return phase
+
+    def __call__(self, event):
+        kind = event['event']
+
+        if kind == 'expect':
+            self._main_phase = event['phase']
+            self._main_start = perf_counter()
+            self._total_bytes = event['bytes']
+            self._total_files = event['files']
+            self._input_bytes = 0
+            self._advanced = {}
+        elif kind == 'advance':
+            if event['phase'] == self._main_phase:
+                self._advanced[event['target']] = event['bytes']
+        elif kind != 'start':
+            phase = self._get_phase(event['phase'])
+            phase.bytes += event['bytes']
+            phase.files += event['files']
+            phase.seconds += event['seconds']
+
+            if event['phase'] == self._main_phase and event['files'] > 0:
+                # Files still in progress advance again from where they are.
+                self._input_bytes = 0
+                self._advanced = {}
+            elif event['phase'] == _INPUT_PHASE and event['seconds'] == 0:
+                # Counts merged from worker processes come with their phase
+                # time and only once their target is done, so they are left
+                # out.
+                self._input_bytes += event['bytes']
+
+        now = perf_counter()
+
+        if now >= self._next_report:
+            with self._lock:
+                if now >= self._next_report:
+                    self._next_report = now + self._interval
+                    self.report(now)
+
+    def get_progress(self, now=None):
+        if now is None:
+            now = perf_counter()
+
+        elapsed = now - self._start
+        progress = {'elapsed_seconds': elapsed}
+
+        if self._main_phase is not None:
+            main = self._get_phase(self._main_phase)
+            done_bytes = main.bytes + self._input_bytes + \
+                sum(self._advanced.values())
+
+            if self._total_bytes > 0:
+                done_bytes = min(done_bytes, self._total_bytes)
+
+            rate = _rate(done_bytes, now - self._main_start)
+            progress.update({
+                'phase': self._main_phase,
+                'files_done': main.files,
+                'files_total': self._total_files,
+                'bytes_done': done_bytes,
+                'bytes_total': self._total_bytes,
+                'mb_per_second': rate,
+                'eta_seconds': None
+            })
+
+            if rate > 0:
+                progress['eta_seconds'] = \
+                    (self._total_bytes - done_bytes) / rate / 1e6
+
+        progress['phases'] = {
+            name: {
+                'bytes': phase.bytes,
+                'files': phase.files,
+                'mb_per_second': _rate(phase.bytes, phase.seconds)
+            }
+            for name, phase in self._phases.items()
+            if phase.bytes > 0}
+
+        return progress
+
+    def _format_line(self, progress):
+        parts = []
+
+        if 'phase' in progress:
+            eta = progress['eta_seconds']
+            parts.append('{} {}/{} files, {}/{}, {:.1f} MB/s, ETA {}'.format(
+                progress['phase'], progress['files_done'],
+                progress['files_total'],
+                _format_bytes(progress['bytes_done']),
+                _format_bytes(progress['bytes_total']),
+                progress['mb_per_second'],
+                '?' if eta is None else _format_seconds(eta)))
+
+        parts.extend('{} {:.1f} MB/s'.format(name, phase['mb_per_second'])
+                     for name, phase in progress['phases'].items()
+                     if name != progress.get('phase'))
+
+        return ' | '.join(parts)
+
+    def report(self, now=None):
+        progress = self.get_progress(now)
+
+        if self._mode == 'json':
+            self._fp.write(json.dumps(progress) + '\n')
+        else:
+            width = shutil.get_terminal_size().columns - 1
+            line = self._format_line(progress)[:width]
+            self._fp.write('\r' + line.ljust(self._line_len))
+            self._line_len = len(line)
+
+        self._fp.flush()
+
+    def close(self):
+        # Writes a final report.
+        self.report()
+
+        if self._mode == 'tty':
+            self._fp.write('\n')
+            self._fp.flush()
+
+
+def new_progress_reporter(mode, fp=None):
+    # Returns None when progress isn't reported. 'auto' redraws a line when
+    # fp is a terminal and writes JSON lines otherwise (eg for a CI log or a
+    # wrapping tool).
+    if fp is None:
+        fp = sys.stderr
+
+    if mode == 'auto':
+        mode = 'tty' if fp.isatty() else 'json'
+
+    if mode == 'none':
+        return None
+
+    return ProgressReporter(mode, fp)
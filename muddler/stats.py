@@ -0,0 +1,210 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+from functools import partial
+from time import perf_counter
+
+
+# Instrumentation of muddling and unmuddling. Code paths take an optional
+# stats object and record phases on it:
+#
+#     with stats.phase('hash_sources') as phase:
+#         ...
+#         phase.add(nbytes=size, files=1)
+#
+# Each phase accumulates wall time, bytes processed and file counts, both
+# overall and, when a target is given, for that target. Phases can be nested
+# (eg 'muddle' includes 'key_stream' and 'xor'), so phase times don't add up
+# to the total time.
+#
+# Callbacks registered on a Stats object are called with an event dict on
+# every phase start ('start'), every counter update ('progress') and every
+# phase end ('end'). Code paths can also announce how many bytes and files a
+# phase is expected to process with stats.expect() ('expect'), eg for
+# progress reporting, and how far along they are within a large file with
+# stats.advance() ('advance'). Advances aren't recorded, as the file is
+# counted once it's done, and may come from other threads. NULL_STATS, used
+# when no stats object is given, records nothing.
+#
+# Stats objects can't be shared with worker processes. Workers collect their
+# own and send them back as to_dict(), to be merged with stats.merge().
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add(self, nbytes=0, files=0):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class NullStats(object):
+    enabled = False
+
+    def phase(self, name, target=None):
+        return _NULL_PHASE
+
+    def count(self, name, nbytes=0, files=0, seconds=0.0, target=None):
+        pass
+
+    def expect(self, name, nbytes=0, files=0):
+        pass
+
+    def advance(self, name, key, nbytes):
+        pass
+
+    def merge(self, data):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+class _Phase(object):
+    def __init__(self, stats, name, target):
+        self._stats = stats
+        self._name = name
+        self._target = target
+        self._start = None
+
+    def __enter__(self):
+        self._start = perf_counter()
+        self._stats._notify('start', self._name, self._target)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = perf_counter() - self._start
+        self._stats._record(self._name, self._target, 0, 0, seconds)
+        self._stats._notify('end', self._name, self._target,
+                            seconds=seconds)
+        return False
+
+    def add(self, nbytes=0, files=0):
+        self._stats.count(self._name, nbytes, files, target=self._target)
+
+
+def _new_entry():
+    return {'seconds': 0.0, 'bytes': 0, 'files': 0}
+
+
+class Stats(NullStats):
+    enabled = True
+
+    def __init__(self, callback=None):
+        self._callbacks = []
+        self._phases = {}
+        self._targets = {}
+        self._start = perf_counter()
+
+        if callback is not None:
+            self._callbacks.append(callback)
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def _notify(self, event, name, target, nbytes=0, files=0, seconds=0.0):
+        if len(self._callbacks) == 0:
+            return
+
+        event = {
+            'event': event,
+            'phase': name,
+            'target': target,
+            'bytes': nbytes,
+            'files': files,
+            'seconds': seconds
+        }
+
+        for callback in self._callbacks:
+            callback(event)
+
+    def _record(self, name, target, nbytes, files, seconds):
+        entries = [self._phases.setdefault(name, _new_entry())]
+
+        if target is not None:
+            target_phases = self._targets.setdefault(target, {})
+            entries.append(target_phases.setdefault(name, _new_entry()))
+
+        for entry in entries:
+            entry['seconds'] += seconds
+            entry['bytes'] += nbytes
+            entry['files'] += files
+
+    def phase(self, name, target=None):
+        return _Phase(self, name, target)
+
+    def count(self, name, nbytes=0, files=0, seconds=0.0, target=None):
+        self._record(name, target, nbytes, files, seconds)
+        self._notify('progress', name, target, nbytes, files, seconds)
+
+    def expect(self, name, nbytes=0, files=0):
+        self._notify('expect', name, None, nbytes, files)
+
+    def advance(self, name, key, nbytes):
+        # nbytes is how much of file key has been processed so far.
+        self._notify('advance', name, key, nbytes)
+
+    def merge(self, data):
+        # Adds up stats collected elsewhere (eg in a worker process) as
+        # returned by to_dict().
+        for name, entry in data['phases'].items():
+            self._record(name, None, entry['bytes'], entry['files'],
+                         entry['seconds'])
+            self._notify('progress', name, None, entry['bytes'],
+                         entry['files'], entry['seconds'])
+
+        for target, phases in data['targets'].items():
+            target_phases = self._targets.setdefault(target, {})
+
+            for name, entry in phases.items():
+                target_entry = target_phases.setdefault(name, _new_entry())
+                for key in target_entry:
+                    target_entry[key] += entry[key]
+
+    def to_dict(self):
+        return {
+            'total_seconds': perf_counter() - self._start,
+            'phases': self._phases,
+            'targets': self._targets
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as stats_fp:
+            json.dump(self.to_dict(), stats_fp, indent=2)
+
+
+def get_advance_callback(stats, name):
+    # Returns a callback taking a key and a byte count, as expected by
+    # iter_hash_paths_sha256(), that advances phase name on stats, or None
+    # when stats records nothing.
+    if not stats.enabled:
+        return None
+
+    return partial(stats.advance, name)
@@ -22,14 +22,23 @@
 
 
 from contextlib import ExitStack
-import json
+from functools import partial
+import hashlib
+import os
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from zipfile import ZipFile
+import shutil
+from zipfile import BadZipFile, ZipFile
 
-from muddler.utils import hash_file_sha256, open_files_in_stack
-from muddler.v1 import Muddle_V1
-from muddler.v1.source_chain import SourceChain
+from muddler.algorithms import find_keyless_target, new_muddler
+from muddler.compression import COMPRESSION_CODECS, DecompressingWriter
+from muddler.compression import DecompressionError
+from muddler.config import ALGORITHM_VERSIONS, match_target_pattern
+from muddler.manifest import load_manifest
+from muddler.stats import NULL_STATS, Stats, get_advance_callback
+from muddler.utils import DEFAULT_MEMORY_BUDGET, HashingReader, HashingWriter
+from muddler.utils import as_stream, get_member_name, hash_file_sha256
+from muddler.utils import iter_hash_paths_sha256, make_module_callable
+from muddler.utils import new_process_pool, open_files_in_stack
 
 
 class UnmuddleException(Exception):
@@ -40,105 +49,335 @@ class UnmuddleException(Exception):
         return 'Unmuddling Error: {}'.format(self.msg)
 
 
-def extract_package(package_path, extracted_path):
+def read_manifest(package):
+    # v2 manifests are loaded lazily, so the package must stay open while
+    # the manifest is in use.
     try:
-        with ZipFile(package_path, 'r') as package:
-            package.extractall(path=extracted_path)
+        return load_manifest(package)
     except Exception:
-        UnmuddleException('Could not extract muddled content.')
+        raise UnmuddleException('Invalid or corrupt muddled package.')
 
 
 def validate_manifest(manifest):
     # TODO: Use JSON schema to validate manifest
-    pass
+    if manifest.get('algorithm_version') not in ALGORITHM_VERSIONS:
+        raise UnmuddleException(
+            'Unsupported algorithm version {}.'.format(
+                repr(manifest.get('algorithm_version'))))
+
+    compression = manifest.get('compression')
+    if compression is not None and compression not in COMPRESSION_CODECS:
+        raise UnmuddleException(
+            'Unsupported compression codec {}.'.format(repr(compression)))
+
 
+def validate_package(manifest, package):
+    member_names = set(package.namelist())
 
-def validate_package(manifest, extracted_path):
-    muddled_path = Path(extracted_path, 'muddled')
+    try:
+        for target, target_info in manifest['targets'].items():
+            member_name = get_member_name(
+                manifest, target_info.get('alias', target))
 
-    if (manifest['target_type'] == 'file' and not muddled_path.is_file() or
-            manifest['target_type'] == 'dir' and not muddled_path.is_dir()):
+            if member_name not in member_names:
+                raise UnmuddleException('Invalid or corrupt muddled package.')
+    except BadZipFile:
         raise UnmuddleException('Invalid or corrupt muddled package.')
 
+
+def select_targets(manifest, patterns):
+    # Returns a copy of manifest restricted to the targets matching any of
+    # the glob patterns and to the sources those targets use. Patterns are
+    # matched as in #TARGETS config rules, with an optional leading '/'.
     if manifest['target_type'] == 'file':
-        with open(muddled_path, 'rb') as muddled_fp:
-            muddled_hash = hash_file_sha256(muddled_fp)
+        raise UnmuddleException(
+            'Targets can only be selected in packages with a \'dir\' target '
+            'type.')
 
-        if muddled_hash != manifest['targets']['/']['muddled_hash']:
-            raise UnmuddleException('Invalid or corrupt muddled package.')
+    patterns = [p[1:] if p.startswith('/') else p for p in patterns]
+    targets = []
 
-    else:
+    try:
         for target in manifest['targets']:
-            muddledf_path = Path(muddled_path, target)
-            with open(muddledf_path, 'rb') as muddled_fp:
-                muddled_hash = hash_file_sha256(muddled_fp)
+            if any(match_target_pattern(pattern, target)
+                   for pattern in patterns):
+                targets.append(target)
+    except BadZipFile:
+        raise UnmuddleException('Invalid or corrupt muddled package.')
 
-            if muddled_hash != manifest['targets'][target]['muddled_hash']:
-                raise UnmuddleException('Invalid or corrupt muddled package.')
+    if len(targets) == 0:
+        raise UnmuddleException('No targets match the given patterns.')
+
+    return restrict_targets(manifest, targets)
+
+
+def restrict_targets(manifest, targets):
+    # Returns a copy of manifest restricted to the given targets, which must
+    # all be in it, and to the sources those targets use.
+    try:
+        targets = {t: manifest['targets'][t] for t in targets}
+    except BadZipFile:
+        raise UnmuddleException('Invalid or corrupt muddled package.')
+
+    selected = dict(manifest)
+    selected['targets'] = targets
+
+    if manifest['source_type'] == 'dir':
+        sources = set()
+        for target_info in targets.values():
+            sources.update(target_info['sources'])
 
+        selected['sources'] = {s: manifest['sources'][s] for s in sources}
 
-def validate_sources(manifest, source_path):
+    return selected
+
+
+def get_keyless_error(target):
+    return UnmuddleException(
+        'Target {} can\'t be unmuddled with empty sources.'.format(
+            repr(target)))
+
+
+def check_target_keys(manifest):
+    # Checked before sources are hashed, since hashes of empty sources would
+    # match.
+    target = find_keyless_target(manifest)
+
+    if target is not None:
+        raise get_keyless_error(target)
+
+
+def validate_sources(manifest, source_path, jobs=1, hash_cache=None,
+                     stats=NULL_STATS):
     if manifest['source_type'] == 'file' and not source_path.is_file():
         raise UnmuddleException('Provided source is not a file.')
     if manifest['source_type'] == 'dir' and not source_path.is_dir():
         raise UnmuddleException('Provided source is not a directory.')
 
+    check_target_keys(manifest)
+
+    stats.expect('hash_sources',
+                 sum(s['size'] for s in manifest['sources'].values()),
+                 len(manifest['sources']))
+    advance = get_advance_callback(stats, 'hash_sources')
+
     if manifest['source_type'] == 'file':
-        with open(source_path, 'rb') as source_fp:
-            source_hash = hash_file_sha256(source_fp)
+        with stats.phase('hash_sources') as phase:
+            source_hash = next(iter_hash_paths_sha256(
+                [source_path], 1, hash_cache, advance))
+            phase.add(manifest['sources']['/']['size'], 1)
 
         if source_hash != manifest['sources']['/']['hash']:
             raise UnmuddleException('Invalid source file for muddled package.')
 
     else:
-        for source in manifest['sources']:
-            sourcef_path = Path(source_path, source)
-            with open(sourcef_path, 'rb') as source_fp:
-                source_hash = hash_file_sha256(source_fp)
+        sources = list(manifest['sources'])
+        sourcef_paths = [Path(source_path, s) for s in sources]
+        source_hashes = iter_hash_paths_sha256(sourcef_paths, jobs,
+                                               hash_cache, advance)
+
+        with stats.phase('hash_sources') as phase:
+            for source, source_hash in zip(sources, source_hashes):
+                if source_hash != manifest['sources'][source]['hash']:
+                    raise UnmuddleException(
+                        'Invalid source file for muddled package.')
 
-            if source_hash != manifest['sources'][source]['hash']:
-                raise UnmuddleException(
-                    'Invalid source file for muddled package.')
+                phase.add(manifest['sources'][source]['size'], 1)
 
 
-def generate_targets(manifest, source_path, extracted_path, target_path):
-    muddled_path = Path(extracted_path, 'muddled')
+def remove_target(targetf_path):
+    # Removes a target that couldn't be generated or doesn't match its hash,
+    # without hiding the error that made it bad.
+    try:
+        targetf_path.unlink()
+    except OSError:
+        pass
 
-    if manifest['target_type'] == 'file':
-        if manifest['source_type'] == 'file':
-            sources = [source_path]
-        else:
-            sources_sub = manifest['targets']['/']['sources']
-            sources = [Path(source_path, s) for s in sources_sub]
 
+def unmuddle_target(algorithm_version, package, member_name, targetf_path,
+                    sources, memory_budget=DEFAULT_MEMORY_BUDGET, jobs=1,
+                    compression=None, stats=NULL_STATS):
+    # Streams a muddled member out of the package into targetf_path and
+    # returns the hashes of the muddled content and of the generated target.
+    # If anything fails, the partly written target is removed.
+    targetf_path.parent.mkdir(parents=True, exist_ok=True)
+    target_opened = False
+
+    try:
         with ExitStack() as estack:
-            target_fp = estack.enter_context(open(target_path, 'wb'))
-            muddled_fp = estack.enter_context(open(muddled_path, 'rb'))
+            muddled_fp = HashingReader(
+                estack.enter_context(package.open(member_name, 'r')))
+            target_fp = HashingWriter(
+                estack.enter_context(open(targetf_path, 'wb')))
+            target_opened = True
             source_fps = open_files_in_stack(estack, sources, 'rb')
-            schain = SourceChain(source_fps)
-            muddler = Muddle_V1(schain)
-            muddler.muddle_file(muddled_fp, target_fp)
-    else:
-        for target in manifest['targets']:
+            muddler = new_muddler(algorithm_version, source_fps,
+                                  memory_budget, jobs, stats)
+            muddled_size = package.getinfo(member_name).file_size
+
+            if compression is not None:
+                output_fp = DecompressingWriter(target_fp, compression)
+                muddler.muddle_file(muddled_fp, output_fp, muddled_size)
+                output_fp.finish()
+            else:
+                muddler.muddle_file(muddled_fp, target_fp, muddled_size)
+    except BaseException:
+        if target_opened:
+            remove_target(targetf_path)
+        raise
+
+    return muddled_fp.hexdigest(), target_fp.hexdigest()
+
+
+_worker_package = None
+
+
+def _init_worker(package_path):
+    global _worker_package
+    _worker_package = ZipFile(package_path, 'r')
+
+
+def _unmuddle_task(stats, target, target_size, algorithm_version, package,
+                   *args):
+    with stats.phase('unmuddle', target) as phase:
+        hashes = unmuddle_target(algorithm_version, package, *args,
+                                 stats=stats)
+        phase.add(target_size, 1)
+
+    return hashes
+
+
+def _unmuddle_task_in_worker(collect_stats, target, target_size,
+                             algorithm_version, *args):
+    stats = Stats() if collect_stats else NULL_STATS
+    hashes = _unmuddle_task(stats, target, target_size, algorithm_version,
+                            _worker_package, *args)
+    return hashes, stats.to_dict() if collect_stats else None
+
+
+def check_target_hashes(target_info, targetf_path, hashes):
+    muddled_hash, target_hash = hashes
+
+    if muddled_hash != target_info['muddled_hash']:
+        remove_target(targetf_path)
+        raise UnmuddleException('Invalid or corrupt muddled package.')
+
+    if target_hash != target_info['hash']:
+        remove_target(targetf_path)
+        raise UnmuddleException(
+            'Target hash mismatch for file {}.'.format(repr(targetf_path)))
+
+
+def _run_unmuddle_tasks(manifest, package, tasks,
+                        memory_budget=DEFAULT_MEMORY_BUDGET, jobs=1,
+                        stats=NULL_STATS):
+    algorithm_version = manifest['algorithm_version']
+    compression = manifest.get('compression')
+
+    if manifest['target_type'] == 'file' or jobs <= 1:
+        for (target, target_info, member_name, targetf_path,
+                sources) in tasks:
+            hashes = _unmuddle_task(
+                stats, target, target_info['size'], algorithm_version,
+                package, member_name, targetf_path, sources, memory_budget,
+                jobs, compression)
+            check_target_hashes(target_info, targetf_path, hashes)
+        return
+
+    worker_budget = max(memory_budget // jobs, 1)
+    futures = []
+
+    with new_process_pool(jobs, initializer=_init_worker,
+                          initargs=(package.filename,)) as executor:
+        for (target, target_info, member_name, targetf_path,
+                sources) in sorted(tasks, key=lambda t: t[1]['size'],
+                                   reverse=True):
+            futures.append((target_info, targetf_path, executor.submit(
+                _unmuddle_task_in_worker, stats.enabled, target,
+                target_info['size'], algorithm_version, member_name,
+                targetf_path, sources, worker_budget, 1, compression)))
+
+        try:
+            for target_info, targetf_path, future in futures:
+                hashes, worker_stats = future.result()
+
+                if worker_stats is not None:
+                    stats.merge(worker_stats)
+
+                check_target_hashes(target_info, targetf_path, hashes)
+        except Exception:
+            for _, _, future in futures:
+                future.cancel()
+            raise
+
+
+def copy_alias_targets(copies, stats=NULL_STATS):
+    # Aliases have the same content as the target they are an alias of, so
+    # they are copied from it once it has been generated and checked.
+    for (target, target_info, targetf_path, alias_info,
+            aliasf_path) in copies:
+        if target_info['hash'] != alias_info['hash']:
+            raise UnmuddleException('Invalid or corrupt muddled package.')
+
+        with stats.phase('copy_alias', target) as phase:
+            targetf_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(aliasf_path, targetf_path)
+            phase.add(target_info['size'], 1)
+
+
+def generate_targets(manifest, source_path, package, target_path,
+                     memory_budget=DEFAULT_MEMORY_BUDGET, jobs=1,
+                     stats=NULL_STATS):
+    tasks = []
+    aliases = []
+
+    try:
+        for target, target_info in manifest['targets'].items():
             if manifest['source_type'] == 'file':
                 sources = [source_path]
             else:
-                sources_sub = manifest['targets'][target]['sources']
-                sources = [Path(source_path, s) for s in sources_sub]
+                sources = [Path(source_path, s)
+                           for s in target_info['sources']]
 
-            with ExitStack() as estack:
+            if manifest['target_type'] == 'file':
+                targetf_path = Path(target_path)
+            else:
                 targetf_path = Path(target_path, target)
-                muddledf_path = Path(muddled_path, target)
-                targetf_path.parent.mkdir(parents=True, exist_ok=True)
-                target_fp = estack.enter_context(open(targetf_path, 'wb'))
-                muddled_fp = estack.enter_context(open(muddledf_path, 'rb'))
-                source_fps = open_files_in_stack(estack, sources, 'rb')
-                schain = SourceChain(source_fps)
-                muddler = Muddle_V1(schain)
-                muddler.muddle_file(muddled_fp, target_fp)
 
+            if 'alias' in target_info:
+                aliases.append((target, target_info, targetf_path, sources))
+                continue
+
+            member_name = get_member_name(manifest, target)
+            tasks.append((target, target_info, member_name, targetf_path,
+                          sources))
+
+        # Aliases of targets that weren't selected are unmuddled from the
+        # member of the target they are an alias of instead of copied.
+        generated = {t[0]: (t[1], t[3]) for t in tasks}
+        copies = []
+
+        for target, target_info, targetf_path, sources in aliases:
+            alias = target_info['alias']
 
-def validate_targets(manifest, target_path):
+            if alias in generated:
+                copies.append((target, target_info, targetf_path) +
+                              generated[alias])
+            else:
+                tasks.append((target, target_info,
+                              get_member_name(manifest, alias),
+                              targetf_path, sources))
+
+        stats.expect('unmuddle', sum(t[1]['size'] for t in tasks),
+                     len(tasks))
+        _run_unmuddle_tasks(manifest, package, tasks, memory_budget, jobs,
+                            stats)
+        copy_alias_targets(copies, stats)
+    except (BadZipFile, DecompressionError):
+        raise UnmuddleException('Invalid or corrupt muddled package.')
+
+
+def validate_targets(manifest, target_path, jobs=1):
     # TODO: Also validate file size?
 
     if manifest['target_type'] == 'file':
@@ -149,42 +388,44 @@ def validate_targets(manifest, target_path):
                     'Target hash mismatch for file {}.'.format(
                         repr(target_path)))
     else:
-        for target, target_info in manifest['targets'].items():
-            targetf_path = Path(target_path, target)
-            with open(targetf_path, 'rb') as target_fp:
-                target_hash = hash_file_sha256(target_fp)
-                if target_hash != target_info['hash']:
-                    raise UnmuddleException(
-                        'Target hash mismatch for file {}.'.format(
-                            repr(targetf_path)))
+        targets = list(manifest['targets'].items())
+        targetf_paths = [Path(target_path, t) for t, _ in targets]
+        target_hashes = iter_hash_paths_sha256(targetf_paths, jobs)
 
+        for targetf_path, (target, target_info), target_hash in zip(
+                targetf_paths, targets, target_hashes):
+            if target_hash != target_info['hash']:
+                raise UnmuddleException(
+                    'Target hash mismatch for file {}.'.format(
+                        repr(targetf_path)))
 
-def unmuddle(src, muddled, trg):
+
+def unmuddle(src, muddled, trg, memory_budget=DEFAULT_MEMORY_BUDGET,
+             jobs=1, hash_cache=None, stats=None, only=None):
     source_path = Path(src)
     muddled_path = Path(muddled)
     target_path = Path(trg)
 
-    with TemporaryDirectory() as tmp_extracted:
-        extracted_path = Path(tmp_extracted)
-
-        extract_package(muddled_path, extracted_path)
+    if stats is None:
+        stats = NULL_STATS
 
-        try:
-            manifest_path = Path(tmp_extracted, 'manifest.json')
-            with open(manifest_path, 'r') as manifest_fp:
-                manifest = json.load(manifest_fp)
-        except Exception:
-            raise UnmuddleException('Invalid or corrupt muddled package.')
+    try:
+        package = ZipFile(muddled_path, 'r')
+    except Exception:
+        raise UnmuddleException('Invalid or corrupt muddled package.')
 
+    with package:
+        manifest = read_manifest(package)
         validate_manifest(manifest)
 
-        try:
-            validate_package(manifest, extracted_path)
-        except Exception:
-            raise UnmuddleException('Invalid or corrupt muddled package.')
+        # Only the selected targets and the sources they use are read.
+        if only is not None:
+            manifest = select_targets(manifest, only)
+
+        validate_package(manifest, package)
 
         try:
-            validate_sources(manifest, source_path)
+            validate_sources(manifest, source_path, jobs, hash_cache, stats)
         except FileNotFoundError as e:
             raise UnmuddleException(
                 'Could not read source file {}'.format(repr(e.filename)))
@@ -192,5 +433,215 @@ def unmuddle(src, muddled, trg):
             raise UnmuddleException(
                 'Could not read source file {}'.format(repr(e.filename)))
 
-        generate_targets(manifest, source_path, tmp_extracted, target_path)
-        validate_targets(manifest, target_path)
+        # Targets are hashed as they are written, so they don't need to be
+        # read back with validate_targets.
+        generate_targets(manifest, source_path, package, target_path,
+                         memory_budget, jobs, stats)
+
+
+class _ChunkBuffer(object):
+    # Collects data written by a DecompressingWriter until it is drained.
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, buf):
+        self._chunks.append(bytes(buf))
+        return len(buf)
+
+    def drain(self):
+        chunks = self._chunks
+        self._chunks = []
+        return chunks
+
+
+def _iter_target_chunks(muddler, muddled_fp, muddled_size, compression):
+    if compression is None:
+        yield from muddler.iter_muddle(muddled_fp, muddled_size)
+        return
+
+    chunk_buffer = _ChunkBuffer()
+    output_fp = DecompressingWriter(chunk_buffer, compression)
+
+    for chunk in muddler.iter_muddle(muddled_fp, muddled_size):
+        output_fp.write(chunk)
+        yield from chunk_buffer.drain()
+
+    output_fp.finish()
+    yield from chunk_buffer.drain()
+
+
+def _open_source_stream(estack, source, hash_cache, progress=None):
+    # Returns a binary stream over source and its hash. Sources given as
+    # paths are opened and, with a hash cache, only hashed again when they
+    # changed.
+    if not isinstance(source, (str, os.PathLike)):
+        source_fp = as_stream(source)
+        source_fp.seek(0, 0)
+        return source_fp, hash_file_sha256(source_fp, progress=progress)
+
+    try:
+        source_fp = estack.enter_context(open(source, 'rb'))
+
+        if hash_cache is not None:
+            return source_fp, hash_cache.hash_path_sha256(source, progress)
+
+        return source_fp, hash_file_sha256(source_fp, progress=progress)
+    except OSError:
+        raise UnmuddleException(
+            'Could not read source file {}'.format(repr(os.fspath(source))))
+
+
+def _open_source_streams(estack, manifest, sources, hash_cache, stats):
+    # Maps the source names of manifest to binary streams over the given
+    # sources, checking their hashes against the manifest.
+    if manifest['source_type'] == 'file':
+        sources = {'/': sources}
+
+    check_target_keys(manifest)
+    source_fps = {}
+    stats.expect('hash_sources',
+                 sum(s['size'] for s in manifest['sources'].values()),
+                 len(manifest['sources']))
+    advance = get_advance_callback(stats, 'hash_sources')
+
+    with stats.phase('hash_sources') as phase:
+        for source in manifest['sources']:
+            if source not in sources:
+                raise UnmuddleException(
+                    'Missing source {}.'.format(repr(source)))
+
+            source_fp, source_hash = _open_source_stream(
+                estack, sources[source], hash_cache,
+                None if advance is None else partial(advance, source))
+
+            if source_hash != manifest['sources'][source]['hash']:
+                raise UnmuddleException(
+                    'Invalid source file for muddled package.')
+
+            source_fps[source] = source_fp
+            phase.add(manifest['sources'][source]['size'], 1)
+
+    return source_fps
+
+
+def iter_unmuddled_chunks(manifest, package, target, source_fps,
+                          memory_budget, stats):
+    # Yields the unmuddled content of target in chunks, which may share a
+    # single buffer, and checks its hashes once all of it has been read.
+    target_info = manifest['targets'][target]
+    member_name = get_member_name(manifest, target_info.get('alias', target))
+    target_hash = hashlib.sha256()
+
+    if manifest['source_type'] == 'file':
+        target_source_fps = [source_fps['/']]
+    else:
+        target_source_fps = [source_fps[s] for s in target_info['sources']]
+
+    try:
+        with package.open(member_name, 'r') as member_fp, \
+                stats.phase('unmuddle', target) as phase:
+            muddled_fp = HashingReader(member_fp)
+            muddler = new_muddler(manifest['algorithm_version'],
+                                  target_source_fps, memory_budget, 1, stats)
+
+            muddled_size = package.getinfo(member_name).file_size
+
+            for chunk in _iter_target_chunks(muddler, muddled_fp,
+                                             muddled_size,
+                                             manifest.get('compression')):
+                target_hash.update(chunk)
+                phase.add(len(chunk))
+                yield chunk
+
+            phase.add(files=1)
+    except (BadZipFile, DecompressionError):
+        raise UnmuddleException('Invalid or corrupt muddled package.')
+
+    if muddled_fp.hexdigest() != target_info['muddled_hash']:
+        raise UnmuddleException('Invalid or corrupt muddled package.')
+
+    if target_hash.hexdigest() != target_info['hash']:
+        raise UnmuddleException(
+            'Target hash mismatch for target {}.'.format(repr(target)))
+
+
+def _iter_package_targets(sources, package, targets, memory_budget,
+                          hash_cache, stats, file_only=False):
+    # With file_only, packages with a 'dir' target type are rejected before
+    # any source is read.
+    if stats is None:
+        stats = NULL_STATS
+
+    try:
+        package = ZipFile(as_stream(package), 'r')
+    except Exception:
+        raise UnmuddleException('Invalid or corrupt muddled package.')
+
+    with package, ExitStack() as estack:
+        manifest = read_manifest(package)
+        validate_manifest(manifest)
+
+        if file_only and manifest['target_type'] != 'file':
+            raise UnmuddleException(
+                'A target must be given for directory packages.')
+
+        if targets is None:
+            targets = list(manifest['targets'])
+        else:
+            for target in targets:
+                if target not in manifest['targets']:
+                    raise UnmuddleException(
+                        'Unknown target {}.'.format(repr(target)))
+
+            # Only the requested targets and the sources they use are
+            # checked and read.
+            if manifest['target_type'] == 'dir':
+                manifest = restrict_targets(manifest, targets)
+
+        validate_package(manifest, package)
+        source_fps = _open_source_streams(estack, manifest, sources,
+                                          hash_cache, stats)
+
+        for target in targets:
+            yield target, iter_unmuddled_chunks(
+                manifest, package, target, source_fps, memory_budget, stats)
+
+
+def iter_unmuddled_targets(sources, package, targets=None,
+                           memory_budget=DEFAULT_MEMORY_BUDGET, stats=None,
+                           hash_cache=None):
+    # Unmuddles a package without touching the file system. package is a
+    # seekable binary stream or bytes-like object. sources is a single
+    # seekable binary stream or bytes-like object for packages with a 'file'
+    # source type, and maps source names to those otherwise. Sources may
+    # also be given as paths, which are hashed through hash_cache when one
+    # is given. Only the sources used by the requested targets are needed.
+    #
+    # Yields (target, chunks) pairs for the given targets (all of them by
+    # default), where chunks is an iterator over the target's unmuddled
+    # content as bytes. Each target's chunks must be consumed before moving
+    # on to the next target. UnmuddleException is raised once the last chunk
+    # has been read if the target doesn't match its hash.
+    for target, chunks in _iter_package_targets(sources, package, targets,
+                                                memory_budget, hash_cache,
+                                                stats):
+        yield target, (bytes(chunk) for chunk in chunks)
+
+
+def unmuddle_to_stream(sources, package, output, target=None,
+                       memory_budget=DEFAULT_MEMORY_BUDGET, stats=None,
+                       hash_cache=None):
+    # Unmuddles a single target of a package (see iter_unmuddled_targets())
+    # into the binary file-like object output. target may be omitted for
+    # packages with a 'file' target type. If an exception is raised, the
+    # data already written to output must be discarded.
+    targets = None if target is None else [target]
+
+    for _, chunks in _iter_package_targets(
+            sources, package, targets, memory_budget, hash_cache, stats,
+            target is None):
+        for chunk in chunks:
+            output.write(chunk)
+
+
+make_module_callable(__name__)
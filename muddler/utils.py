@@ -21,26 +21,397 @@
 # SOFTWARE.
 
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import hashlib
+import importlib.util
+import io
+import mmap
+import os
+import shutil
+import stat
+import sys
+import types
+import zipfile
+
+# numpy takes longer to import than the rest of muddler, so it is only
+# imported once something is XORed with it.
+numpy = None
 
 
 DEFAULT_BLOCK_SIZE = 65536
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+MAPPED_BLOCK_SIZE = 1024 * 1024
 
 
-def hash_file_sha256(fp, block_size=DEFAULT_BLOCK_SIZE):
-    m = hashlib.sha256()
+def as_stream(data):
+    # Wraps bytes-like data in an in-memory binary stream. File-like objects
+    # are returned as is.
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return io.BytesIO(data)
+
+    return data
+
+
+def get_stream_size(fp):
+    # Size of a binary stream, from its file descriptor when it has one and
+    # by seeking to its end otherwise.
+    try:
+        return os.fstat(fp.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        pos = fp.tell()
+        size = fp.seek(0, 2)
+        fp.seek(pos, 0)
+        return size
+
+
+def get_remaining_size(fp):
+    # Number of bytes left to read from fp, or None when that can't be told
+    # without reading it (eg pipes, zip members or compressed streams).
+    if isinstance(fp, io.BytesIO):
+        with fp.getbuffer() as buf:
+            return max(len(buf) - fp.tell(), 0)
+
+    try:
+        fstat = os.fstat(fp.fileno())
+        if not stat.S_ISREG(fstat.st_mode):
+            return None
+        return max(fstat.st_size - fp.tell(), 0)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def initial_chunk_size(max_chunk_size, alignment):
+    # Chunk buffers start small and grow up to max_chunk_size (see
+    # grow_chunk_buffer) so that small inputs don't pay for allocating
+    # buffers sized for the whole memory budget.
+    chunk_size = max(DEFAULT_BLOCK_SIZE - DEFAULT_BLOCK_SIZE % alignment,
+                     alignment)
+    return min(chunk_size, max_chunk_size)
+
+
+def grow_chunk_buffer(view, max_chunk_size):
+    # Sizes stay multiples of the initial size, and so keep its alignment.
+    if len(view) * 2 > max_chunk_size:
+        return view
+
+    return memoryview(bytearray(len(view) * 2))
+
+
+def map_file(fp):
+    # Returns a read-only memory map of fp, or None if fp can't be mapped
+    # (eg pipes, in-memory files, zip members or empty files).
+    try:
+        fileno = fp.fileno()
+        fstat = os.fstat(fileno)
+
+        if not stat.S_ISREG(fstat.st_mode) or fstat.st_size == 0:
+            return None
+
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class MappedReader(object):
+    # Reads a regular file through a memory map instead of read() calls,
+    # starting at the current position of fp.
+    def __init__(self, fp, mapping):
+        self._fp = fp
+        self._mapping = mapping
+        self._view = memoryview(mapping)
+        self._pos = fp.tell()
+
+    def fileno(self):
+        return self._fp.fileno()
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += len(self._view)
+
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._view)
 
+        buf = bytes(self._view[self._pos:self._pos+size])
+        self._pos += len(buf)
+        return buf
+
+    def readinto(self, buf):
+        view = memoryview(buf).cast('B')
+        chunk = self._view[self._pos:self._pos+len(view)]
+        view[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def close(self):
+        self._view.release()
+        self._mapping.close()
+
+
+def open_mapped_reader(fp):
+    # Falls back to fp itself when it can't be mapped.
+    mapping = map_file(fp)
+
+    if mapping is None:
+        return fp
+
+    return MappedReader(fp, mapping)
+
+
+def update_hash_from_file(m, fp, block_size=DEFAULT_BLOCK_SIZE,
+                          progress=None):
+    # Feeds the rest of fp to hash object m, straight from a memory map when
+    # fp is a regular file. progress, if given, is called with the number of
+    # bytes hashed so far about every MAPPED_BLOCK_SIZE bytes.
+    mapping = map_file(fp)
+
+    if mapping is not None:
+        with mapping, memoryview(mapping) as view:
+            start = fp.tell()
+            for offset in range(start, len(view), MAPPED_BLOCK_SIZE):
+                m.update(view[offset:offset+MAPPED_BLOCK_SIZE])
+                if progress is not None:
+                    progress(min(offset + MAPPED_BLOCK_SIZE, len(view)) -
+                             start)
+        fp.seek(0, 2)
+        return
+
+    hashed = 0
+    reported = 0
     buf = fp.read(block_size)
 
     while len(buf) > 0:
         m.update(buf)
+        hashed += len(buf)
+        if progress is not None and hashed - reported >= MAPPED_BLOCK_SIZE:
+            progress(hashed)
+            reported = hashed
         buf = fp.read(block_size)
 
+
+def hash_file_sha256(fp, block_size=DEFAULT_BLOCK_SIZE, progress=None):
+    m = hashlib.sha256()
+    update_hash_from_file(m, fp, block_size, progress)
     return m.hexdigest()
 
 
+def hash_path_sha256(path, block_size=DEFAULT_BLOCK_SIZE, progress=None):
+    with open(path, 'rb') as fp:
+        return hash_file_sha256(fp, block_size, progress)
+
+
+def iter_hash_paths_sha256(paths, jobs=1, hash_cache=None, progress=None):
+    # Yields the hashes of paths in order. With jobs > 1, files are hashed
+    # concurrently on a thread pool (hashlib releases the GIL while hashing
+    # large buffers). progress, if given, is called with a path and the
+    # number of bytes of it hashed so far (see update_hash_from_file()).
+    if hash_cache is not None:
+        path_hash_func = hash_cache.hash_path_sha256
+    else:
+        path_hash_func = hash_path_sha256
+
+    def hash_func(path):
+        if progress is None:
+            return path_hash_func(path)
+
+        return path_hash_func(path, progress=partial(progress, path))
+
+    if jobs <= 1:
+        for path in paths:
+            yield hash_func(path)
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(hash_func, paths)
+
+
+class _CallableModule(types.ModuleType):
+    def __call__(self, *args, **kwargs):
+        function_name = self.__name__.rpartition('.')[2]
+        return getattr(self, function_name)(*args, **kwargs)
+
+
+def make_module_callable(name):
+    # Lets module name be called as the function it defines under its own
+    # name. Importing muddler.muddle binds the module as muddler.muddle, which
+    # used to be the muddle() function, so it's kept working when called.
+    sys.modules[name].__class__ = _CallableModule
+
+
+def new_process_pool(max_workers, **kwargs):
+    # Pulls in multiprocessing only when there are several jobs to run, which
+    # keeps it out of start-up and single job runs.
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(max_workers=max_workers, **kwargs)
+
+
+def _import_numpy():
+    global numpy
+
+    if numpy is None:
+        import numpy
+
+    return numpy
+
+
+def _xor_into_numpy(target, source):
+    size = len(source)
+
+    if size == 0:
+        return
+
+    numpy = _import_numpy()
+
+    trg_arr = numpy.frombuffer(target, dtype=numpy.uint8, count=size)
+    src_arr = numpy.frombuffer(source, dtype=numpy.uint8, count=size)
+    numpy.bitwise_xor(trg_arr, src_arr, out=trg_arr)
+
+
+def _xor_into_int(target, source):
+    size = len(source)
+
+    if size == 0:
+        return
+
+    target_view = memoryview(target).cast('B')[:size]
+    value = (int.from_bytes(target_view, 'little') ^
+             int.from_bytes(source, 'little'))
+    target_view[:] = value.to_bytes(size, 'little')
+
+
+XOR_BACKENDS = {
+    'int': _xor_into_int,
+}
+
+if importlib.util.find_spec('numpy') is not None:
+    XOR_BACKENDS['numpy'] = _xor_into_numpy
+    _xor_backend = 'numpy'
+else:
+    _xor_backend = 'int'
+
+
+def get_xor_backend():
+    return _xor_backend
+
+
+def set_xor_backend(name):
+    global _xor_backend
+
+    if name not in XOR_BACKENDS:
+        raise ValueError('Unknown XOR backend {}.'.format(repr(name)))
+
+    _xor_backend = name
+
+
+def xor_into(target, source):
+    # XORs source into the first len(source) bytes of target in place.
+    XOR_BACKENDS[_xor_backend](target, source)
+
+
 def xor_bytes(bstr1, bstr2):
-    return bytes([_a ^ _b for _a, _b in zip(bstr1, bstr2)])
+    size = min(len(bstr1), len(bstr2))
+    buf = bytearray(memoryview(bstr1).cast('B')[:size])
+    xor_into(buf, memoryview(bstr2).cast('B')[:size])
+    return bytes(buf)
+
+
+def readinto_full(fp, buf):
+    # Like fp.readinto(buf) but keeps reading until buf is full or EOF is
+    # reached.
+    view = memoryview(buf).cast('B')
+    size = len(view)
+    filled = 0
+
+    while filled < size:
+        if hasattr(fp, 'readinto'):
+            read_len = fp.readinto(view[filled:])
+        else:
+            block = fp.read(size - filled)
+            read_len = len(block)
+            view[filled:filled+read_len] = block
+
+        if not read_len:
+            break
+
+        filled += read_len
+
+    return filled
+
+
+class HashingReader(object):
+    # Wraps a binary file opened for reading and hashes everything read
+    # through it.
+    def __init__(self, fp):
+        self._fp = fp
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        buf = self._fp.read(size)
+        self._hash.update(buf)
+        self.size += len(buf)
+        return buf
+
+    def readinto(self, buf):
+        read_len = readinto_full(self._fp, buf)
+        self._hash.update(memoryview(buf).cast('B')[:read_len])
+        self.size += read_len
+        return read_len
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+class HashingWriter(object):
+    # Wraps a binary file opened for writing and hashes everything written
+    # through it.
+    def __init__(self, fp):
+        self._fp = fp
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, buf):
+        self._hash.update(buf)
+        self.size += len(buf)
+        return self._fp.write(buf)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+def get_member_name(manifest, target):
+    if manifest['target_type'] == 'file':
+        return 'muddled'
+    else:
+        return 'muddled/' + target
+
+
+def copy_zip_member(src_package, member_name, dst_package,
+                    block_size=DEFAULT_BLOCK_SIZE):
+    # Copies a member from one ZipFile to another, keeping its timestamp and
+    # attributes. Muddled members are stored uncompressed, so streaming them
+    # through costs about as much as copying their raw data, and their CRC is
+    # checked along the way.
+    src_info = src_package.getinfo(member_name)
+    dst_info = zipfile.ZipInfo(member_name, src_info.date_time)
+    dst_info.compress_type = src_info.compress_type
+    dst_info.external_attr = src_info.external_attr
+    # Lets ZipFile.open() know up front whether ZIP64 is needed.
+    dst_info.file_size = src_info.file_size
+
+    with src_package.open(src_info, 'r') as src_fp, \
+            dst_package.open(dst_info, 'w') as dst_fp:
+        shutil.copyfileobj(src_fp, dst_fp, block_size)
 
 
 def open_files_in_stack(stack, paths, mode):
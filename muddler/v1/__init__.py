@@ -21,35 +21,147 @@
 # SOFTWARE.
 
 
-from ..utils import xor_bytes
+from contextlib import nullcontext
+from tempfile import SpooledTemporaryFile
+
+from ..stats import NULL_STATS
+from ..utils import DEFAULT_MEMORY_BUDGET, get_remaining_size
+from ..utils import grow_chunk_buffer, initial_chunk_size, readinto_full
+from ..utils import xor_into
 
 
 BLOCK_SIZE = 1024
 
 
 class Muddle_V1(object):
-    def __init__(self, source_chain, block_size=BLOCK_SIZE):
+    def __init__(self, source_chain, block_size=BLOCK_SIZE,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, stats=None):
         self._source_chain = source_chain
         self._block_size = block_size
+        self._memory_budget = memory_budget
+        self._stats = NULL_STATS if stats is None else stats
+
+    def _chunk_size(self):
+        # A quarter of the budget goes to each of the working and key stream
+        # buffers and half to the wrap-around buffer. Chunks must stay
+        # aligned to the block size so that the key stream matches the one
+        # produced block by block.
+        chunk_size = max(self._memory_budget // 4, self._block_size)
+        return chunk_size - chunk_size % self._block_size
+
+    def _xor_key_stream(self, view, key_view):
+        key_view = key_view[:len(view)]
+        self._source_chain.readinto(key_view, self._block_size)
 
-    def muddle_file(self, input_fp, output_fp):
+        with self._stats.phase('xor') as phase:
+            xor_into(view, key_view)
+            phase.add(len(view))
+
+    def _wrap_around(self, head, head_size, mbytes, view, key_view):
+        # When the source is larger than the target, the key stream wraps
+        # around the target and is XORed into it again until the whole source
+        # has been consumed.
+        chunk_size = len(view)
+
+        while mbytes > 0:
+            pass_size = min(mbytes, head_size)
+
+            for offset in range(0, pass_size, chunk_size):
+                chunk_len = min(chunk_size, pass_size - offset)
+                chunk = view[:chunk_len]
+                head.seek(offset)
+                readinto_full(head, chunk)
+                self._xor_key_stream(chunk, key_view)
+                head.seek(offset)
+                head.write(chunk)
+
+            mbytes -= pass_size
+
+    def iter_muddle(self, input_fp, input_size=None):
+        # Yields the muddled content of input_fp in chunks. Yielded chunks
+        # share a single buffer and are only valid until the next iteration.
+        # input_size is the number of bytes left in input_fp, when known.
         self._block_size = max(self._block_size, 1)
         self._source_chain.reset()
-        buf = bytearray(input_fp.read())
-        buf_size = len(buf)
         key_size = self._source_chain.size
-        mbytes = max(buf_size, key_size)
-        buf_ndx = 0
+        max_chunk_size = self._chunk_size()
+        view = memoryview(bytearray(
+            initial_chunk_size(max_chunk_size, self._block_size)))
+        key_view = memoryview(bytearray(len(view)))
+        buf_size = 0
+        chunk_len = 0
 
-        while mbytes > 0:
-            buf_left = buf_size - buf_ndx
-            key_len = min(mbytes, self._block_size, buf_left)
-            key_block = self._source_chain.read_block(key_len)
+        if input_size is None:
+            input_size = get_remaining_size(input_fp)
+
+        # Muddled bytes are held back until the target is known to be at
+        # least as large as the source, since they might still need to be
+        # XORed with the wrapped-around key stream. When the size of the
+        # target is known up front, that is only needed if it is smaller.
+        if input_size is not None and input_size >= key_size:
+            head_context = nullcontext()
+        else:
+            head_context = SpooledTemporaryFile(
+                max_size=max(self._memory_budget // 2, 1))
+
+        with head_context as head:
+            head_size = 0
+
+            while True:
+                if chunk_len == len(view):
+                    view = grow_chunk_buffer(view, max_chunk_size)
+                    key_view = grow_chunk_buffer(key_view, max_chunk_size)
+
+                with self._stats.phase('read_input') as phase:
+                    chunk_len = readinto_full(input_fp, view)
+                    phase.add(chunk_len)
+
+                if chunk_len == 0:
+                    break
+
+                chunk = view[:chunk_len]
+                self._xor_key_stream(chunk, key_view)
+                buf_size += chunk_len
+
+                if head is None:
+                    yield chunk
+                    continue
+
+                with self._stats.phase('spool') as phase:
+                    head.write(chunk)
+                    phase.add(chunk_len)
+
+                head_size += chunk_len
+
+                if buf_size >= key_size:
+                    yield from self._iter_head(head, view)
+                    head = None
+
+            if head is not None:
+                if head_size > 0:
+                    with self._stats.phase('wrap_around') as phase:
+                        self._wrap_around(head, head_size,
+                                          key_size - buf_size, view,
+                                          key_view)
+                        phase.add(key_size - buf_size)
+                yield from self._iter_head(head, view)
+            elif buf_size < key_size:
+                # The output already streamed out can't be wrapped around
+                # anymore.
+                raise OSError('Input ended after {} of {} bytes.'.format(
+                    buf_size, input_size))
 
-            buf_block = buf[buf_ndx:buf_ndx+key_len]
-            buf[buf_ndx:buf_ndx+key_len] = xor_bytes(key_block, buf_block)
+    def _iter_head(self, head, view):
+        head.seek(0)
 
-            buf_ndx = (buf_ndx + key_len) % buf_size
-            mbytes -= key_len
+        while True:
+            chunk_len = readinto_full(head, view)
+            if chunk_len == 0:
+                break
+            yield view[:chunk_len]
 
-        output_fp.write(buf)
+    def muddle_file(self, input_fp, output_fp, input_size=None):
+        for chunk in self.iter_muddle(input_fp, input_size):
+            with self._stats.phase('write_output') as phase:
+                output_fp.write(chunk)
+                phase.add(len(chunk))
@@ -22,58 +22,112 @@
 
 
 import hashlib
-import os
+
+from ..stats import NULL_STATS
+from ..utils import get_stream_size, open_mapped_reader, readinto_full
 
 
 class SourceChain(object):
-    def __init__(self, source_fps):
-        self._fps = source_fps.copy()
-        self._key_size = sum([
-            os.fstat(kfp.fileno()).st_size for kfp in self._fps])
+    def __init__(self, source_fps, stats=None):
+        # Sources that are regular files are read through memory maps.
+        self._fps = [open_mapped_reader(kfp) for kfp in source_fps]
+        self._stats = NULL_STATS if stats is None else stats
+        self._key_size = sum([get_stream_size(kfp) for kfp in self._fps])
         self.reset()
 
     def reset(self):
         self._cur_file_ndx = 0
-        self._hash = hashlib.new('sha512')
+        self._key_pos = 0
+        self._hash = hashlib.sha512()
 
         for kfp in self._fps:
             kfp.seek(0, 0)
 
-    def read_block(self, block_size):
-        if block_size <= 0:
-            return b''
+    def _read_source_into(self, view):
+        if self._key_size == 0:
+            raise ValueError('Cannot read from an empty source chain.')
 
-        buf = bytearray(block_size)
-        buf_filled = 0
+        size = len(view)
+        filled = 0
+
+        while True:
+            kfp = self._fps[self._cur_file_ndx]
+            filled += readinto_full(kfp, view[filled:])
 
-        block = self._fps[self._cur_file_ndx].read(block_size)
-        buf[0:len(block)] = block
-        buf_filled += len(block)
+            if filled >= size:
+                break
 
-        while buf_filled < block_size:
             self._cur_file_ndx += 1
             if self._cur_file_ndx >= len(self._fps):
-                self.reset()
-
-            to_read = block_size - buf_filled
-            block = self._fps[self._cur_file_ndx].read(to_read)
-            blen = len(block)
-            buf[buf_filled: buf_filled + blen] = block
-            buf_filled += blen
-
-        dsize = self._hash.digest_size
-        cur_ndx = 0
-
-        while cur_ndx < block_size:
-            bleft = block_size - cur_ndx
-            if bleft >= dsize:
-                self._hash.update(buf[cur_ndx:cur_ndx+dsize])
-                buf[cur_ndx:cur_ndx+dsize] = self._hash.digest()
-                cur_ndx += dsize
+                self._cur_file_ndx = 0
+                for kfp in self._fps:
+                    kfp.seek(0, 0)
+
+    def readinto(self, buf, block_size=None):
+        # Fills buf with the key stream that successive calls to
+        # read_block(block_size) would produce. Only the last block may be
+        # shorter than block_size.
+        view = memoryview(buf).cast('B')
+        size = len(view)
+
+        if size == 0:
+            return 0
+
+        if block_size is None or block_size <= 0:
+            block_size = size
+
+        with self._stats.phase('read_sources') as phase:
+            self._read_source_into(view)
+            phase.add(size)
+
+        with self._stats.phase('key_stream') as phase:
+            self._hash_blocks(view, block_size)
+            phase.add(size)
+
+        return size
+
+    def _hash_blocks(self, view, block_size):
+        # Replaces the source bytes in view with their key stream.
+        size = len(view)
+        key_size = self._key_size
+        key_pos = self._key_pos
+        hsh = self._hash
+        dsize = hsh.digest_size
+
+        for block_start in range(0, size, block_size):
+            block_end = min(block_start + block_size, size)
+            block_len = block_end - block_start
+
+            # The hash is reset every time a block wraps around the source.
+            if key_pos + block_len > key_size:
+                hsh = hashlib.sha512()
+                key_pos = (key_pos + block_len - 1) % key_size + 1
             else:
-                self._hash.update(buf[cur_ndx:])
-                buf[cur_ndx:] = self._hash.digest()[:bleft]
-                cur_ndx += bleft
+                key_pos += block_len
+
+            update = hsh.update
+            digest = hsh.digest
+            full_end = block_end - block_len % dsize
+
+            for ndx in range(block_start, full_end, dsize):
+                chunk = view[ndx:ndx+dsize]
+                update(chunk)
+                chunk[:] = digest()
+
+            if full_end < block_end:
+                chunk = view[full_end:block_end]
+                update(chunk)
+                chunk[:] = digest()[:block_end - full_end]
+
+        self._hash = hsh
+        self._key_pos = key_pos
+
+    def read_block(self, block_size):
+        if block_size <= 0:
+            return b''
+
+        buf = bytearray(block_size)
+        self.readinto(buf)
 
         return bytes(buf)
 
@@ -0,0 +1,142 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from collections import deque
+import os
+
+from ..stats import NULL_STATS
+from ..utils import DEFAULT_MEMORY_BUDGET, grow_chunk_buffer
+from ..utils import initial_chunk_size, new_process_pool, readinto_full
+from ..utils import xor_into
+from .key_stream import CounterKeyStream, SEGMENT_SIZE
+
+
+def _read_key_stream(seed, offset, size):
+    # Only the key stream goes through the worker processes. The input is
+    # read and XORed in the main process, so that chunks don't have to be
+    # sent to a worker and back.
+    key_buf = bytearray(size)
+    CounterKeyStream(seed=seed).readinto(key_buf, offset)
+    return key_buf
+
+
+class Muddle_V2(object):
+    def __init__(self, key_stream, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 jobs=1, stats=None):
+        self._key_stream = key_stream
+        self._memory_budget = memory_budget
+        # Extra worker processes only add overhead once every core is busy.
+        self._jobs = max(min(jobs, os.cpu_count() or 1), 1)
+        self._stats = NULL_STATS if stats is None else stats
+
+    def _chunk_size(self):
+        # With jobs > 1, up to two chunks per worker are in flight, each of
+        # which is held once as input and once as output.
+        chunk_size = max(self._memory_budget // (4 * self._jobs),
+                         SEGMENT_SIZE)
+        return chunk_size - chunk_size % SEGMENT_SIZE
+
+    def iter_muddle(self, input_fp, input_size=None, offset=0):
+        # Yields the muddled content of input_fp, starting at key stream
+        # offset `offset`, in chunks. Yielded chunks may share a single
+        # buffer and are only valid until the next iteration. Version 2
+        # streams whatever the size of the input, so input_size is only
+        # accepted for compatibility with Muddle_V1.
+        if self._jobs > 1:
+            yield from self._iter_muddle_parallel(input_fp, offset)
+            return
+
+        max_chunk_size = self._chunk_size()
+        view = memoryview(bytearray(
+            initial_chunk_size(max_chunk_size, SEGMENT_SIZE)))
+        key_view = memoryview(bytearray(len(view)))
+        chunk_len = 0
+
+        while True:
+            if chunk_len == len(view):
+                view = grow_chunk_buffer(view, max_chunk_size)
+                key_view = grow_chunk_buffer(key_view, max_chunk_size)
+
+            with self._stats.phase('read_input') as phase:
+                chunk_len = readinto_full(input_fp, view)
+                phase.add(chunk_len)
+
+            if chunk_len == 0:
+                break
+
+            chunk = view[:chunk_len]
+            chunk_key = key_view[:chunk_len]
+
+            with self._stats.phase('key_stream') as phase:
+                self._key_stream.readinto(chunk_key, offset)
+                phase.add(chunk_len)
+
+            with self._stats.phase('xor') as phase:
+                xor_into(chunk, chunk_key)
+                phase.add(chunk_len)
+
+            offset += chunk_len
+
+            yield chunk
+
+    def _iter_muddle_parallel(self, input_fp, offset):
+        chunk_size = self._chunk_size()
+        seed = self._key_stream.seed
+        pending = deque()
+        eof = False
+
+        with new_process_pool(self._jobs) as executor:
+            while True:
+                if not eof:
+                    chunk = bytearray(chunk_size)
+
+                    with self._stats.phase('read_input') as phase:
+                        chunk_len = readinto_full(input_fp, chunk)
+                        phase.add(chunk_len)
+
+                    if chunk_len > 0:
+                        del chunk[chunk_len:]
+                        pending.append((chunk, executor.submit(
+                            _read_key_stream, seed, offset, chunk_len)))
+                        offset += chunk_len
+                    else:
+                        eof = True
+
+                if len(pending) == 0:
+                    break
+
+                if eof or len(pending) >= 2 * self._jobs:
+                    chunk, future = pending.popleft()
+                    chunk_key = future.result()
+
+                    with self._stats.phase('xor') as phase:
+                        xor_into(chunk, chunk_key)
+                        phase.add(len(chunk))
+
+                    yield chunk
+
+    def muddle_file(self, input_fp, output_fp, input_size=None):
+        for chunk in self.iter_muddle(input_fp, input_size):
+            with self._stats.phase('write_output') as phase:
+                output_fp.write(chunk)
+                phase.add(len(chunk))
@@ -0,0 +1,81 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+
+from ..utils import DEFAULT_BLOCK_SIZE, update_hash_from_file
+
+
+SEGMENT_SIZE = 4096
+SEED_PREFIX = b'muddler-v2'
+
+
+def hash_file_sha512(fp, block_size=DEFAULT_BLOCK_SIZE):
+    m = hashlib.sha512()
+    fp.seek(0, 0)
+    update_hash_from_file(m, fp, block_size)
+    return m.digest()
+
+
+def compute_seed(source_fps):
+    seed = hashlib.sha512(SEED_PREFIX)
+
+    for kfp in source_fps:
+        seed.update(hash_file_sha512(kfp))
+
+    return seed.digest()
+
+
+class CounterKeyStream(object):
+    # Key stream segment i is the first SEGMENT_SIZE bytes of
+    # SHAKE-256(seed || i), where i is a 64-bit big-endian counter and the
+    # seed is a SHA-512 digest of the SHA-512 digests of all sources. Each
+    # segment is independent of the others, so any byte range of the key
+    # stream can be computed directly.
+
+    def __init__(self, source_fps=None, seed=None):
+        if seed is None:
+            seed = compute_seed(source_fps)
+
+        self._seed = seed
+        self._base = hashlib.shake_256(seed)
+
+    def readinto(self, buf, offset):
+        view = memoryview(buf).cast('B')
+        size = len(view)
+        filled = 0
+
+        while filled < size:
+            seg_ndx, seg_start = divmod(offset + filled, SEGMENT_SIZE)
+            seg_len = min(SEGMENT_SIZE - seg_start, size - filled)
+            seg_hash = self._base.copy()
+            seg_hash.update(seg_ndx.to_bytes(8, 'big'))
+            segment = seg_hash.digest(seg_start + seg_len)
+            view[filled:filled+seg_len] = memoryview(segment)[seg_start:]
+            filled += seg_len
+
+        return size
+
+    @property
+    def seed(self):
+        return self._seed
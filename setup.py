@@ -57,6 +57,10 @@ INSTALL_REQUIRES = [
     'docopt',
 ]
 
+EXTRAS_REQUIRE = {
+    'numpy': ['numpy'],
+}
+
 setup(
     name='muddler',
     version=VERSION,
@@ -64,7 +68,7 @@ setup(
     author_email='oobeid@nyu.edu',
     maintainer='Ossama W. Obeid',
     maintainer_email='oobeid@nyu.edu',
-    packages=['muddler', 'muddler.v1'],
+    packages=['muddler', 'muddler.v1', 'muddler.v2'],
     include_package_data=True,
     entry_points={
         'console_scripts': [
@@ -79,4 +83,5 @@ setup(
     long_description_content_type='text/markdown',
     classifiers=CLASSIFIERS,
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
 )
@@ -0,0 +1,100 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Helpers and fixtures shared by the tests. Test modules import the helpers
+# from here (eg `from tests.conftest import random_bytes`), while pytest
+# provides the fixtures.
+
+import random
+from zipfile import ZipFile
+
+import pytest
+
+
+DIR_CONFIG = {
+    'algorithm_version': '1',
+    'source_type': 'dir',
+    'target_type': 'dir',
+    'targets': {'t{}'.format(i): ['s{}'.format(i % 2)] for i in range(4)}
+}
+
+
+def random_bytes(rng, size):
+    # Like rng.randbytes(), which needs Python 3.9.
+    return bytes(rng.getrandbits(8) for _ in range(size))
+
+
+def no_hashing(path):
+    raise AssertionError('{} was hashed again'.format(path))
+
+
+def read_members(package_path):
+    with ZipFile(package_path) as package:
+        return {n: package.read(n) for n in package.namelist()}
+
+
+def read_tree(path):
+    return {p.relative_to(path): p.read_bytes()
+            for p in path.rglob('*') if p.is_file()}
+
+
+def flip_member_byte(package_path, member_name, offset=100):
+    # Flips a byte of a stored member in place, without updating its CRC.
+    with ZipFile(package_path) as package:
+        info = package.getinfo(member_name)
+        offset += (info.header_offset + 30 + len(info.filename.encode()) +
+                   len(info.extra))
+
+    with open(package_path, 'r+b') as package_fp:
+        package_fp.seek(offset)
+        byte = package_fp.read(1)
+        package_fp.seek(offset)
+        package_fp.write(bytes([byte[0] ^ 0xff]))
+
+
+def rewrite_package(package_path, update):
+    # Rewrites every member of a package with update(name, data), keeping
+    # the zip file itself valid.
+    with ZipFile(package_path) as package:
+        members = [(info, package.read(info)) for info in package.infolist()]
+
+    with ZipFile(package_path, 'w') as package:
+        for info, data in members:
+            package.writestr(info, update(info.filename, data))
+
+
+@pytest.fixture
+def data_paths(tmp_path):
+    # Source and target directories for DIR_CONFIG.
+    rng = random.Random(0)
+    src_path = tmp_path / 'src'
+    trg_path = tmp_path / 'trg'
+    src_path.mkdir()
+    trg_path.mkdir()
+
+    for source in ['s0', 's1']:
+        (src_path / source).write_bytes(random_bytes(rng, 3000))
+    for target in DIR_CONFIG['targets']:
+        (trg_path / target).write_bytes(random_bytes(rng, 5000))
+
+    return src_path, trg_path
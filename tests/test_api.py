@@ -0,0 +1,84 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+import muddler
+import muddler.config
+import muddler.muddle
+import muddler.unmuddle
+
+
+REPO_PATH = Path(__file__).resolve().parent.parent
+
+
+CONFIG = """\
+##TARGET_TYPE file
+##SOURCE_TYPE file
+##ALGORITHM_VERSION 1
+
+#TARGET   /
+"""
+
+
+@pytest.mark.parametrize('name, module', [
+    ('parse_config', muddler.config),
+    ('MuddlerConfigException', muddler.config),
+    ('MuddleException', muddler.muddle),
+    ('UnmuddleException', muddler.unmuddle)])
+def test_lazy_exports(name, module):
+    assert getattr(muddler, name) is getattr(module, name)
+
+
+def test_missing_attribute():
+    with pytest.raises(AttributeError):
+        muddler.missing
+
+
+def test_callable_modules(tmp_path):
+    (tmp_path / 'src').write_bytes(b'source' * 100)
+    (tmp_path / 'trg').write_bytes(b'target' * 50)
+
+    config = muddler.parse_config(io.StringIO(CONFIG))
+    muddler.muddle(config, tmp_path / 'src', tmp_path / 'trg',
+                   tmp_path / 'out.muddle')
+    muddler.unmuddle(tmp_path / 'src', tmp_path / 'out.muddle',
+                     tmp_path / 'out')
+    assert (tmp_path / 'out').read_bytes() == b'target' * 50
+
+    with pytest.raises(muddler.MuddleException):
+        muddler.muddle(config, tmp_path / 'missing', tmp_path / 'trg',
+                       tmp_path / 'missing.muddle')
+
+
+def test_fresh_import():
+    # The functions are reachable before their modules are imported.
+    code = ('import muddler; '
+            'assert callable(muddler.muddle); '
+            'assert callable(muddler.unmuddle)')
+    subprocess.run([sys.executable, '-c', code], cwd=REPO_PATH, check=True)
@@ -0,0 +1,186 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import json
+import os
+import random
+
+import pytest
+
+from muddler.batch import find_job_dependencies, parse_job, run_batch
+from muddler.batch import BatchJobException
+from muddler.hash_cache import MemoryHashCache
+from tests.conftest import random_bytes
+
+
+def job_line(**job):
+    return json.dumps(job) + '\n'
+
+
+def run_jobs(lines, concurrency=1):
+    output_fp = io.StringIO()
+    succeeded = run_batch(lines, output_fp, MemoryHashCache(), concurrency)
+    results = [json.loads(line)
+               for line in output_fp.getvalue().splitlines()]
+    return succeeded, {result['line']: result for result in results}
+
+
+@pytest.fixture
+def file_paths(tmp_path):
+    rng = random.Random(0)
+    src_path = tmp_path / 'src'
+    trg_path = tmp_path / 'trg'
+    src_path.write_bytes(random_bytes(rng, 3000))
+    trg_path.write_bytes(random_bytes(rng, 5000))
+    return str(src_path), str(trg_path)
+
+
+def test_dependencies(tmp_path):
+    def job(command, output, **paths):
+        return dict(paths, command=command,
+                    output=str(tmp_path / output))
+
+    pkg = str(tmp_path / 'a.muddle')
+    jobs = [
+        job('muddle', 'a.muddle', source='src', target='trg'),
+        job('muddle', 'b.muddle', source='src', target='trg2'),
+        job('unmuddle', 'a_out', source='src', muddled=pkg),
+        None,
+        job('muddle', 'c.muddle', source='src', target='trg', base=pkg),
+        # Reads a file written by the job on line 3.
+        job('muddle', 'd.muddle', source='src',
+            target=str(tmp_path / 'a_out' / 'x')),
+        # Writes to the same path as the job on line 2.
+        job('muddle', 'b.muddle', source='src', target='trg')
+    ]
+
+    assert find_job_dependencies(jobs) == [[], [], [0], [], [0], [2], [1]]
+
+
+def test_dependencies_path_prefix(tmp_path):
+    # A path merely starting with another job's output isn't inside it.
+    jobs = [
+        {'command': 'muddle', 'source': 'src', 'target': 'trg',
+         'output': str(tmp_path / 'out')},
+        {'command': 'muddle', 'source': 'src',
+         'target': str(tmp_path / 'out2'), 'output': str(tmp_path / 'p')}
+    ]
+
+    assert find_job_dependencies(jobs) == [[], []]
+
+
+@pytest.mark.parametrize('line,error', [
+    ('{"command": "muddle"', 'Invalid JSON.'),
+    ('[]', 'Jobs must be JSON objects.'),
+    ('{"command": "copy"}', 'Invalid command \'copy\'.'),
+    ('{"command": "unmuddle", "source": "s", "output": "o"}',
+     'Missing \'muddled\' path.'),
+    ('{"command": "unmuddle", "source": "s", "muddled": "m", "output": "o",'
+     ' "only": "*.txt"}', '\'only\' must be a list of patterns.'),
+    ('{"command": "muddle", "source": "s", "target": "t", "output": "o",'
+     ' "jobs": 0}', 'Number of jobs must be a positive integer.')
+])
+def test_parse_error(line, error):
+    with pytest.raises(BatchJobException) as e:
+        parse_job(line)
+
+    assert e.value.msg == error
+
+
+@pytest.mark.parametrize('concurrency', [1, 3])
+def test_run(tmp_path, file_paths, concurrency):
+    src_path, trg_path = file_paths
+    pkg_path = str(tmp_path / 'trg.muddle')
+    out_path = str(tmp_path / 'out')
+    lines = [
+        job_line(id='m', command='muddle', source=src_path, target=trg_path,
+                 output=pkg_path),
+        '\n',
+        job_line(command='unmuddle', source=src_path, muddled=pkg_path,
+                 output=out_path, stats=True)
+    ]
+
+    succeeded, results = run_jobs(lines, concurrency)
+
+    assert succeeded
+    assert sorted(results) == [1, 3]
+    assert results[1]['id'] == 'm'
+    assert results[1]['status'] == 'ok'
+    assert results[3]['status'] == 'ok'
+    assert 'stats' in results[3]
+
+    with open(trg_path, 'rb') as trg_fp, open(out_path, 'rb') as out_fp:
+        assert out_fp.read() == trg_fp.read()
+
+
+@pytest.mark.parametrize('concurrency', [1, 3])
+def test_failed_dependency(tmp_path, file_paths, concurrency):
+    src_path, trg_path = file_paths
+    pkg_path = str(tmp_path / 'trg.muddle')
+    lines = [
+        job_line(command='muddle', source=str(tmp_path / 'missing'),
+                 target=trg_path, output=pkg_path),
+        job_line(command='unmuddle', source=src_path, muddled=pkg_path,
+                 output=str(tmp_path / 'out')),
+        job_line(command='muddle', source=src_path, target=trg_path,
+                 output=str(tmp_path / 'other.muddle')),
+        job_line(command='muddle', source=src_path, target=trg_path,
+                 output=str(tmp_path / 'out2'), base=pkg_path)
+    ]
+
+    succeeded, results = run_jobs(lines, concurrency)
+
+    assert not succeeded
+    assert results[1]['status'] == 'error'
+    assert results[3]['status'] == 'ok'
+
+    for line_num in [2, 4]:
+        assert results[line_num]['status'] == 'skipped'
+        assert results[line_num]['error'] == \
+            'Job on line 1 did not succeed.'
+
+    assert not os.path.exists(tmp_path / 'out')
+    assert not os.path.exists(tmp_path / 'out2')
+
+
+def test_parse_errors_per_line(tmp_path, file_paths):
+    src_path, trg_path = file_paths
+    lines = [
+        'not json\n',
+        job_line(command='muddle', source=src_path, target=trg_path,
+                 output=str(tmp_path / 'trg.muddle')),
+        '\n',
+        job_line(command='unmuddle', source=src_path,
+                 output=str(tmp_path / 'out')),
+    ]
+
+    succeeded, results = run_jobs(lines)
+
+    assert not succeeded
+    assert results == {
+        1: {'line': 1, 'status': 'error',
+            'error': 'Batch Job Error: Invalid JSON.'},
+        2: dict(results[2], status='ok'),
+        4: {'line': 4, 'status': 'error',
+            'error': 'Batch Job Error: Missing \'muddled\' path.'}
+    }
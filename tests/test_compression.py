@@ -0,0 +1,137 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import errno
+import io
+import random
+
+import pytest
+
+from muddler.compression import COMPRESSION_CODECS, CompressingReader
+from muddler.compression import DecompressingWriter, DecompressionError
+from tests.conftest import random_bytes
+
+
+BLOCK_SIZE = 1024
+
+
+class RecordingWriter(io.BytesIO):
+    # Keeps track of the largest write.
+    max_write = 0
+
+    def write(self, buf):
+        self.max_write = max(self.max_write, len(buf))
+        return super().write(buf)
+
+
+class FullDiskWriter(object):
+    def write(self, buf):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+
+def compress(data, codec, read_size=-1, readinto=False):
+    reader = CompressingReader(io.BytesIO(data), codec, BLOCK_SIZE)
+    chunks = []
+
+    while True:
+        if readinto:
+            buf = bytearray(read_size)
+            chunk = buf[:reader.readinto(buf)]
+        else:
+            chunk = reader.read(read_size)
+
+        if len(chunk) == 0:
+            return b''.join(chunks)
+
+        chunks.append(bytes(chunk))
+
+
+def decompress(compressed, codec, output_fp=None, write_size=100):
+    if output_fp is None:
+        output_fp = io.BytesIO()
+
+    writer = DecompressingWriter(output_fp, codec, BLOCK_SIZE)
+
+    for start in range(0, len(compressed), write_size):
+        chunk = compressed[start:start+write_size]
+        assert writer.write(chunk) == len(chunk)
+
+    writer.finish()
+    return output_fp.getvalue()
+
+
+@pytest.fixture(params=COMPRESSION_CODECS)
+def codec(request):
+    return request.param
+
+
+@pytest.mark.parametrize('size', [0, 1, 5000])
+@pytest.mark.parametrize('read_size, readinto', [(-1, False), (7, False),
+                                                 (7, True), (4096, True)])
+def test_round_trip(codec, size, read_size, readinto):
+    data = random_bytes(random.Random(size), size)
+    compressed = compress(data, codec, read_size, readinto)
+
+    assert compressed == compress(data, codec)
+    assert decompress(compressed, codec) == data
+
+
+def test_output_is_bounded(codec):
+    # Compresses to far less than BLOCK_SIZE, so that a single write has
+    # to be decompressed in several steps.
+    data = bytes(64 * BLOCK_SIZE)
+    compressed = compress(data, codec)
+    output_fp = RecordingWriter()
+
+    assert len(compressed) < BLOCK_SIZE
+    assert decompress(compressed, codec, output_fp, len(compressed)) == data
+    assert output_fp.max_write <= BLOCK_SIZE
+
+
+def test_truncated_data(codec):
+    compressed = compress(random_bytes(random.Random(0), 5000), codec)
+
+    with pytest.raises(DecompressionError):
+        decompress(compressed[:len(compressed) // 2], codec)
+
+
+@pytest.mark.parametrize('write_size', [100, 100000])
+def test_trailing_data(codec, write_size):
+    compressed = compress(random_bytes(random.Random(0), 5000), codec)
+
+    with pytest.raises(DecompressionError):
+        decompress(compressed + b'trailing', codec, write_size=write_size)
+
+
+def test_invalid_data(codec):
+    with pytest.raises(DecompressionError):
+        decompress(random_bytes(random.Random(0), 5000), codec)
+
+
+def test_output_errors_are_not_decompression_errors(codec):
+    compressed = compress(random_bytes(random.Random(0), 5000), codec)
+
+    with pytest.raises(OSError) as exc_info:
+        decompress(compressed, codec, FullDiskWriter())
+
+    assert exc_info.value.errno == errno.ENOSPC
@@ -0,0 +1,185 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+
+import pytest
+
+from muddler.config import MuddlerConfigException, expand_config
+from muddler.config import expand_source_template, match_target_pattern
+from muddler.config import parse_config
+
+
+HEADER = """\
+##TARGET_TYPE dir
+##SOURCE_TYPE dir
+##ALGORITHM_VERSION 1
+"""
+
+
+# Line numbers in errors count the 3 header lines.
+def parse(body, header=HEADER):
+    return parse_config(io.StringIO(header + body))
+
+
+def get_error_line(body):
+    with pytest.raises(MuddlerConfigException) as exc_info:
+        parse(body)
+
+    return exc_info.value.line_num
+
+
+def test_targets():
+    config = parse('#TARGET /a\n/s0\n/s1\n\n#TARGET /sub/b\n/s1\n')
+
+    assert config == {
+        'algorithm_version': '1',
+        'target_type': 'dir',
+        'source_type': 'dir',
+        'targets': {'a': ['s0', 's1'], 'sub/b': ['s1']}
+    }
+
+
+def test_last_line_without_newline():
+    config = parse('#TARGET /a\n/source')
+    assert config['targets'] == {'a': ['source']}
+
+    config = parse_config(io.StringIO(
+        '##TARGET_TYPE file\n##SOURCE_TYPE file\n##ALGORITHM_VERSION 1\n'
+        '#TARGET /'))
+    assert config['targets'] == {'/': None}
+
+
+def test_duplicate_target():
+    assert get_error_line('#TARGET /a\n/s0\n#TARGET /a\n/s1\n') == 6
+
+
+def test_duplicate_source():
+    assert get_error_line('#TARGET /a\n/s0\n/s1\n/s0\n') == 7
+
+
+def test_same_source_in_several_targets():
+    config = parse('#TARGET /a\n/s0\n#TARGET /b\n/s0\n')
+    assert config['targets'] == {'a': ['s0'], 'b': ['s0']}
+
+
+def test_target_without_sources():
+    assert get_error_line('#TARGET /a\n#TARGET /b\n/s0\n') == 5
+
+
+def test_rules():
+    config = parse('#TARGET /train/special.conll\n/s0\n'
+                   '#TARGETS /train/**/*.conll\n/src/{path}\n/common\n')
+
+    assert config['rules'] == [{
+        'pattern': 'train/**/*.conll',
+        'line_num': 6,
+        'sources': ['src/{path}', 'common']
+    }]
+
+    expanded = expand_config(config, [
+        'train/special.conll', 'train/a.conll', 'train/x/y/b.conll',
+        'train/a.txt', 'test/c.conll'])
+
+    assert 'rules' not in expanded
+    assert expanded['targets'] == {
+        'train/special.conll': ['s0'],
+        'train/a.conll': ['src/train/a.conll', 'common'],
+        'train/x/y/b.conll': ['src/train/x/y/b.conll', 'common']
+    }
+
+
+@pytest.mark.parametrize('body', [
+    '#TARGETS train/*\n/s0\n',
+    '#TARGETS\n/s0\n',
+    '#TARGETS /*\n/{unknown}\n',
+    '#TARGETS /*\n/{0}\n'])
+def test_invalid_rules(body):
+    with pytest.raises(MuddlerConfigException):
+        parse(body)
+
+
+def test_rules_require_dir_targets():
+    with pytest.raises(MuddlerConfigException):
+        parse('#TARGETS /*\n/s0\n', HEADER.replace('TYPE dir', 'TYPE file',
+                                                   1))
+
+
+@pytest.mark.parametrize('template, source', [
+    ('{path}', 'train/doc.conll'),
+    ('{dir}', 'train'),
+    ('{name}', 'doc.conll'),
+    ('{stem}', 'doc'),
+    ('{suffix}', '.conll'),
+    ('raw/{dir}/{stem}.txt', 'raw/train/doc.txt'),
+    ('/{dir}//{stem}', 'train/doc')])
+def test_source_templates(template, source):
+    assert expand_source_template(template, 'train/doc.conll') == source
+
+
+def test_source_templates_at_top_level():
+    assert expand_source_template('raw/{dir}/{stem}', 'doc.conll') == \
+        'raw/doc'
+
+
+@pytest.mark.parametrize('pattern, target, matches', [
+    ('*', 'a', True),
+    ('*', 'a/b', False),
+    ('*.txt', 'a.txt', True),
+    ('a/*', 'a/b', True),
+    ('a/*', 'a/b/c', False),
+    ('**', 'a/b/c', True),
+    ('**/c', 'c', True),
+    ('**/c', 'a/b/c', True),
+    ('a/**/c', 'a/c', True),
+    ('a/**/c', 'a/b/b/c', True),
+    ('a/**/c', 'b/c', False),
+    ('a/**', 'a', True),
+    ('a/?', 'a/b', True),
+    ('a/[bc]', 'a/d', False)])
+def test_match_target_pattern(pattern, target, matches):
+    assert match_target_pattern(pattern, target) == matches
+
+
+def test_overlapping_rules():
+    config = parse('#TARGETS /train/*\n/s0\n#TARGETS /**/*.conll\n/s1\n')
+
+    expanded = expand_config(config, ['train/a.txt', 'test/b.conll'])
+    assert expanded['targets'] == {'train/a.txt': ['s0'],
+                                   'test/b.conll': ['s1']}
+
+    with pytest.raises(MuddlerConfigException) as exc_info:
+        expand_config(config, ['train/a.conll'])
+
+    assert exc_info.value.line_num == 6
+    assert 'line 4' in exc_info.value.msg
+
+
+def test_rule_matching_no_targets():
+    config = parse('#TARGETS /train/*\n/s0\n#TARGETS /test/*\n/s1\n')
+
+    with pytest.raises(MuddlerConfigException) as exc_info:
+        expand_config(config, ['train/a'])
+
+    assert exc_info.value.line_num == 6
+    assert 'No targets match' in exc_info.value.msg
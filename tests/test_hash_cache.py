@@ -0,0 +1,88 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import sqlite3
+
+import pytest
+
+import muddler.hash_cache
+from muddler.hash_cache import HashCache
+from muddler.utils import hash_path_sha256
+from tests.conftest import no_hashing
+
+
+class LockedConnection(object):
+    # Stands in for the connection to a database that another process keeps
+    # locked.
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, *args):
+        raise sqlite3.OperationalError('database is locked')
+
+    def close(self):
+        self._conn.close()
+
+
+@pytest.fixture
+def file_paths(tmp_path):
+    file_paths = []
+
+    for ndx in range(4):
+        file_path = tmp_path / 'file{}'.format(ndx)
+        file_path.write_bytes(bytes([ndx]) * 1000)
+        file_paths.append(file_path)
+
+    return file_paths
+
+
+def test_caches_share_a_database(tmp_path, file_paths, monkeypatch):
+    cache_path = tmp_path / 'hashes.sqlite3'
+
+    # Both caches stay open while the other one writes, like two muddler
+    # processes sharing the default cache.
+    with HashCache(cache_path) as cache1, HashCache(cache_path) as cache2:
+        for ndx, file_path in enumerate(file_paths):
+            cache = cache1 if ndx % 2 == 0 else cache2
+            assert cache.hash_path_sha256(file_path) == \
+                hash_path_sha256(file_path)
+
+        # Hashes stored by one cache are seen by the other right away.
+        monkeypatch.setattr(muddler.hash_cache, 'hash_path_sha256',
+                            no_hashing)
+
+        for ndx, file_path in enumerate(file_paths):
+            cache = cache2 if ndx % 2 == 0 else cache1
+            assert cache.hash_path_sha256(file_path) == \
+                hash_path_sha256(file_path)
+
+
+def test_locked_database_is_a_miss(tmp_path, file_paths):
+    cache = HashCache(tmp_path / 'hashes.sqlite3')
+    cache._conn = LockedConnection(cache._conn)
+
+    for file_path in file_paths:
+        assert cache.hash_path_sha256(file_path) == \
+            hash_path_sha256(file_path)
+
+    cache.close()
@@ -0,0 +1,173 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import json
+from zipfile import ZipFile
+
+import pytest
+
+from muddler.config import ALGORITHM_VERSIONS
+from muddler import manifest as manifest_module
+from muddler.manifest import MANIFEST_V1_NAME, ManifestError
+from muddler.manifest import PackageManifest, TARGET_BLOCK_SIZE
+from muddler.manifest import load_manifest, write_manifest
+
+
+TARGET_COUNT = 2 * TARGET_BLOCK_SIZE + 10
+
+
+def make_manifest():
+    sources = {'s{}'.format(i): {'hash': 'h' * 63 + str(i), 'size': 100 + i}
+               for i in range(3)}
+    targets = {}
+
+    for i in range(TARGET_COUNT):
+        targets['t{:05d}'.format(i)] = {
+            'hash': '{:064x}'.format(i),
+            'sources': ['s{}'.format(i % 3), 's{}'.format((i + 1) % 3)],
+            'size': i,
+            'muddled_hash': '{:064x}'.format(i + 1)
+        }
+
+    targets['t00003']['alias'] = 't00000'
+
+    return {
+        'algorithm_version': '1',
+        'source_type': 'dir',
+        'target_type': 'dir',
+        'sources': sources,
+        'targets': targets
+    }
+
+
+@pytest.fixture(scope='module')
+def manifest():
+    return make_manifest()
+
+
+@pytest.fixture
+def package(manifest):
+    package_fp = io.BytesIO()
+
+    with ZipFile(package_fp, 'w') as package:
+        write_manifest(package, manifest)
+
+    with ZipFile(package_fp, 'r') as package:
+        yield package
+
+
+def test_fields(manifest, package):
+    loaded = load_manifest(package)
+
+    assert isinstance(loaded, PackageManifest)
+    assert sorted(loaded) == sorted(manifest)
+    assert loaded['algorithm_version'] == '1'
+    assert dict(loaded['sources']) == manifest['sources']
+    assert len(loaded['targets']) == TARGET_COUNT
+
+
+def test_targets_span_blocks(manifest, package):
+    targets = load_manifest(package)['targets']
+
+    assert 'manifest/targets/000002.jsonl' in package.namelist()
+    assert list(targets) == sorted(manifest['targets'])
+    assert dict(targets.items()) == manifest['targets']
+
+    # First and last targets of each block.
+    for i in [0, TARGET_BLOCK_SIZE - 1, TARGET_BLOCK_SIZE,
+              2 * TARGET_BLOCK_SIZE, TARGET_COUNT - 1]:
+        target = 't{:05d}'.format(i)
+        assert target in targets
+        assert targets[target] == manifest['targets'][target]
+
+    assert targets['t00003']['alias'] == 't00000'
+
+
+@pytest.mark.parametrize('target', ['', 'a', 't', 't00000x', 't99999', 'u',
+                                    None, 3])
+def test_missing_targets(package, target):
+    targets = load_manifest(package)['targets']
+
+    assert target not in targets
+    with pytest.raises(KeyError):
+        targets[target]
+
+
+def test_block_cache(manifest, package, monkeypatch):
+    targets = load_manifest(package)['targets']
+    read_blocks = []
+    iter_block_lines = targets._iter_block_lines
+
+    def counting_iter_block_lines(block_ndx):
+        read_blocks.append(block_ndx)
+        return iter_block_lines(block_ndx)
+
+    monkeypatch.setattr(targets, '_iter_block_lines',
+                        counting_iter_block_lines)
+
+    for target in sorted(manifest['targets']):
+        targets[target]
+
+    # Lookups in sorted order read each block once, while going back and
+    # forth between blocks reads them again.
+    assert read_blocks == [0, 1, 2]
+
+    targets['t00000']
+    targets['t{:05d}'.format(TARGET_COUNT - 1)]
+    assert read_blocks == [0, 1, 2, 0, 2]
+
+
+def test_v1_manifest(manifest):
+    package_fp = io.BytesIO()
+
+    with ZipFile(package_fp, 'w') as package:
+        package.writestr(MANIFEST_V1_NAME, json.dumps(manifest))
+
+    with ZipFile(package_fp, 'r') as package:
+        assert load_manifest(package) == manifest
+
+
+def test_v1_stub(package):
+    # Versions that only read MANIFEST_V1_NAME find an algorithm version
+    # they don't support.
+    stub = json.loads(package.read(MANIFEST_V1_NAME))
+
+    assert stub['manifest_version'] == manifest_module.MANIFEST_VERSION
+    assert stub['algorithm_version'] not in ALGORITHM_VERSIONS
+    assert manifest_module.MANIFEST_MIN_MUDDLER_VERSION in \
+        stub['algorithm_version']
+
+
+def test_unsupported_manifest_version(manifest, monkeypatch):
+    monkeypatch.setattr(manifest_module, 'MANIFEST_VERSION', 3)
+    package_fp = io.BytesIO()
+
+    with ZipFile(package_fp, 'w') as package:
+        write_manifest(package, manifest)
+
+    monkeypatch.undo()
+
+    with ZipFile(package_fp, 'r') as package:
+        with pytest.raises(ManifestError):
+            load_manifest(package)
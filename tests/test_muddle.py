@@ -0,0 +1,222 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import multiprocessing
+from pathlib import Path
+import random
+import time
+
+import pytest
+
+import muddler.muddle
+from muddler.muddle import muddle, muddle_streams, MuddleException
+from muddler.unmuddle import unmuddle
+from tests.conftest import DIR_CONFIG
+from tests.conftest import flip_member_byte, random_bytes, read_members
+from tests.conftest import read_tree
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_base_package(tmp_path, data_paths, pipeline):
+    src_path, trg_path = data_paths
+    base_path = tmp_path / 'base.muddle'
+    muddle(DIR_CONFIG, src_path, trg_path, base_path)
+    (trg_path / 't1').write_bytes(b'changed')
+
+    new_path = tmp_path / 'new.muddle'
+    full_path = tmp_path / 'full.muddle'
+    muddle(DIR_CONFIG, src_path, trg_path, new_path, pipeline=pipeline,
+           base=base_path)
+    muddle(DIR_CONFIG, src_path, trg_path, full_path, pipeline=pipeline)
+
+    assert read_members(new_path) == read_members(full_path)
+
+    out_path = tmp_path / 'out'
+    unmuddle(src_path, new_path, out_path)
+    assert read_tree(out_path) == read_tree(trg_path)
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_corrupt_base_package(tmp_path, data_paths, pipeline):
+    src_path, trg_path = data_paths
+    base_path = tmp_path / 'base.muddle'
+    muddle(DIR_CONFIG, src_path, trg_path, base_path)
+
+    flip_member_byte(base_path, 'muddled/t0')
+
+    with pytest.raises(MuddleException):
+        muddle(DIR_CONFIG, src_path, trg_path, tmp_path / 'new.muddle',
+               pipeline=pipeline, base=base_path)
+
+
+DUPLICATES_CONFIG = {
+    'algorithm_version': '1',
+    'source_type': 'dir',
+    'target_type': 'dir',
+    'targets': {'a': ['s0'], 'sub/b': ['s0'], 'c': ['s0'], 'd': ['s1'],
+                'e': ['s0']}
+}
+
+
+@pytest.fixture
+def duplicate_paths(tmp_path):
+    # a, sub/b and c are duplicates. d has the same content but other
+    # sources, and e has other content.
+    rng = random.Random(0)
+    src_path = tmp_path / 'src'
+    trg_path = tmp_path / 'trg'
+    (trg_path / 'sub').mkdir(parents=True)
+    src_path.mkdir()
+
+    for source in ['s0', 's1']:
+        (src_path / source).write_bytes(random_bytes(rng, 3000))
+
+    content = random_bytes(rng, 5000)
+    for target in ['a', 'sub/b', 'c', 'd']:
+        (trg_path / target).write_bytes(content)
+    (trg_path / 'e').write_bytes(random_bytes(rng, 5000))
+
+    return src_path, trg_path
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_duplicates_are_stored_once(tmp_path, duplicate_paths, pipeline):
+    src_path, trg_path = duplicate_paths
+    package_path = tmp_path / 'package.muddle'
+    muddle(DUPLICATES_CONFIG, src_path, trg_path, package_path,
+           pipeline=pipeline)
+
+    muddled_members = sorted(n for n in read_members(package_path)
+                             if n.startswith('muddled/'))
+    assert muddled_members == ['muddled/a', 'muddled/d', 'muddled/e']
+
+    out_path = tmp_path / 'out'
+    unmuddle(src_path, package_path, out_path)
+    assert read_tree(out_path) == read_tree(trg_path)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_only_alias(tmp_path, duplicate_paths, jobs):
+    # sub/b is unmuddled from the member of a, which isn't selected.
+    src_path, trg_path = duplicate_paths
+    package_path = tmp_path / 'package.muddle'
+    muddle(DUPLICATES_CONFIG, src_path, trg_path, package_path)
+
+    out_path = tmp_path / 'out'
+    unmuddle(src_path, package_path, out_path, jobs=jobs, only=['sub/*'])
+    assert read_tree(out_path) == {
+        Path('sub/b'): (trg_path / 'sub/b').read_bytes()}
+
+
+FILE_CONFIG = {
+    'algorithm_version': '1',
+    'source_type': 'file',
+    'target_type': 'file',
+    'targets': {'/': None}
+}
+
+
+@pytest.mark.parametrize('target', [b'target', b''])
+def test_empty_source(tmp_path, target):
+    (tmp_path / 'src').write_bytes(b'')
+    (tmp_path / 'trg').write_bytes(target)
+    package_path = tmp_path / 'package.muddle'
+
+    if len(target) == 0:
+        # Empty targets don't need a key.
+        muddle(FILE_CONFIG, tmp_path / 'src', tmp_path / 'trg', package_path)
+        unmuddle(tmp_path / 'src', package_path, tmp_path / 'out')
+        assert (tmp_path / 'out').read_bytes() == b''
+        return
+
+    with pytest.raises(MuddleException):
+        muddle(FILE_CONFIG, tmp_path / 'src', tmp_path / 'trg', package_path)
+    with pytest.raises(MuddleException):
+        muddle_streams(FILE_CONFIG, b'', target, io.BytesIO())
+
+    assert not package_path.exists()
+
+
+def test_empty_sources_in_dir(tmp_path, data_paths):
+    src_path, trg_path = data_paths
+    (src_path / 'empty').write_bytes(b'')
+    config = dict(DIR_CONFIG, targets={'t0': ['empty'],
+                                       't1': ['empty', 's1']})
+
+    with pytest.raises(MuddleException):
+        muddle(config, src_path, trg_path, tmp_path / 'package.muddle')
+
+    # A non-empty source is enough.
+    del config['targets']['t0']
+    muddle(config, src_path, trg_path, tmp_path / 'package.muddle')
+    unmuddle(src_path, tmp_path / 'package.muddle', tmp_path / 'out')
+    assert (tmp_path / 'out' / 't1').read_bytes() == \
+        (trg_path / 't1').read_bytes()
+
+
+@pytest.mark.parametrize('algorithm_version', ['1', '2'])
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_jobs_match_serial(tmp_path, data_paths, algorithm_version,
+                           compression):
+    src_path, trg_path = data_paths
+    config = dict(DIR_CONFIG, algorithm_version=algorithm_version)
+    muddle(config, src_path, trg_path, tmp_path / 'serial.muddle',
+           compression=compression)
+    muddle(config, src_path, trg_path, tmp_path / 'parallel.muddle', jobs=3,
+           compression=compression)
+
+    assert (tmp_path / 'parallel.muddle').read_bytes() == \
+        (tmp_path / 'serial.muddle').read_bytes()
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='workers must inherit the patched task')
+def test_failed_job_cancels_others(tmp_path, data_paths, monkeypatch):
+    src_path, trg_path = data_paths
+    config = dict(DIR_CONFIG, targets={
+        't{}'.format(i): ['s0'] for i in range(12)})
+    done_path = tmp_path / 'done'
+    done_path.mkdir()
+
+    rng = random.Random(0)
+
+    for target in config['targets']:
+        (trg_path / target).write_bytes(random_bytes(rng, 100))
+    # The largest target is muddled first.
+    (trg_path / 't0').write_bytes(random_bytes(rng, 200))
+
+    def muddle_task(stats, target, *args):
+        if target == 't0':
+            raise OSError('t0 failed')
+        time.sleep(0.2)
+        (done_path / target).touch()
+
+    monkeypatch.setattr(muddler.muddle, '_muddle_task', muddle_task)
+
+    with pytest.raises(OSError, match='t0 failed'):
+        muddle(config, src_path, trg_path, tmp_path / 'package.muddle',
+               jobs=2)
+
+    # Only the tasks already handed over to workers are run.
+    assert len(list(done_path.iterdir())) < 6
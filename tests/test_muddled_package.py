@@ -0,0 +1,124 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import random
+
+import pytest
+
+from muddler.muddle import muddle
+from muddler.muddled_package import MuddledPackage
+from muddler.unmuddle import UnmuddleException
+from tests.conftest import DIR_CONFIG, rewrite_package
+
+
+# Small enough for targets to be unmuddled in several chunks.
+MEMORY_BUDGET = 1024
+
+
+@pytest.fixture
+def package_path(tmp_path, data_paths):
+    src_path, trg_path = data_paths
+    package_path = tmp_path / 'package.muddle'
+    muddle(DIR_CONFIG, src_path, trg_path, package_path)
+    return package_path
+
+
+def open_target(package_path, src_path, target):
+    muddled_package = MuddledPackage(package_path, src_path, MEMORY_BUDGET)
+    return muddled_package, muddled_package.open(target, buffer_size=64)
+
+
+def test_read(package_path, data_paths):
+    src_path, trg_path = data_paths
+
+    with MuddledPackage(package_path, src_path, MEMORY_BUDGET) as package:
+        for target in DIR_CONFIG['targets']:
+            with package.open(target) as target_fp:
+                assert target_fp.read() == (trg_path / target).read_bytes()
+
+
+def test_seek(package_path, data_paths):
+    src_path, trg_path = data_paths
+    data = (trg_path / 't1').read_bytes()
+    package, target_fp = open_target(package_path, src_path, 't1')
+    rng = random.Random(0)
+
+    with package, target_fp:
+        assert target_fp.seek(1000) == 1000
+        assert target_fp.read(500) == data[1000:1500]
+
+        # Backward seeks restart unmuddling.
+        target_fp.seek(10)
+        assert target_fp.read(20) == data[10:30]
+
+        target_fp.seek(100, io.SEEK_CUR)
+        assert target_fp.tell() == 130
+        assert target_fp.read(10) == data[130:140]
+
+        target_fp.seek(-5, io.SEEK_END)
+        assert target_fp.read() == data[-5:]
+        assert target_fp.read() == b''
+
+        target_fp.seek(len(data) + 10)
+        assert target_fp.read() == b''
+
+        for _ in range(20):
+            offset = rng.randrange(len(data))
+            size = rng.randrange(1, 2000)
+            target_fp.seek(offset)
+            assert target_fp.read(size) == data[offset:offset+size]
+
+        target_fp.seek(0)
+        assert target_fp.read() == data
+
+        with pytest.raises(ValueError):
+            target_fp.seek(-1)
+
+
+def test_tampered_member(package_path, data_paths):
+    src_path, trg_path = data_paths
+
+    def tamper(name, data):
+        if name == 'muddled/t0':
+            return data[:-1] + bytes([data[-1] ^ 0xff])
+        return data
+
+    rewrite_package(package_path, tamper)
+    package, target_fp = open_target(package_path, src_path, 't0')
+
+    with package, target_fp:
+        # Hashes can only be checked once the whole target has been read.
+        assert target_fp.read(100) == (trg_path / 't0').read_bytes()[:100]
+
+        with pytest.raises(UnmuddleException):
+            target_fp.read()
+
+    # Also when the end is reached after a seek.
+    package, target_fp = open_target(package_path, src_path, 't0')
+
+    with package, target_fp:
+        target_fp.seek(-1, io.SEEK_END)
+
+        with pytest.raises(UnmuddleException):
+            target_fp.read(1)
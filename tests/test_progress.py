@@ -0,0 +1,108 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import json
+
+from muddler.muddle import muddle
+from muddler.progress import ProgressReporter, new_progress_reporter
+from muddler.stats import Stats
+from muddler.unmuddle import unmuddle
+from muddler.utils import MAPPED_BLOCK_SIZE, hash_file_sha256
+from muddler.utils import iter_hash_paths_sha256
+from tests.conftest import DIR_CONFIG
+
+
+class TtyStringIO(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_auto_mode():
+    fp = io.StringIO()
+    new_progress_reporter('auto', fp).report()
+    assert 'elapsed_seconds' in json.loads(fp.getvalue())
+
+    fp = TtyStringIO()
+    new_progress_reporter('auto', fp).report()
+    assert fp.getvalue().startswith('\r')
+
+    assert new_progress_reporter('none', io.StringIO()) is None
+
+
+def test_hashing_advances(tmp_path):
+    size = 3 * MAPPED_BLOCK_SIZE + 5
+    data = bytes(size)
+    path = tmp_path / 'data'
+    path.write_bytes(data)
+    expected = [MAPPED_BLOCK_SIZE, 2 * MAPPED_BLOCK_SIZE,
+                3 * MAPPED_BLOCK_SIZE, size]
+
+    # Mapped file.
+    advances = []
+    list(iter_hash_paths_sha256(
+        [path], progress=lambda p, n: advances.append((p, n))))
+    assert advances == [(path, n) for n in expected]
+
+    # Buffered stream, reported about every MAPPED_BLOCK_SIZE bytes.
+    advances = []
+    hash_file_sha256(io.BytesIO(data), progress=advances.append)
+    assert advances == expected[:3]
+
+
+def test_reporter_counts_advances():
+    reporter = ProgressReporter('json', io.StringIO(), interval=1e9)
+    stats = Stats(reporter)
+    stats.expect('hash_sources', 300, 2)
+    stats.advance('hash_sources', 'a', 50)
+    stats.advance('hash_sources', 'b', 30)
+    stats.advance('hash_sources', 'a', 100)
+    assert reporter.get_progress()['bytes_done'] == 130
+
+    stats.count('hash_sources', 100, 1)
+    progress = reporter.get_progress()
+    assert progress['bytes_done'] == 100
+    assert progress['files_done'] == 1
+
+    stats.expect('muddle', 1000, 4)
+    assert reporter.get_progress()['bytes_done'] == 0
+
+
+def test_hashing_phases_expected(tmp_path, data_paths):
+    src_path, trg_path = data_paths
+    events = []
+    stats = Stats(events.append)
+    muddle(DIR_CONFIG, src_path, trg_path, tmp_path / 'out.muddle',
+           stats=stats)
+    expects = [(e['phase'], e['bytes'], e['files']) for e in events
+               if e['event'] == 'expect']
+    assert expects == [('hash_sources', 6000, 2),
+                       ('hash_targets', 20000, 4),
+                       ('muddle', 20000, 4)]
+
+    events.clear()
+    unmuddle(src_path, tmp_path / 'out.muddle', tmp_path / 'out',
+             stats=stats)
+    expects = [(e['phase'], e['bytes'], e['files']) for e in events
+               if e['event'] == 'expect']
+    assert expects == [('hash_sources', 6000, 2), ('unmuddle', 20000, 4)]
@@ -0,0 +1,59 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import pytest
+
+from muddler.unmuddle import select_targets, UnmuddleException
+
+
+TARGETS = ['README', 'train/a.txt', 'train/sub/b.txt', 'train/sub/c.conll',
+           'test/d.txt']
+
+
+def make_manifest():
+    return {
+        'algorithm_version': '1',
+        'source_type': 'dir',
+        'target_type': 'dir',
+        'sources': {'s': {'hash': '', 'size': 0}},
+        'targets': {t: {'hash': '', 'size': 0, 'sources': ['s']}
+                    for t in TARGETS}
+    }
+
+
+@pytest.mark.parametrize('patterns,selected', [
+    (['train/*.txt'], ['train/a.txt']),
+    (['train/**/*.txt'], ['train/a.txt', 'train/sub/b.txt']),
+    (['**/*.txt'], ['train/a.txt', 'train/sub/b.txt', 'test/d.txt']),
+    (['/README', 'test/*'], ['README', 'test/d.txt']),
+    (['*'], ['README']),
+])
+def test_patterns_match_like_config_rules(patterns, selected):
+    manifest = select_targets(make_manifest(), patterns)
+
+    assert sorted(manifest['targets']) == sorted(selected)
+
+
+def test_no_match():
+    with pytest.raises(UnmuddleException):
+        select_targets(make_manifest(), ['*.txt'])
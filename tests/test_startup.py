@@ -0,0 +1,47 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+
+import pytest
+
+from benchmarks.startup import STARTUP_CASES, measure_case, run_importtime
+
+
+# Budgets can be scaled on slow machines, as with
+# `python -m benchmarks.startup --budget-scale`.
+BUDGET_SCALE = float(os.environ.get('MUDDLER_STARTUP_BUDGET_SCALE', '1'))
+
+
+@pytest.fixture(scope='module')
+def startup_imports():
+    return set(run_importtime('pass'))
+
+
+@pytest.mark.parametrize('name', list(STARTUP_CASES))
+def test_startup(name, startup_imports):
+    code, budget, forbidden = STARTUP_CASES[name]
+    elapsed, modules = measure_case(code, startup_imports, 3)
+
+    assert sorted(set(forbidden) & modules) == []
+    assert elapsed <= budget * BUDGET_SCALE
@@ -0,0 +1,229 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import hashlib
+import io
+import json
+import random
+
+import pytest
+
+from muddler.aio import AsyncUnmuddler
+import muddler.hash_cache
+from muddler.hash_cache import MemoryHashCache
+from muddler.muddle import muddle, muddle_streams
+from muddler.muddled_package import MuddledPackage
+from muddler.stats import Stats
+from muddler.unmuddle import iter_unmuddled_targets, unmuddle_to_stream
+from muddler.unmuddle import unmuddle, UnmuddleException
+from tests.conftest import DIR_CONFIG, flip_member_byte, no_hashing
+from tests.conftest import random_bytes, read_tree, rewrite_package
+
+
+CONFIG = {
+    'algorithm_version': '1',
+    'source_type': 'dir',
+    'target_type': 'dir',
+    'targets': {'t0': ['s0'], 't1': ['s1'], 't2': ['s0', 's1']}
+}
+
+
+@pytest.fixture
+def package_data():
+    rng = random.Random(0)
+    sources = {s: random_bytes(rng, 2000) for s in ['s0', 's1']}
+    targets = {t: random_bytes(rng, 3000) for t in CONFIG['targets']}
+    package_fp = io.BytesIO()
+    muddle_streams(CONFIG, sources, targets, package_fp)
+    return sources, targets, package_fp.getvalue()
+
+
+def test_only_requested_sources_are_needed(package_data):
+    sources, targets, package = package_data
+    output_fp = io.BytesIO()
+
+    unmuddle_to_stream({'s1': sources['s1']}, package, output_fp, 't1')
+
+    assert output_fp.getvalue() == targets['t1']
+
+    with pytest.raises(UnmuddleException):
+        unmuddle_to_stream({'s1': sources['s1']}, package, io.BytesIO(),
+                           't2')
+
+
+def test_dir_package_needs_target(package_data):
+    sources, _, package = package_data
+    events = []
+
+    with pytest.raises(UnmuddleException,
+                       match='A target must be given for directory'):
+        unmuddle_to_stream(sources, package, io.BytesIO(),
+                           stats=Stats(events.append))
+
+    # The package is rejected before any source is hashed.
+    assert not any(e['phase'] == 'hash_sources' for e in events)
+
+
+def test_sources_given_as_paths(tmp_path, package_data, monkeypatch):
+    sources, targets, package = package_data
+    source_paths = {}
+
+    for source, data in sources.items():
+        source_paths[source] = tmp_path / source
+        source_paths[source].write_bytes(data)
+
+    hash_cache = MemoryHashCache()
+    unmuddled = {t: b''.join(c) for t, c in iter_unmuddled_targets(
+        source_paths, package, hash_cache=hash_cache)}
+    assert unmuddled == targets
+
+    # Sources are not hashed again while they are unchanged.
+    monkeypatch.setattr(muddler.hash_cache, 'hash_path_sha256', no_hashing)
+    unmuddled = {t: b''.join(c) for t, c in iter_unmuddled_targets(
+        source_paths, package, hash_cache=hash_cache)}
+    assert unmuddled == targets
+
+    source_paths['s0'].write_bytes(b'changed')
+    monkeypatch.undo()
+
+    with pytest.raises(UnmuddleException):
+        for _, chunks in iter_unmuddled_targets(source_paths, package,
+                                                hash_cache=hash_cache):
+            b''.join(chunks)
+
+
+def test_async_iter_target_chunks(tmp_path, package_data):
+    sources, targets, package = package_data
+    source_path = tmp_path / 's0'
+    source_path.write_bytes(sources['s0'])
+    hash_cache = MemoryHashCache()
+    unmuddler = AsyncUnmuddler(max_workers=2)
+
+    async def read_target():
+        chunks = []
+        async for chunk in unmuddler.iter_target_chunks(
+                {'s0': str(source_path)}, package, 't0', hash_cache):
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    async def read_targets():
+        return await asyncio.gather(*[read_target() for _ in range(4)])
+
+    try:
+        assert asyncio.run(read_targets()) == [targets['t0']] * 4
+    finally:
+        unmuddler.close()
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_corrupt_member_leaves_no_target(tmp_path, data_paths, jobs,
+                                         compression):
+    src_path, trg_path = data_paths
+    package_path = tmp_path / 'package.muddle'
+    muddle(DIR_CONFIG, src_path, trg_path, package_path,
+           compression=compression)
+    flip_member_byte(package_path, 'muddled/t0')
+
+    out_path = tmp_path / 'out'
+    with pytest.raises(UnmuddleException):
+        unmuddle(src_path, package_path, out_path, jobs=jobs)
+
+    assert not (out_path / 't0').exists()
+
+
+def tamper_muddled_member(name, data):
+    if name == 'muddled/t0':
+        return bytes([data[0] ^ 0xff]) + data[1:]
+
+    return data
+
+
+def tamper_target_hash(name, data):
+    if name != 'manifest/targets/000000.jsonl':
+        return data
+
+    rows = [json.loads(line) for line in data.splitlines()]
+
+    for row in rows:
+        if row[0] == 't0':
+            row[1] = '0' * 64
+
+    return b''.join(json.dumps(row).encode() + b'\n' for row in rows)
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+@pytest.mark.parametrize('tamper', [tamper_muddled_member,
+                                    tamper_target_hash])
+def test_hash_mismatch_leaves_no_target(tmp_path, data_paths, jobs, tamper):
+    src_path, trg_path = data_paths
+    package_path = tmp_path / 'package.muddle'
+    muddle(DIR_CONFIG, src_path, trg_path, package_path)
+    rewrite_package(package_path, tamper)
+
+    out_path = tmp_path / 'out'
+    with pytest.raises(UnmuddleException) as exc_info:
+        unmuddle(src_path, package_path, out_path, jobs=jobs)
+
+    if tamper is tamper_target_hash:
+        assert 'Target hash mismatch' in str(exc_info.value)
+    else:
+        assert 'Invalid or corrupt' in str(exc_info.value)
+
+    assert not (out_path / 't0').exists()
+
+    if jobs == 1:
+        # t0 comes first, so unmuddling stops before any other target.
+        assert read_tree(out_path) == {}
+
+
+def empty_source_entry(name, data):
+    # Records an empty source, which muddle() refuses to use.
+    if name != 'manifest.jsonl':
+        return data
+
+    lines = data.splitlines()
+    lines[1] = json.dumps(['/', hashlib.sha256().hexdigest(), 0]).encode()
+    return b'\n'.join(lines) + b'\n'
+
+
+def test_empty_source(tmp_path):
+    (tmp_path / 'src').write_bytes(b'source')
+    (tmp_path / 'trg').write_bytes(b'target')
+    package_path = tmp_path / 'package.muddle'
+    muddle({'algorithm_version': '1', 'source_type': 'file',
+            'target_type': 'file', 'targets': {'/': None}},
+           tmp_path / 'src', tmp_path / 'trg', package_path)
+    rewrite_package(package_path, empty_source_entry)
+    (tmp_path / 'src').write_bytes(b'')
+
+    with pytest.raises(UnmuddleException):
+        unmuddle(tmp_path / 'src', package_path, tmp_path / 'out')
+    with pytest.raises(UnmuddleException):
+        unmuddle_to_stream(b'', package_path.read_bytes(), io.BytesIO())
+    with MuddledPackage(package_path, tmp_path / 'src') as package:
+        with pytest.raises(UnmuddleException):
+            package.open()
+
+    assert not (tmp_path / 'out').exists()
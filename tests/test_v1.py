@@ -0,0 +1,212 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import io
+import random
+
+import pytest
+
+import muddler.v1
+from muddler.v1 import BLOCK_SIZE, Muddle_V1
+from muddler.v1.source_chain import SourceChain
+from tests.conftest import random_bytes
+
+
+SOURCE_SIZE = 5000
+
+
+class UnsizedReader(object):
+    # Hides the size of a stream, like a pipe or a compressed stream.
+    def __init__(self, data):
+        self._fp = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._fp.read(size)
+
+
+class ReferenceSourceChain(object):
+    # SourceChain.read_block() as it was before readinto() was added.
+    # Packages muddled with algorithm version 1 depend on its key stream.
+    def __init__(self, sources):
+        self._fps = [io.BytesIO(s) for s in sources]
+        self._key_size = sum(len(s) for s in sources)
+        self.reset()
+
+    def reset(self):
+        self._cur_file_ndx = 0
+        self._hash = hashlib.new('sha512')
+
+        for kfp in self._fps:
+            kfp.seek(0, 0)
+
+    def read_block(self, block_size):
+        if block_size <= 0:
+            return b''
+
+        buf = bytearray(block_size)
+        buf_filled = 0
+
+        block = self._fps[self._cur_file_ndx].read(block_size)
+        buf[0:len(block)] = block
+        buf_filled += len(block)
+
+        while buf_filled < block_size:
+            self._cur_file_ndx += 1
+            if self._cur_file_ndx >= len(self._fps):
+                self.reset()
+
+            to_read = block_size - buf_filled
+            block = self._fps[self._cur_file_ndx].read(to_read)
+            blen = len(block)
+            buf[buf_filled: buf_filled + blen] = block
+            buf_filled += blen
+
+        dsize = self._hash.digest_size
+        cur_ndx = 0
+
+        while cur_ndx < block_size:
+            bleft = block_size - cur_ndx
+            if bleft >= dsize:
+                self._hash.update(buf[cur_ndx:cur_ndx+dsize])
+                buf[cur_ndx:cur_ndx+dsize] = self._hash.digest()
+                cur_ndx += dsize
+            else:
+                self._hash.update(buf[cur_ndx:])
+                buf[cur_ndx:] = self._hash.digest()[:bleft]
+                cur_ndx += bleft
+
+        return bytes(buf)
+
+
+def reference_muddle(sources, target, block_size=BLOCK_SIZE):
+    # Muddle_V1.muddle_file() as it was before it was streamed.
+    source_chain = ReferenceSourceChain(sources)
+    buf = bytearray(target)
+    buf_size = len(buf)
+    mbytes = max(buf_size, source_chain._key_size)
+    buf_ndx = 0
+
+    while mbytes > 0:
+        key_len = min(mbytes, block_size, buf_size - buf_ndx)
+        key_block = source_chain.read_block(key_len)
+        buf[buf_ndx:buf_ndx+key_len] = bytes(
+            a ^ b for a, b in zip(key_block, buf[buf_ndx:buf_ndx+key_len]))
+        buf_ndx = (buf_ndx + key_len) % buf_size
+        mbytes -= key_len
+
+    return bytes(buf)
+
+
+def muddle_bytes(source, input_fp, input_size=None, memory_budget=4096):
+    muddler = Muddle_V1(SourceChain([io.BytesIO(source)]),
+                        memory_budget=memory_budget)
+    return b''.join(bytes(c) for c in muddler.iter_muddle(input_fp,
+                                                          input_size))
+
+
+@pytest.mark.parametrize('target_size', [0, 1, 1024, SOURCE_SIZE - 1,
+                                         SOURCE_SIZE, SOURCE_SIZE + 1,
+                                         3 * SOURCE_SIZE])
+def test_sized_input_matches_unsized_input(target_size):
+    rng = random.Random(target_size)
+    source = random_bytes(rng, SOURCE_SIZE)
+    target = random_bytes(rng, target_size)
+
+    expected = muddle_bytes(source, UnsizedReader(target))
+
+    assert muddle_bytes(source, io.BytesIO(target)) == expected
+    assert muddle_bytes(source, UnsizedReader(target),
+                        target_size) == expected
+
+
+@pytest.mark.parametrize('target_size,spooled', [(SOURCE_SIZE - 1, True),
+                                                 (SOURCE_SIZE, False),
+                                                 (3 * SOURCE_SIZE, False)])
+def test_only_spools_targets_smaller_than_source(monkeypatch, target_size,
+                                                 spooled):
+    spools = []
+
+    def spooled_temporary_file(*args, **kwargs):
+        spools.append(args)
+        return io.BytesIO()
+
+    monkeypatch.setattr(muddler.v1, 'SpooledTemporaryFile',
+                        spooled_temporary_file)
+    rng = random.Random(target_size)
+    source = random_bytes(rng, SOURCE_SIZE)
+    target = random_bytes(rng, target_size)
+
+    muddle_bytes(source, io.BytesIO(target))
+
+    assert bool(spools) == spooled
+
+
+def test_sized_input_shorter_than_source():
+    rng = random.Random(0)
+    source = random_bytes(rng, SOURCE_SIZE)
+    target = random_bytes(rng, 100)
+
+    with pytest.raises(OSError):
+        muddle_bytes(source, UnsizedReader(target), SOURCE_SIZE)
+
+
+# Source sizes that aren't multiples of the 64 byte digest size or of
+# BLOCK_SIZE, with an empty source in the middle of the chain.
+SOURCE_SIZES = [[1], [100], [BLOCK_SIZE], [700, 0, 77, 1500]]
+
+
+@pytest.mark.parametrize('source_sizes', SOURCE_SIZES)
+@pytest.mark.parametrize('block_size', [1, 64, 100, BLOCK_SIZE])
+def test_key_stream_matches_read_block(source_sizes, block_size):
+    rng = random.Random(block_size)
+    sources = [random_bytes(rng, size) for size in source_sizes]
+    reference = ReferenceSourceChain(sources)
+    source_chain = SourceChain([io.BytesIO(s) for s in sources])
+
+    # Enough blocks to wrap around the sources several times.
+    key_len = 3 * sum(source_sizes) + block_size
+    expected = b''.join(reference.read_block(block_size)
+                        for _ in range(0, key_len, block_size))
+
+    buf = bytearray(len(expected))
+    source_chain.readinto(buf, block_size)
+    assert bytes(buf) == expected
+
+    source_chain.reset()
+    assert b''.join(source_chain.read_block(block_size)
+                    for _ in range(0, key_len, block_size)) == expected
+
+
+@pytest.mark.parametrize('source_sizes', SOURCE_SIZES)
+@pytest.mark.parametrize('target_size', [1, 99, BLOCK_SIZE + 1, 5000])
+def test_muddle_matches_reference(source_sizes, target_size):
+    rng = random.Random(target_size)
+    sources = [random_bytes(rng, size) for size in source_sizes]
+    target = random_bytes(rng, target_size)
+    muddler = Muddle_V1(SourceChain([io.BytesIO(s) for s in sources]),
+                        memory_budget=4096)
+    muddled = b''.join(bytes(c) for c in muddler.iter_muddle(
+        io.BytesIO(target)))
+
+    assert muddled == reference_muddle(sources, target)
@@ -0,0 +1,56 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import os
+import random
+
+import pytest
+
+from muddler.v2 import Muddle_V2
+from muddler.v2.key_stream import CounterKeyStream, SEGMENT_SIZE
+from tests.conftest import random_bytes
+
+
+def muddle_bytes(source, target, jobs):
+    muddler = Muddle_V2(CounterKeyStream([io.BytesIO(source)]),
+                        memory_budget=16 * SEGMENT_SIZE, jobs=jobs)
+    output_fp = io.BytesIO()
+    muddler.muddle_file(io.BytesIO(target), output_fp)
+    return output_fp.getvalue()
+
+
+@pytest.mark.parametrize('target_size', [0, 1, SEGMENT_SIZE + 1,
+                                         20 * SEGMENT_SIZE + 7])
+def test_parallel_matches_serial(monkeypatch, target_size):
+    # Worker processes are used even on single-core hosts.
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    rng = random.Random(target_size)
+    source = random_bytes(rng, 1000)
+    target = random_bytes(rng, target_size)
+
+    muddled = muddle_bytes(source, target, 1)
+
+    assert len(muddled) == target_size
+    assert muddle_bytes(source, target, 3) == muddled
+    assert muddle_bytes(source, muddled, 3) == target
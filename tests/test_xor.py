@@ -0,0 +1,122 @@
+# MIT License
+#
+# Copyright 2020-2022 New York University Abu Dhabi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import random
+
+import pytest
+
+from muddler import utils
+from muddler.utils import XOR_BACKENDS, xor_bytes, xor_into
+from tests.conftest import random_bytes
+
+
+LENGTHS = [0, 1, 7, 64, 1000]
+
+
+def reference_xor_bytes(bstr1, bstr2):
+    # xor_bytes() as it was before the XOR backends were added.
+    return bytes([_a ^ _b for _a, _b in zip(bstr1, bstr2)])
+
+
+@pytest.fixture(params=['int', 'numpy'])
+def backend(request):
+    if request.param not in XOR_BACKENDS:
+        pytest.skip('{} backend is not available'.format(request.param))
+
+    previous = utils.get_xor_backend()
+    utils.set_xor_backend(request.param)
+    yield request.param
+    utils.set_xor_backend(previous)
+
+
+@pytest.mark.parametrize('size', LENGTHS)
+def test_xor_bytes(backend, size):
+    rng = random.Random(size)
+    bstr1 = random_bytes(rng, size)
+    bstr2 = random_bytes(rng, size)
+
+    assert xor_bytes(bstr1, bstr2) == reference_xor_bytes(bstr1, bstr2)
+
+
+@pytest.mark.parametrize('size1,size2', [(0, 7), (1, 64), (64, 7),
+                                         (1000, 64), (7, 1000)])
+def test_xor_bytes_unequal_lengths(backend, size1, size2):
+    rng = random.Random(size1 * 1000 + size2)
+    bstr1 = random_bytes(rng, size1)
+    bstr2 = random_bytes(rng, size2)
+
+    assert xor_bytes(bstr1, bstr2) == reference_xor_bytes(bstr1, bstr2)
+
+
+@pytest.mark.parametrize('wrap1', [bytes, bytearray, memoryview])
+@pytest.mark.parametrize('wrap2', [bytes, bytearray, memoryview])
+def test_xor_bytes_buffer_types(backend, wrap1, wrap2):
+    rng = random.Random(0)
+    bstr1 = random_bytes(rng, 1000)
+    bstr2 = random_bytes(rng, 1000)
+
+    result = xor_bytes(wrap1(bstr1), wrap2(bstr2))
+
+    assert isinstance(result, bytes)
+    assert result == reference_xor_bytes(bstr1, bstr2)
+
+
+@pytest.mark.parametrize('size', LENGTHS)
+def test_xor_into(backend, size):
+    rng = random.Random(size)
+    target = random_bytes(rng, size)
+    source = random_bytes(rng, size)
+    buf = bytearray(target)
+
+    xor_into(buf, source)
+
+    assert bytes(buf) == reference_xor_bytes(target, source)
+
+
+@pytest.mark.parametrize('size1,size2', [(7, 0), (64, 1), (1000, 64),
+                                         (1000, 999)])
+def test_xor_into_shorter_source(backend, size1, size2):
+    # Only the first len(source) bytes of the target are changed.
+    rng = random.Random(size1 * 1000 + size2)
+    target = random_bytes(rng, size1)
+    source = random_bytes(rng, size2)
+    buf = bytearray(target)
+
+    xor_into(buf, source)
+
+    assert bytes(buf) == (reference_xor_bytes(target, source) +
+                          target[size2:])
+
+
+@pytest.mark.parametrize('wrap', [bytes, bytearray, memoryview])
+def test_xor_into_buffer_types(backend, wrap):
+    rng = random.Random(1)
+    target = random_bytes(rng, 1000)
+    source = random_bytes(rng, 1000)
+    buf = bytearray(target)
+
+    # Targets are written through memoryviews, like the chunk buffers of
+    # the muddling algorithms.
+    xor_into(memoryview(buf)[:1000], wrap(source))
+
+    assert bytes(buf) == reference_xor_bytes(target, source)